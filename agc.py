@@ -0,0 +1,175 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from definitions import AGC_GAIN_CACHE_FILE, AGC_FREQUENCY_BIN, ADC_FULL_SCALE, ADC_OFFSET
+from tools import bcolors
+
+
+class GainCache(object):
+    def __init__(self, path=AGC_GAIN_CACHE_FILE, bin_width=AGC_FREQUENCY_BIN, save_interval=60):
+        """
+        Converged AGC gain per frequency bin, kept in a JSON file so it
+        survives restarts.
+
+        Parameters:
+            path:           JSON file (None keeps the cache in memory only)
+            bin_width:      width (Hz) of the frequency bins gains are stored for
+            save_interval:  minimum seconds between writes by maybe_save(),
+                            to spare the SD card; save() writes immediately"""
+        self.path = path
+        self.bin_width = float(bin_width)
+        self.save_interval = save_interval
+        self.gains = {}
+        self.dirty = False
+        self._saved_at = 0.0
+        self.load()
+
+    def __len__(self):
+        return len(self.gains)
+
+    def key(self, frequency):
+        return int(round(float(frequency) / self.bin_width))
+
+    def get(self, frequency, default=None):
+        return self.gains.get(self.key(frequency), default)
+
+    def set(self, frequency, gain):
+        key = self.key(frequency)
+        if self.gains.get(key) != gain:
+            self.gains[key] = gain
+            self.dirty = True
+
+    def load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path) as fp:
+                stored = json.load(fp)
+        except (OSError, ValueError):
+            return
+        if stored.get('bin_width') != self.bin_width:
+            print(bcolors.WARNING + "AGC gain cache " + self.path + " uses another bin width, ignoring it" + bcolors.ENDC)
+            return
+        self.gains = dict((int(k), v) for k, v in stored.get('gains', {}).items())
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        # Write to a temporary file first so a power cut never leaves a truncated cache
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as fp:
+                json.dump({'bin_width': self.bin_width,
+                           'gains': dict((str(k), v) for k, v in sorted(self.gains.items()))}, fp)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(bcolors.WARNING + "Unable to save the AGC gain cache: " + str(e) + bcolors.ENDC)
+            return
+        self.dirty = False
+        self._saved_at = time.monotonic()
+
+    def maybe_save(self):
+        if self.dirty and time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+
+class AutoGain(object):
+    def __init__(self, cache=None, max_iterations=6, decimation=64, saturation=0.05, saturation_step=3, discard=0):
+        """
+        Closed-loop gain control around a receiver's captures.
+
+        Parameters:
+            cache:            GainCache the converged gains are kept in
+                              (default: an in-memory cache)
+            max_iterations:   captures taken at most per frequency
+            decimation:       power is estimated from every decimation-th
+                              sample of the first block only
+            saturation:       fraction of samples at the ADC rails above
+                              which the capture counts as clipped (noise at
+                              the target power already clips about 4.6%)
+            saturation_step:  dB the gain drops by at least after a clipped
+                              capture, whose power is underestimated
+            discard:          captures thrown away after a retune or gain
+                              change, for front ends still delivering data
+                              taken before it
+
+        capture() starts from the cached gain for the frequency (or the
+        requested gain on a miss), estimates the power of the capture and
+        lets the receiver's calcSuggestedGain() pick the next gain. It
+        recaptures only when the permissible gain step actually changes,
+        and stores the converged gain in the cache."""
+        if max_iterations < 1:
+            raise ValueError('max_iterations must be at least 1.')
+        self.cache = cache if cache is not None else GainCache(path=None)
+        self.max_iterations = int(max_iterations)
+        self.decimation = int(decimation)
+        self.saturation = saturation
+        self.saturation_step = saturation_step
+        self.discard = int(discard)
+        self._scale = ADC_FULL_SCALE / ADC_OFFSET
+
+        # Counters
+        self.captures = 0
+        self.recaptures = 0
+        self.cache_hits = 0
+        self.saturated = 0
+        self.unconverged = 0
+
+    def estimate_power(self, data):
+        """
+        (mean power in V^2, clipped) of a capture, from a decimated view of
+        its first block."""
+        block = data[0] if isinstance(data, list) else data
+        codes = np.frombuffer(block, dtype=np.uint8)[::self.decimation]
+        if codes.size == 0:
+            return 0.0, False
+        clipped = np.count_nonzero((codes == 0) | (codes == 255)) > self.saturation * codes.size
+        v = (codes.astype(np.float32) - ADC_OFFSET) * self._scale
+        return float(np.dot(v, v)) / codes.size, clipped
+
+    def capture(self, receiver, collect, frequency, gain):
+        """
+        Capture at frequency through collect() (a receiver _collect_sensor_data
+        method) with the gain settled by the loop. Returns the capture taken
+        at the final gain."""
+        cached = self.cache.get(frequency)
+        if cached is not None:
+            self.cache_hits += 1
+            gain = cached
+        receiver.frequency = frequency
+        receiver.gain = gain
+        reconfigured = receiver.frequency != receiver.last_frequency or receiver.gain != receiver.last_gain
+        discard = self.discard if reconfigured else 0
+        for iteration in range(self.max_iterations):
+            for _ in range(discard):
+                receiver.release(collect())
+            data = collect()
+            self.captures += 1
+            power, clipped = self.estimate_power(data)
+            receiver.calcSuggestedGain(max(power, 1e-12))
+            suggested = receiver.suggested_gain
+            if clipped:
+                self.saturated += 1
+                suggested = min(suggested, receiver.getPermissibleGain(receiver.gain - self.saturation_step))
+            if suggested == receiver.gain or iteration == self.max_iterations - 1:
+                break
+            receiver.release(data)
+            self.recaptures += 1
+            receiver.gain = suggested
+            discard = self.discard
+        if suggested != receiver.gain:
+            self.unconverged += 1
+        self.cache.set(frequency, suggested)
+        self.cache.maybe_save()
+        return data
+
+    def stats(self):
+        return {'captures': self.captures,
+                'recaptures': self.recaptures,
+                'cache_hits': self.cache_hits,
+                'saturated': self.saturated,
+                'unconverged': self.unconverged,
+                'cached_bins': len(self.cache)}
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+
+from definitions import BUFFER_SIZE
+
+# The Cython reader releases the GIL around read()/readv(); fall back to os.readv when it is not built
+try:
+    from cython_fastread.fastread import fast_readinto, fast_readv
+except ImportError:
+    fast_readinto = None
+    fast_readv = None
+
+
+class BufferPool(object):
+    def __init__(self, pool_size=4, buffer_size=BUFFER_SIZE, timeout=1.0, headroom=0):
+        """
+        Fixed set of preallocated capture buffers that are filled in place.
+
+        Parameters:
+            pool_size:     number of buffers kept in the pool
+            buffer_size:   size of every buffer in bytes
+            timeout:       seconds acquire() waits for a released buffer
+                           before giving up (None waits forever)
+            headroom:      bytes kept free in front of every buffer, so a
+                           frame header can be written there and header plus
+                           data sent as one buffer (see framed())
+
+        Buffers are bytearrays so np.frombuffer(view, dtype=np.uint8) gives a
+        writable NumPy view without copying. Consumers receive memoryviews
+        and hand them back with release() once they are done with the data."""
+
+        if pool_size < 1:
+            raise ValueError('pool_size must be at least 1.')
+        self.pool_size = int(pool_size)
+        self.buffer_size = int(buffer_size)
+        self.timeout = timeout
+        self.headroom = int(headroom)
+
+        self._buffers = [bytearray(self.headroom + self.buffer_size) for _ in range(self.pool_size)]
+        self._free = list(range(self.pool_size))
+        self._slot = dict((id(buf), i) for i, buf in enumerate(self._buffers))
+        self._cond = threading.Condition()
+
+        # Counters
+        self.acquired = 0
+        self.released = 0
+        self.waits = 0
+
+    def __len__(self):
+        return self.pool_size
+
+    @property
+    def available(self):
+        with self._cond:
+            return len(self._free)
+
+    def acquire(self, timeout=-1):
+        """Take a free buffer out of the pool and return it as a memoryview."""
+        if timeout == -1:
+            timeout = self.timeout
+        with self._cond:
+            if not self._free:
+                self.waits += 1
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while not self._free:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise RuntimeError("BufferPool exhausted: all %i buffers are still held by consumers"
+                                           % self.pool_size)
+                    self._cond.wait(remaining)
+            idx = self._free.pop()
+            self.acquired += 1
+        return memoryview(self._buffers[idx])[self.headroom:]
+
+    def owns(self, view):
+        """True if view was handed out by this pool."""
+        buf = view.obj if isinstance(view, memoryview) else view
+        idx = self._slot.get(id(buf))
+        return idx is not None and self._buffers[idx] is buf
+
+    def framed(self, view, header_size):
+        """
+        The header_size bytes of headroom in front of view plus view, as one
+        buffer: the pool's bytearray itself when that is exactly what it
+        holds, a memoryview otherwise. view must come from acquire()/read()."""
+        if header_size > self.headroom:
+            raise ValueError('pool headroom of %i bytes cannot hold %i.' % (self.headroom, header_size))
+        buf = view.obj
+        start = self.headroom - header_size
+        end = self.headroom + view.nbytes
+        if start == 0 and end == len(buf):
+            return buf
+        return memoryview(buf)[start:end]
+
+    def release(self, view):
+        """Return a buffer previously handed out by acquire() or read()."""
+        buf = view.obj if isinstance(view, memoryview) else view
+        idx = self._slot.get(id(buf))
+        if idx is None or self._buffers[idx] is not buf:
+            raise ValueError('buffer does not belong to this pool.')
+        with self._cond:
+            if idx in self._free:
+                raise ValueError('buffer released twice.')
+            self._free.append(idx)
+            self.released += 1
+            self._cond.notify()
+
+    def read(self, fd, count=None):
+        """
+        Fill a pooled buffer from fd and return a memoryview of the bytes read,
+        or None if the descriptor returned no data."""
+        view = self.acquire()
+        try:
+            n = readinto(fd, view if count is None else view[:count])
+        except BaseException:
+            self.release(view)
+            raise
+        if n <= 0:
+            self.release(view)
+            return None
+        if n != len(view):
+            return view[:n]
+        return view
+
+    def read_many(self, fd, n_buffers):
+        """
+        Fill n_buffers pooled buffers with a single batched readv and return
+        the list of memoryviews that received data."""
+        views = []
+        try:
+            for _ in range(n_buffers):
+                views.append(self.acquire())
+            if fast_readv is not None:
+                n = fast_readv(fd, views)
+            else:
+                n = 0
+                for view in views:
+                    got = readinto(fd, view)
+                    n += got
+                    if got < len(view):
+                        break
+        except BaseException:
+            for view in views:
+                self.release(view)
+            raise
+
+        filled = []
+        for view in views:
+            if n >= len(view):
+                filled.append(view)
+                n -= len(view)
+            elif n > 0:
+                filled.append(view[:n])
+                n = 0
+            else:
+                self.release(view)
+        return filled
+
+
+def readinto(fd, view):
+    """
+    Read from fd into the writable buffer view until it is full or the
+    descriptor reports end of data. Returns the number of bytes read."""
+    if fast_readinto is not None:
+        return fast_readinto(fd, view)
+    view = memoryview(view).cast('B')
+    total = 0
+    size = len(view)
+    while total < size:
+        n = os.readv(fd, [view[total:]])
+        if n == 0:
+            break
+        total += n
+    return total
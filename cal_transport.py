@@ -0,0 +1,250 @@
+"""
+Calibration table transfer between the host and the MSP calibration memory.
+
+The table travels in a versioned binary container:
+
+    offset  size  field
+    0       4     magic b'RHCL'
+    4       1     format version (CAL_FORMAT_VERSION)
+    5       1     flags (bit 0: payload is zlib compressed)
+    6       2     reserved, 0
+    8       4     payload length in bytes
+    12      4     CRC-32 of the payload
+    16      n     payload: the table as compact JSON with sorted keys
+
+All fields are big endian. Sorted keys make the CRC a hash of the table
+contents, which lets a write be skipped when the MSP already holds it.
+Tables written by older software as plain zero-terminated JSON are still
+read.
+
+SPI traffic is batched: many 13-byte MSP frames (control byte + 12 data
+bytes) go out in one xfer2 call, up to the spidev buffer size.
+"""
+import json
+import math
+import struct
+import zlib
+
+import numpy as np
+
+from definitions import PLL_LOCK_REG
+
+try:
+    from Adafruit_BBIO.SPI import SPI
+except ImportError:
+    SPI = None
+
+CAL_MAGIC = b'RHCL'
+CAL_FORMAT_VERSION = 1
+CAL_FLAG_ZLIB = 0x01
+CAL_HEADER = struct.Struct('>4sBBHII')
+
+CAL_CAPACITY = 12000        # bytes of MSP calibration memory
+CAL_WRITE_CTRL = 0x20
+CAL_READ_CTRL = 0x40
+PLL_READ_CTRL = 0x08
+PLL_READ_BIT = 0x80         # byte 1 of a PLL frame: read flag, then the register address (see readPLLReg)
+FRAME_SIZE = 13
+FRAME_DATA = FRAME_SIZE - 1
+SPI_MAX_TRANSFER = 4096     # spidev default bufsiz
+
+
+class CalibrationFormatError(ValueError):
+    pass
+
+
+def encode_table(table, compress=True):
+    """Binary container (bytes) for the calibration table dict."""
+    payload = json.dumps(table, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, 9)
+        flags |= CAL_FLAG_ZLIB
+    return CAL_HEADER.pack(CAL_MAGIC, CAL_FORMAT_VERSION, flags, 0, len(payload), zlib.crc32(payload)) + payload
+
+
+def parse_header(data):
+    """(version, flags, length, crc) of a container header, None if data does not start with one."""
+    if len(data) < CAL_HEADER.size:
+        return None
+    magic, version, flags, _, length, crc = CAL_HEADER.unpack_from(bytes(data[:CAL_HEADER.size]))
+    if magic != CAL_MAGIC:
+        return None
+    return version, flags, length, crc
+
+
+def decode_table(data):
+    """
+    Calibration table from container bytes, or from legacy zero-terminated
+    JSON. Returns None for blank (all-zero) memory."""
+    header = parse_header(data)
+    if header is None:
+        data = bytes(data)
+        end = data.find(b'\x00')
+        if end == 0 or not data.strip(b'\x00\xff'):
+            return None
+        text = data[:end] if end > 0 else data
+        try:
+            return json.loads(text.decode('utf-8'))
+        except ValueError as e:
+            raise CalibrationFormatError("calibration data is neither a container nor JSON: " + str(e))
+
+    version, flags, length, crc = header
+    if version > CAL_FORMAT_VERSION:
+        raise CalibrationFormatError("calibration format version %i is newer than supported (%i)"
+                                     % (version, CAL_FORMAT_VERSION))
+    payload = bytes(data[CAL_HEADER.size:CAL_HEADER.size + length])
+    if len(payload) != length:
+        raise CalibrationFormatError("calibration payload truncated: %i of %i bytes" % (len(payload), length))
+    if zlib.crc32(payload) != crc:
+        raise CalibrationFormatError("calibration payload CRC mismatch")
+    if flags & CAL_FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return json.loads(payload.decode('utf-8'))
+
+
+def open_msp_spi():
+    # For Adafruit_BBIO v1.1.1 to use spidev1.0, use SPI(1,0). If using Adafruit_BBIO v1.0.3, change to SPI(0,0).
+    if SPI is None:
+        raise RuntimeError("Adafruit_BBIO.SPI is not available")
+    spi = SPI(1, 0)
+    spi.cshigh = True
+    spi.lsbfirst = False
+    spi.bpw = 8
+    spi.mode = 0b01
+    spi.threewire = False
+    spi.msh = int(125000)
+    return spi
+
+
+class CalibrationTransport(object):
+    def __init__(self, spi=None, capacity=CAL_CAPACITY, max_transfer=SPI_MAX_TRANSFER):
+        """
+        Reads and writes the MSP calibration memory.
+
+        Parameters:
+            spi:           object with xfer2() connected to the MSP; None
+                           opens SPI(1,0)
+            capacity:      size of the calibration memory in bytes
+            max_transfer:  largest xfer2 call in bytes; frames are batched
+                           up to this size
+
+        The MSP returns read data one frame late, so the first frame of a
+        read session carries nothing. A session lasts as long as the same
+        control byte keeps coming, including across xfer2 calls; every
+        session here starts with a frame under another control byte, so it
+        always begins at the start of the memory. That frame is a read of
+        PLL register PLL_LOCK_REG, built exactly like
+        mspCommandBeagle("readPLLReg"): bit 7 of byte 1 set and the rest
+        filled with ones, so the PLL is never written."""
+        self.spi = spi if spi is not None else open_msp_spi()
+        self.capacity = int(capacity)
+        self.frames_per_transfer = max(1, int(max_transfer) // FRAME_SIZE)
+        self._break_frame = [PLL_READ_CTRL, PLL_READ_BIT | (PLL_LOCK_REG << 1)] + [0xFF] * (FRAME_DATA - 1)
+        # Read frames never change, so one template serves every batch
+        self._read_frames = [CAL_READ_CTRL] + [0x00] * FRAME_DATA
+        self._read_frames = self._read_frames * self.frames_per_transfer
+
+        # Counters
+        self.transfers = 0
+        self.frames = 0
+        self.skipped_writes = 0
+
+    def read_header(self):
+        """(version, flags, length, crc) of the table on the MSP, None if it holds no container."""
+        return parse_header(self._reader().read(CAL_HEADER.size))
+
+    def read_table(self):
+        """Calibration table held by the MSP, None if the memory is blank."""
+        reader = self._reader()
+        head = reader.read(CAL_HEADER.size)
+        header = parse_header(head)
+        if header is not None:
+            length = header[2]
+            if CAL_HEADER.size + length > self.capacity:
+                raise CalibrationFormatError("calibration payload length %i exceeds the MSP memory" % length)
+            return decode_table(head + reader.read(length))
+        # Legacy JSON: read until the terminating zero
+        data = bytearray(head)
+        while b'\x00' not in data and len(data) < self.capacity:
+            data += reader.read(min(self.frames_per_transfer * FRAME_DATA, self.capacity - len(data)))
+        return decode_table(data)
+
+    def write_table(self, table, force=False):
+        """
+        Write the table to the MSP unless it already holds the same one
+        (same CRC and length). Returns True if it was written."""
+        data = encode_table(table)
+        if len(data) > self.capacity:
+            raise CalibrationFormatError("encoded calibration table of %i bytes exceeds the %i byte MSP memory"
+                                         % (len(data), self.capacity))
+        if not force:
+            header = self.read_header()
+            new_header = parse_header(data)
+            if header is not None and header[1:] == new_header[1:]:
+                self.skipped_writes += 1
+                return False
+        self.write(data)
+        return True
+
+    def write(self, data):
+        """Write raw bytes from the start of the calibration memory, zero-padding the last frame."""
+        n_frames = int(math.ceil(len(data) / float(FRAME_DATA)))
+        payload = np.zeros(n_frames * FRAME_DATA, dtype=np.uint8)
+        payload[:len(data)] = np.frombuffer(bytes(data), dtype=np.uint8)
+        frames = np.empty((n_frames, FRAME_SIZE), dtype=np.uint8)
+        frames[:, 0] = CAL_WRITE_CTRL
+        frames[:, 1:] = payload.reshape(n_frames, FRAME_DATA)
+        self._new_session()
+        for start in range(0, n_frames, self.frames_per_transfer):
+            batch = frames[start:start + self.frames_per_transfer]
+            self.spi.xfer2(batch.reshape(-1).tolist())
+            self.transfers += 1
+            self.frames += len(batch)
+
+    def stats(self):
+        return {'transfers': self.transfers,
+                'frames': self.frames,
+                'skipped_writes': self.skipped_writes}
+
+    def _reader(self):
+        self._new_session()
+        return _ReadSession(self)
+
+    def _new_session(self):
+        self.spi.xfer2(self._break_frame)
+        self.transfers += 1
+        self.frames += 1
+
+
+class _ReadSession(object):
+    # One read session: data streams from the start of the calibration memory
+    def __init__(self, transport):
+        self.transport = transport
+        self.buffer = bytearray(transport.capacity + transport.frames_per_transfer * FRAME_DATA)
+        self.filled = 0
+        self.consumed = 0
+        self.blank = True
+
+    def read(self, n_bytes):
+        end = min(self.consumed + n_bytes, self.transport.capacity)
+        while self.filled < end:
+            self._fetch(int(math.ceil((end - self.filled) / float(FRAME_DATA))))
+        data = bytes(self.buffer[self.consumed:end])
+        self.consumed = end
+        return data
+
+    def _fetch(self, n_frames):
+        transport = self.transport
+        n_frames = min(n_frames + self.blank, transport.frames_per_transfer)
+        rbuf = transport.spi.xfer2(transport._read_frames[:n_frames * FRAME_SIZE])
+        transport.transfers += 1
+        transport.frames += n_frames
+        data = np.asarray(rbuf, dtype=np.uint8).reshape(n_frames, FRAME_SIZE)[:, 1:]
+        if self.blank:
+            # The first frame of a session only primes the MSP
+            data = data[1:]
+            self.blank = False
+        data = data.reshape(-1)
+        self.buffer[self.filled:self.filled + len(data)] = data.tobytes()
+        self.filled += len(data)
@@ -0,0 +1,173 @@
+import collections
+import os
+
+import numpy as np
+
+from definitions import calFileCache, calTableMinFreq, calTableMaxFreq, IFAMPGAINV3
+from tools import load_calibration_data
+
+# Calibration table keys. 'gain' is the front end gain (dB) at each of the
+# table's 'frequencies' (MHz) on top of findActualGain(): one list for all
+# VGA settings, or a mapping of VGA gain setting -> list.
+CAL_KEY_FREQUENCIES = 'frequencies'
+CAL_KEY_GAIN = 'gain'
+CAL_KEY_BOARD_ID = 'board_id'
+CAL_KEY_MSP_VERSION = 'msp_version'
+
+# MSP versions reported when no RadioHound board answers, see tools.validate()
+INVALID_MSP_VERSIONS = (None, '', '0', '201', '255')
+
+V3_VGA_GAINS = np.arange(-5, 41, 3)
+
+
+class CalibrationError(ValueError):
+    pass
+
+
+def actual_gain(vga_gain, if_gain=IFAMPGAINV3):
+    """Total gain (dB) of the V3 gain chain for a VGA gain setting."""
+    vga_gain_set = int((vga_gain + 5) / 3) * 3 - 5
+    return vga_gain_set + if_gain
+
+
+class Calibration(object):
+    def __init__(self, table, resolution=1.0, min_freq=calTableMinFreq, max_freq=calTableMaxFreq,
+                 gains=V3_VGA_GAINS, if_gain=IFAMPGAINV3, cache_size=64):
+        """
+        Calibration table turned into a dense correction grid for spectra.
+
+        Parameters:
+            table:       calibration table dict, as read from the MSP
+            resolution:  grid spacing (MHz)
+            min_freq, max_freq: grid span (MHz); frequencies outside are
+                         corrected with the nearest edge
+            gains:       VGA gain settings (dB) the grid has a row for
+            if_gain:     fixed IF amp gain (dB), part of actual_gain()
+            cache_size:  correction vectors kept per (gain, frequency axis)
+
+        Every grid cell holds the linear factor 10^(-G/10) that refers a
+        measured PSD back to the antenna, G being the table gain
+        interpolated to the cell (linearly in frequency, then between the
+        table's VGA settings) plus actual_gain() of the row's setting.
+        apply() gathers the factors for a frequency axis once and keeps
+        them, so calibrating a repeated sweep is one array multiply."""
+
+        self.table = table
+        self.resolution = float(resolution)
+        self.min_freq = float(min_freq)
+        self.max_freq = float(max_freq)
+        self.gains = np.asarray(gains)
+        self.if_gain = if_gain
+        self.cache_size = cache_size
+        self._factors = collections.OrderedDict()
+
+        self.frequencies = self.min_freq + self.resolution * np.arange(
+            int(round((self.max_freq - self.min_freq) / self.resolution)) + 1)
+        table_gain = self._table_gain(table)
+        self.grid = np.empty((len(self.gains), len(self.frequencies)))
+        for row, vga_gain in enumerate(self.gains):
+            self.grid[row] = table_gain(vga_gain) + actual_gain(vga_gain, if_gain)
+        np.power(10.0, -self.grid / 10.0, out=self.grid)
+        self.grid.flags.writeable = False
+
+    def validate(self, msp_version=None, board_id=None):
+        """
+        Raise CalibrationError unless the table belongs to the attached
+        board. None skips a check."""
+        if msp_version is not None:
+            if str(msp_version) in INVALID_MSP_VERSIONS:
+                raise CalibrationError('no RadioHound board detected (MSP version %s)' % msp_version)
+            table_version = self.table.get(CAL_KEY_MSP_VERSION)
+            if table_version is not None and str(table_version) != str(msp_version):
+                raise CalibrationError('calibration table is for MSP version %s, board runs %s'
+                                       % (table_version, msp_version))
+        if board_id is not None and self.table.get(CAL_KEY_BOARD_ID) != board_id:
+            raise CalibrationError('calibration table is for board %s, not %s'
+                                   % (self.table.get(CAL_KEY_BOARD_ID), board_id))
+        return self
+
+    def factors(self, freqs, gain):
+        """Correction factors (read-only) for the frequencies (Hz) at the VGA gain setting."""
+        freqs = np.asarray(freqs, dtype=np.float64)
+        row = int(np.abs(self.gains - gain).argmin())
+        key = (row, freqs.shape, freqs.tobytes())
+        factors = self._factors.get(key)
+        if factors is not None:
+            self._factors.move_to_end(key)
+            return factors
+        col = np.rint((freqs / 1e6 - self.min_freq) / self.resolution).astype(np.intp)
+        np.clip(col, 0, len(self.frequencies) - 1, out=col)
+        factors = self.grid[row].take(col)
+        factors.flags.writeable = False
+        self._factors[key] = factors
+        if len(self._factors) > self.cache_size:
+            self._factors.popitem(last=False)
+        return factors
+
+    def apply(self, psd, freqs, gain, out=None):
+        """
+        PSD referred to the antenna: psd (at frequencies freqs in Hz,
+        captured at VGA gain setting gain) times the correction factors,
+        written to out when given (out=psd calibrates in place)."""
+        return np.multiply(psd, self.factors(freqs, gain), out=out)
+
+    def _table_gain(self, table):
+        # Function of the VGA setting returning the table gain (dB) over the grid frequencies
+        try:
+            freqs = np.asarray(table[CAL_KEY_FREQUENCIES], dtype=np.float64)
+            gain = table[CAL_KEY_GAIN]
+        except KeyError as e:
+            raise CalibrationError('calibration table has no %s' % e)
+        order = np.argsort(freqs)
+        freqs = freqs[order]
+
+        def curve(values):
+            values = np.asarray(values, dtype=np.float64)
+            if values.shape != freqs.shape:
+                raise CalibrationError('calibration table lists %i gains for %i frequencies'
+                                       % (values.size, freqs.size))
+            return np.interp(self.frequencies, freqs, values[order])
+
+        if not isinstance(gain, dict):
+            flat = curve(gain)
+            return lambda vga_gain: flat
+
+        settings = np.array(sorted(float(k) for k in gain))
+        if len(settings) == 0:
+            raise CalibrationError('calibration table has no gain settings')
+        by_setting = dict((float(k), v) for k, v in gain.items())
+        curves = np.array([curve(by_setting[s]) for s in settings])
+
+        def between_settings(vga_gain):
+            # Linear in dB between the two nearest table settings, clamped at the ends
+            if vga_gain <= settings[0] or len(settings) == 1:
+                return curves[0]
+            if vga_gain >= settings[-1]:
+                return curves[-1]
+            j = int(np.searchsorted(settings, vga_gain)) - 1
+            w = (vga_gain - settings[j]) / (settings[j + 1] - settings[j])
+            return (1.0 - w) * curves[j] + w * curves[j + 1]
+        return between_settings
+
+
+_loaded = {}
+
+
+def load(path=calFileCache, msp_version=None, board_id=None, **kwargs):
+    """
+    Calibration for the table file at path, validated against the attached
+    board (see Calibration.validate). The grid is built once per file
+    version and reused until the file changes; kwargs go to Calibration."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        raise CalibrationError('no calibration table at ' + path)
+    key = (path, repr(sorted(kwargs.items())))
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _loaded.get(key)
+    if cached is None or cached[0] != stamp:
+        table = load_calibration_data(path)
+        if table is None:
+            raise CalibrationError('no calibration table at ' + path)
+        cached = _loaded[key] = (stamp, Calibration(table, **kwargs))
+    return cached[1].validate(msp_version, board_id)
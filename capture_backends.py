@@ -0,0 +1,293 @@
+import json
+import mmap
+import os
+import select
+
+from definitions import *
+from tools import bcolors
+from buffer_pool import BufferPool
+from validity import BlockValidator
+
+try:
+    from cython_fastread.fastread import fast_read
+except ImportError:
+    fast_read = None
+
+
+# Template for a capture backend: how raw ADC data gets from /dev/beaglelogic into Python
+class CaptureBackend(object):
+    name = None
+
+    def __init__(self, dev_path=BEAGLELOGIC_DEV, buffer_size=BUFFER_SIZE, validator=None):
+        """
+        Backend parameters:
+            dev_path:      beaglelogic character device
+            buffer_size:   bytes returned by one read() (the whole ring for mmap)
+            validator:     validity.BlockValidator used to reject all-zero data"""
+        self.dev_path = dev_path
+        self.buffer_size = int(buffer_size)
+        self.validator = validator if validator is not None else BlockValidator()
+        self.dev = None
+
+    def open(self):
+        if self.dev is None:
+            try:
+                self.dev = os.open(self.dev_path, os.O_RDONLY)
+            except OSError:
+                print(bcolors.WARNING + "Device " + self.dev_path + " cannot be opened" + bcolors.ENDC)
+                self.dev = None
+        return self.dev is not None
+
+    def read(self):
+        # Implemented by each backend: return one capture (bytes, a pooled memoryview, or a list of
+        # blocks for mmap), or None if the device delivered no valid data. The template has no data source.
+        pass
+
+    def release(self, data):
+        # Return a capture obtained from read() once the consumer is done with it
+        pass
+
+    def close(self):
+        if self.dev is not None:
+            os.close(self.dev)
+            self.dev = None
+
+
+class OsReadBackend(CaptureBackend):
+    """One os.read per capture; every capture is a new bytes object."""
+    name = 'os_read'
+
+    def read(self):
+        if not self.open():
+            return None
+        buf = os.read(self.dev, self.buffer_size)
+        if not self.validator.check(buf):
+            return None
+        return buf
+
+
+class FastReadBackend(OsReadBackend):
+    """cython_fastread.fast_read: uninitialized bytes filled with the GIL released."""
+    name = 'fast_read'
+
+    def read(self):
+        if not self.open():
+            return None
+        buf = fast_read(self.dev, self.buffer_size)
+        if not self.validator.check(buf):
+            return None
+        return buf
+
+
+class PoolBackend(CaptureBackend):
+    """readinto a recycled set of preallocated buffers; captures are memoryviews."""
+    name = 'pool'
+
+    def __init__(self, dev_path=BEAGLELOGIC_DEV, buffer_size=BUFFER_SIZE, validator=None,
+                 pool_size=BUFFER_POOL_SIZE):
+        CaptureBackend.__init__(self, dev_path, buffer_size, validator)
+        # Headroom lets framing.FrameWriter put the frame header in front of a capture without copying it
+        self.pool = BufferPool(pool_size, self.buffer_size, headroom=FRAME_HEADROOM)
+
+    def read(self):
+        if not self.open():
+            return None
+        buf = self.pool.read(self.dev)
+        if buf is None:
+            return None
+        if not self.validator.check(buf):
+            self.pool.release(buf)
+            return None
+        return buf
+
+    def release(self, data):
+        if isinstance(data, memoryview):
+            self.pool.release(data)
+
+
+class MmapRingBackend(CaptureBackend):
+    """
+    Maps the driver's whole ring and returns, per read(), the list of blocks the
+    PRU filled since the previous call. Sequence numbers of those blocks are
+    left in last_block_seqs; gaps between calls mean blocks were lost. The
+    driver does not say how far the PRU got, so an overrun moves the sequence
+    on by one ring, the least it can have lost."""
+    name = 'mmap'
+
+    def __init__(self, dev_path=BEAGLELOGIC_DEV, buffer_size=RING_BUFFER_SIZE, validator=None,
+                 block_size=BLOCK_SIZE, sysfs_path=BEAGLELOGIC_SYSFS):
+        CaptureBackend.__init__(self, dev_path, buffer_size, validator)
+        self.block_size = int(block_size)
+        self.sysfs_path = sysfs_path
+        self.mm = None
+
+        # Ring buffer cursor: sequence number of the next block the PRU will fill.
+        # Block index in the mapping is seq % total_blocks.
+        self._next_seq = 0
+        self.last_block_seqs = []   # sequence numbers of the blocks returned by the last read()
+        self.overruns = 0           # times the PRU lapped the consumer
+        self.block_timeout = 1.0    # seconds to wait for the first new block
+        self._capture_started = False
+        self._last_error = 0
+        self._poller = None
+
+    @property
+    def total_blocks(self):
+        return self.buffer_size // self.block_size
+
+    def open(self):
+        # mmap 需要以读写方式打开，映射大小必须与 buffer_size 一致
+        if self.mm is None:
+            try:
+                self.dev = os.open(self.dev_path, os.O_RDWR)
+                self.mm = mmap.mmap(self.dev, self.buffer_size, mmap.MAP_SHARED, mmap.PROT_READ)
+            except Exception as e:
+                print(bcolors.WARNING + "Device " + self.dev_path + " cannot be opened or mapped: " + str(e) + bcolors.ENDC)
+                if self.dev is not None:
+                    os.close(self.dev)
+                self.dev = None
+                self.mm = None
+                return False
+        return True
+
+    def read(self):
+        new_blocks = self.readNewBlocks()
+        self.last_block_seqs = [seq for seq, _ in new_blocks]
+        if not new_blocks:
+            return None
+        return [block for _, block in new_blocks]
+
+    def readAdcBlock(self, block_index):
+        if not self.open():
+            return None
+        try:
+            # 保证 block_index 在合理范围内（环形缓冲区）
+            offset = (block_index % self.total_blocks) * self.block_size
+            # 检查数据是否有效（全0认为无效），直接在映射上检查，无效块不再拷贝
+            with memoryview(self.mm)[offset:offset + self.block_size] as view:
+                valid = self.validator.check(view)
+            if not valid:
+                return None
+            self.mm.seek(offset)
+            return self.mm.read(self.block_size)
+        except Exception as e:
+            print("mmap read error:", e)
+            return None
+
+    def readNewBlocks(self):
+        # Returns [(seq, block), ...] for every block filled since the previous call
+        if not self.open():
+            return []
+        if not self._capture_started:
+            self.startContinuousCapture()
+
+        total_blocks = self.total_blocks
+        new_blocks = []
+        consumed = 0
+        while consumed < total_blocks:
+            # Block for the first new buffer, then drain whatever else is ready without waiting
+            if not self._blockReady(self.block_timeout if not consumed else 0):
+                break
+            consumed += 1
+            seq = self._next_seq
+            block = self.readAdcBlock(seq)
+            # Hand the buffer back to the driver and move its read cursor to the next unit
+            try:
+                os.lseek(self.dev, self.block_size, os.SEEK_CUR)
+            except OSError:
+                pass
+            self._next_seq += 1
+            if block is None:
+                print("Block {} read failed.".format(seq % total_blocks))
+                continue
+            new_blocks.append((seq, block))
+
+        if self._checkOverrun(consumed >= total_blocks):
+            self.overruns += 1
+            print(bcolors.WARNING + "Ring buffer overrun: consumer fell a full ring behind the PRU "
+                  "(block seq {})".format(self._next_seq) + bcolors.ENDC)
+            # The blocks just read were refilled at least one lap after the cursor expected
+            self._next_seq += total_blocks
+            new_blocks = [(seq + total_blocks, block) for seq, block in new_blocks]
+        return new_blocks
+
+    def startContinuousCapture(self):
+        # Start the PRU filling the ring; a read() on the device would otherwise be needed to kick it off
+        try:
+            with open(self.sysfs_path + "state") as fp:
+                state = fp.read().strip()
+            if state in ("0", "0x0", ""):
+                with open(self.sysfs_path + "state", "w") as fp:
+                    fp.write("1")
+        except OSError as e:
+            print("Unable to start beaglelogic capture through sysfs:", e)
+        self._capture_started = True
+
+    def _blockReady(self, timeout):
+        # poll() on the beaglelogic fd reports POLLIN once the unit under the read cursor is filled
+        if self._poller is None:
+            self._poller = select.poll()
+            self._poller.register(self.dev, select.POLLIN | select.POLLERR)
+        try:
+            events = self._poller.poll(int(timeout * 1000))
+        except InterruptedError:
+            return False
+        for _, mask in events:
+            if mask & select.POLLERR:
+                print("beaglelogic reported a capture error while polling")
+                return False
+            if mask & select.POLLIN:
+                return True
+        return False
+
+    def _checkOverrun(self, lapped):
+        # The driver latches errors in sysfs lasterror; a change since the last check means lost data
+        try:
+            with open(self.sysfs_path + "lasterror") as fp:
+                last_error = int(fp.read().strip(), 0)
+        except (OSError, ValueError):
+            return lapped
+        changed = last_error != 0 and last_error != self._last_error
+        self._last_error = last_error
+        return lapped or changed
+
+    def close(self):
+        if self._poller is not None:
+            self._poller.unregister(self.dev)
+            self._poller = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        CaptureBackend.close(self)
+
+
+BACKENDS = dict((cls.name, cls) for cls in (OsReadBackend, FastReadBackend, PoolBackend, MmapRingBackend))
+
+
+def configured_backend(default=DEFAULT_CAPTURE_BACKEND, config_file=LOCAL_CONFIG_FILE):
+    # Backend named under key_capture_backend in the local config file, so it can change without a redeploy
+    try:
+        with open(config_file) as fp:
+            return json.load(fp).get(key_capture_backend, default)
+    except (OSError, ValueError, AttributeError):
+        return default
+
+
+def make_backend(name=None, **kwargs):
+    """
+    Build the capture backend called name (one of BACKENDS); None picks the one
+    from the local config file. Keyword arguments the backend does not take
+    (pool_size, block_size, ...) are ignored."""
+    if name is None:
+        name = configured_backend()
+    if name not in BACKENDS:
+        raise ValueError('capture backend must be one of %s.' % ", ".join(sorted(BACKENDS)))
+    if name == 'fast_read' and fast_read is None:
+        print(bcolors.WARNING + "cython_fastread is not built, falling back to the os_read capture backend" + bcolors.ENDC)
+        name = 'os_read'
+
+    cls = BACKENDS[name]
+    if kwargs.get('buffer_size') is None:
+        kwargs['buffer_size'] = RING_BUFFER_SIZE if cls is MmapRingBackend else BUFFER_SIZE
+    accepted = cls.__init__.__code__.co_varnames[1:cls.__init__.__code__.co_argcount]
+    return cls(**dict((k, v) for k, v in kwargs.items() if k in accepted))
@@ -0,0 +1,236 @@
+import queue
+import threading
+import time
+
+from tools import bcolors
+
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+
+class RingIndex(object):
+    def __init__(self, sensor):
+        """
+        Ring sequence numbers of the blocks sensor.stream() yields, for the
+        mmap backend: stream() yields the blocks of each read in order, and
+        every read leaves a new last_block_seqs list. Call next() once per
+        block streamed."""
+        self.sensor = sensor
+        self._seqs = None       # last_block_seqs list being walked
+        self._pos = 0
+
+    def next(self):
+        # Ring sequence number of the block just streamed, None off the mmap backend
+        seqs = getattr(self.sensor, 'last_block_seqs', None)
+        if not seqs:
+            return None
+        if seqs is not self._seqs:
+            self._seqs, self._pos = seqs, 0
+        if self._pos >= len(seqs):
+            return None
+        index = seqs[self._pos]
+        self._pos += 1
+        return index
+
+
+class CaptureEngine(object):
+    def __init__(self, sensor, center_frequency, gain=1, queue_depth=4, overflow='block', stream=False):
+        """
+        Reads the ADC on a dedicated thread and hands blocks to consumers
+        through a bounded queue, so publishing stalls do not stop the device
+        from being drained.
+
+        Parameters:
+            sensor:            receiver providing raw() and release()
+            center_frequency:  center frequency passed to raw()
+            gain:              gain passed to raw()
+            queue_depth:       number of captured blocks held for consumers
+            overflow:          what to do when the queue is full:
+                               'block'       wait for the consumer (no loss)
+                               'drop-oldest' discard the oldest queued block
+                               'drop-newest' discard the block just read
+            stream:            read through sensor.stream(), keeping the
+                               receiver locked and tuned for the engine's
+                               lifetime instead of one raw() per block
+
+        The reader always fills one buffer while the consumer works on
+        another. With a pooled sensor the pool needs at least queue_depth + 2
+        buffers so the reader is never starved by the blocks held in the
+        queue and by the consumer. Items are (sequence, block, block_index)
+        tuples; gaps in the sequence numbers are blocks that were dropped.
+        block_index is the ring sequence number of the block with the mmap
+        backend, whose gaps also show blocks the ring lost before the
+        engine read them, and None with other backends."""
+
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of %s.' % ", ".join(OVERFLOW_POLICIES))
+        if queue_depth < 1:
+            raise ValueError('queue_depth must be at least 1.')
+
+        self.sensor = sensor
+        self.center_frequency = center_frequency
+        self.gain = gain
+        self.queue_depth = int(queue_depth)
+        self.overflow = overflow
+        self.stream = stream
+
+        pool = getattr(sensor, 'pool', None)
+        if pool is not None and len(pool) < self.queue_depth + 2:
+            print(bcolors.WARNING + "Buffer pool of %i is smaller than queue_depth + 2, " % len(pool) + \
+            "the capture thread will stall on the consumer" + bcolors.ENDC)
+
+        self._queue = queue.Queue(maxsize=self.queue_depth)
+        self._stop = threading.Event()
+        self._thread = None
+        self._ring = RingIndex(sensor)
+
+        # Counters
+        self.captured = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __iter__(self):
+        while True:
+            item = self.get()
+            if item is None:
+                return
+            yield item
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="capture-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the reader thread and release any blocks still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self.sensor.release(item[1])
+
+    def get(self, timeout=None):
+        """
+        Return the next (sequence, block, block_index) tuple, waiting up to timeout
+        seconds. Returns None once the engine is stopped and drained, or
+        when the timeout expires."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = 0.1
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return None
+            try:
+                return self._queue.get(timeout=wait)
+            except queue.Empty:
+                if not self.running and self._queue.empty():
+                    return None
+
+    def release(self, block):
+        self.sensor.release(block)
+
+    def stats(self):
+        return {'captured': self.captured,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'depth': self.depth,
+                'max_depth': self.max_depth}
+
+    def _run(self):
+        if self.stream:
+            self._run_stream()
+            return
+        seq = 0
+        while not self._stop.is_set():
+            try:
+                data = self.sensor.raw(self.center_frequency, self.gain)
+            except Exception as err:
+                print("**** CAPTURE ENGINE READ FAILED **** " + str(err))
+                data = None
+            if data is None:
+                self.errors += 1
+                # Back off so a missing device does not spin the core
+                self._stop.wait(0.01)
+                continue
+
+            # The mmap receiver returns a list of blocks per raw() call
+            if isinstance(data, list):
+                blocks, indices = data, self.sensor.last_block_seqs
+            else:
+                blocks, indices = [data], [None]
+            for block, index in zip(blocks, indices):
+                self.captured += 1
+                self._put((seq, block, index))
+                seq += 1
+
+    def _run_stream(self):
+        seq = 0
+        while not self._stop.is_set():
+            try:
+                with self.sensor.stream(self.center_frequency, self.gain) as blocks:
+                    for block in blocks:
+                        if self._stop.is_set():
+                            self.sensor.release(block)
+                            break
+                        self.captured += 1
+                        self._put((seq, block, self._ring.next()))
+                        seq += 1
+            except Exception as err:
+                print("**** CAPTURE ENGINE STREAM FAILED **** " + str(err))
+                self.errors += 1
+                self._stop.wait(0.01)
+
+    def _put(self, item):
+        if self.overflow == 'block':
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                self.sensor.release(item[1])
+                return
+        elif self.overflow == 'drop-newest':
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                self.sensor.release(item[1])
+                return
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        oldest = self._queue.get_nowait()
+                    except queue.Empty:
+                        continue
+                    self.dropped += 1
+                    self.sensor.release(oldest[1])
+        self.max_depth = max(self.max_depth, self._queue.qsize())
@@ -0,0 +1,370 @@
+import argparse
+import collections
+import concurrent.futures
+import lzma
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from definitions import ADC_OFFSET, BLOCK_SIZE
+from framing import CODEC_NONE, CODEC_ZLIB, CODEC_LZMA, CODEC_DELTA_BITPACK
+
+# Delta+bitpack: samples are coded per chunk of BITPACK_CHUNK samples, each
+# chunk in the mode and bit width that make it smallest.
+BITPACK_CHUNK = 4096
+BITPACK_HEADER = struct.Struct('<IH')   # sample count, chunk size
+MODE_OFFSET = 0     # zigzag of sample - ADC_OFFSET
+MODE_DELTA = 1      # zigzag of the difference to the previous sample
+MODE_RAW = 2        # the 8-bit samples as they are
+
+
+class CompressionError(ValueError):
+    pass
+
+
+def _zigzag(v):
+    # Signed int16 -> unsigned, small magnitudes to small codes
+    return ((v << 1) ^ (v >> 15)).view(np.uint16)
+
+
+def _unzigzag(z):
+    z = z.astype(np.int16)
+    return (z >> 1) ^ -(z & 1)
+
+
+def _bit_width(max_values):
+    # Bits needed for each chunk's largest code (0 for an all-zero chunk)
+    widths = np.zeros(len(max_values), dtype=np.uint8)
+    nonzero = max_values > 0
+    widths[nonzero] = np.floor(np.log2(max_values[nonzero])).astype(np.uint8) + 1
+    return widths
+
+
+def _pack(codes, width):
+    # (rows, chunk) codes of width < 8 bits -> (rows, chunk * width // 8) bytes:
+    # every 8 codes fill one little-endian uint64 of which width bytes are kept
+    groups = codes.reshape(len(codes), -1, 8).astype(np.uint64)
+    acc = groups[..., 0].copy()
+    for k in range(1, 8):
+        acc |= groups[..., k] << np.uint64(width * k)
+    return acc.view(np.uint8).reshape(len(codes), -1, 8)[..., :width].reshape(len(codes), -1)
+
+
+def _unpack(data, width, chunk):
+    # Inverse of _pack
+    words = np.zeros((len(data), chunk // 8, 8), dtype=np.uint8)
+    words[..., :width] = data.reshape(len(data), -1, width)
+    acc = words.view(np.uint64)[..., 0]
+    codes = np.empty((len(data), chunk // 8, 8), dtype=np.uint16)
+    mask = np.uint64((1 << width) - 1)
+    for k in range(8):
+        codes[..., k] = (acc >> np.uint64(width * k)) & mask
+    return codes.reshape(len(data), chunk)
+
+
+def bitpack_encode(block, chunk=BITPACK_CHUNK, offset=ADC_OFFSET):
+    """
+    Delta+bitpack encoding of a block of 8-bit offset-binary samples
+    (chunk must be a multiple of 8).
+
+    Narrow-amplitude captures (low gain, quiet bands) only use a few codes
+    around offset, so each chunk is stored with the fewest bits that hold
+    either its samples' distance from offset or the sample-to-sample
+    differences, both zigzag coded; chunks that would not shrink are kept
+    as raw bytes. Layout: sample count and chunk size, one descriptor byte
+    per chunk (bit width | mode << 4), then each chunk's packed bits."""
+    x = np.frombuffer(block, dtype=np.uint8)
+    n = len(x)
+    n_chunks = -(-n // chunk)
+    padded = np.empty(n_chunks * chunk, dtype=np.uint8)
+    padded[:n] = x
+    # Pad with the last sample, which costs no bits in either mode
+    padded[n:] = x[-1] if n else offset
+    chunks = padded.reshape(n_chunks, chunk)
+
+    signed = chunks.astype(np.int16)
+    residual = _zigzag(signed - offset)
+    delta = np.empty_like(signed)
+    delta[:, 0] = signed[:, 0] - offset
+    np.subtract(signed[:, 1:], signed[:, :-1], out=delta[:, 1:])
+    delta = _zigzag(delta)
+
+    residual_bits = _bit_width(residual.max(axis=1))
+    delta_bits = _bit_width(delta.max(axis=1))
+    modes = np.where(delta_bits < residual_bits, MODE_DELTA, MODE_OFFSET).astype(np.uint8)
+    bits = np.minimum(residual_bits, delta_bits)
+    raw = bits >= 8
+    modes[raw] = MODE_RAW
+    bits[raw] = 8
+
+    codes = np.where((modes == MODE_DELTA)[:, None], delta, residual)
+    codes[raw] = chunks[raw]
+    out = [BITPACK_HEADER.pack(n, chunk), (bits | (modes << 4)).tobytes()]
+    sizes = bits.astype(np.int64) * chunk // 8
+    packed = np.empty(int(sizes.sum()), dtype=np.uint8)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    for width in np.unique(bits).tolist():
+        if width == 0:
+            continue
+        rows = np.flatnonzero(bits == width)
+        planes = codes[rows].astype(np.uint8) if width == 8 else _pack(codes[rows], width)
+        packed[starts[rows, None] + np.arange(planes.shape[1])] = planes
+    out.append(packed.tobytes())
+    return b''.join(out)
+
+
+def bitpack_decode(payload, out=None, offset=ADC_OFFSET):
+    """Samples (uint8 array, written to out when given) of a bitpack_encode() payload."""
+    payload = memoryview(payload)
+    if len(payload) < BITPACK_HEADER.size:
+        raise CompressionError('bitpack payload too short')
+    n, chunk = BITPACK_HEADER.unpack_from(payload, 0)
+    n_chunks = -(-n // chunk) if chunk else 0
+    desc = np.frombuffer(payload, dtype=np.uint8, count=n_chunks, offset=BITPACK_HEADER.size)
+    data = np.frombuffer(payload, dtype=np.uint8, offset=BITPACK_HEADER.size + n_chunks)
+    bits = desc & 0x0f
+    modes = desc >> 4
+    sizes = bits.astype(np.int64) * chunk // 8
+    if int(sizes.sum()) != len(data):
+        raise CompressionError('bitpack payload holds %i data bytes, descriptors need %i' % (len(data), sizes.sum()))
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    codes = np.zeros((n_chunks, chunk), dtype=np.uint16)
+    for width in np.unique(bits).tolist():
+        if width == 0:
+            continue
+        rows = np.flatnonzero(bits == width)
+        planes = data[starts[rows, None] + np.arange(chunk * width // 8)]
+        codes[rows] = planes if width == 8 else _unpack(planes, width, chunk)
+
+    samples = np.empty((n_chunks, chunk), dtype=np.int16)
+    raw = modes == MODE_RAW
+    samples[raw] = codes[raw]
+    values = _unzigzag(codes[~raw])
+    delta = (modes[~raw] == MODE_DELTA)[:, None]
+    samples[~raw] = np.where(delta, np.cumsum(values, axis=1, dtype=np.int16), values) + offset
+    if out is None:
+        out = np.empty(n, dtype=np.uint8)
+    out[:] = samples.reshape(-1)[:n]
+    return out
+
+
+def _zlib_codec(level):
+    level = 1 if level is None else level
+    return lambda block: zlib.compress(block, level), zlib.decompress
+
+
+def _lzma_codec(level):
+    preset = 0 if level is None else level
+    return lambda block: lzma.compress(block, preset=preset), lzma.decompress
+
+
+def _bitpack_codec(level):
+    return bitpack_encode, lambda payload: bitpack_decode(payload).tobytes()
+
+
+def _none_codec(level):
+    return bytes, bytes
+
+
+# name -> (codec id in the frame header, factory(level) -> (compress, decompress))
+CODECS = collections.OrderedDict([
+    ('none', (CODEC_NONE, _none_codec)),
+    ('zlib', (CODEC_ZLIB, _zlib_codec)),
+    ('lzma', (CODEC_LZMA, _lzma_codec)),
+    ('bitpack', (CODEC_DELTA_BITPACK, _bitpack_codec)),
+])
+_CODEC_NAMES = dict((codec_id, name) for name, (codec_id, _) in CODECS.items())
+
+
+def decompress(codec_id, payload, raw_length=None):
+    """Raw block bytes of a frame payload encoded with codec_id (framing.FrameHeader.codec)."""
+    name = _CODEC_NAMES.get(codec_id)
+    if name is None:
+        raise CompressionError('unknown codec %i' % codec_id)
+    if codec_id == CODEC_NONE:
+        return payload
+    data = CODECS[name][1](None)[1](payload)
+    if raw_length is not None and len(data) != raw_length:
+        raise CompressionError('%s payload decoded to %i bytes, header says %i' % (name, len(data), raw_length))
+    return data
+
+
+class CompressionStage(object):
+    def __init__(self, codec='zlib', level=None, workers=2, max_pending=None):
+        """
+        Compresses capture blocks on a pool of worker threads.
+
+        Parameters:
+            codec:        one of CODECS: 'zlib', 'lzma' (level is the
+                          zlib level / lzma preset), 'bitpack' (delta+bitpack
+                          for narrow-amplitude ADC data) or 'none'
+            level:        codec level, None for the codec's fast default
+            workers:      worker threads; zlib, lzma and the NumPy kernels
+                          release the GIL, so blocks compress in parallel
+            max_pending:  blocks submitted and not yet collected before put()
+                          waits for the oldest (default 2 * workers)
+
+        put() hands a block over; get() returns results in submission order
+        as (tag, codec id, payload, raw length). The block's release() runs
+        in the thread calling get(), once its result is collected."""
+
+        if codec not in CODECS:
+            raise ValueError('codec must be one of %s.' % ", ".join(CODECS))
+        self.codec = codec
+        self.codec_id, factory = CODECS[codec]
+        self.level = level
+        self._compress = factory(level)[0]
+        self.workers = int(workers)
+        self.max_pending = int(max_pending) if max_pending is not None else 2 * self.workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix='compress')
+        self._pending = collections.deque()
+        self._stats_lock = threading.Lock()
+
+        # Counters
+        self.blocks = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.compress_time = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def compress(self, block):
+        """Compress one block in the calling thread; returns the payload bytes."""
+        t0 = time.perf_counter()
+        payload = self._compress(block)
+        elapsed = time.perf_counter() - t0
+        with self._stats_lock:
+            self.blocks += 1
+            self.raw_bytes += len(block) if not isinstance(block, memoryview) else block.nbytes
+            self.compressed_bytes += len(payload)
+            self.compress_time += elapsed
+        return payload
+
+    def put(self, block, tag=None, release=None):
+        """
+        Submit a block. Returns the results that had to be collected first
+        to stay within max_pending (usually an empty list)."""
+        done = []
+        while len(self._pending) >= self.max_pending:
+            done.append(self._collect())
+        raw_length = len(block) if not isinstance(block, memoryview) else block.nbytes
+        self._pending.append((tag, raw_length, release, self._executor.submit(self.compress, block)))
+        return done
+
+    def get(self, wait=True):
+        """Next result in submission order, or None if none is pending (or ready, without wait)."""
+        if not self._pending or (not wait and not self._pending[0][3].done()):
+            return None
+        return self._collect()
+
+    def drain(self):
+        """All pending results, in order."""
+        return [self._collect() for _ in range(len(self._pending))]
+
+    def close(self):
+        for tag, raw_length, release, future in self._pending:
+            future.cancel()
+            if release is not None:
+                release()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._stats_lock:
+            return {'codec': self.codec,
+                    'level': self.level,
+                    'blocks': self.blocks,
+                    'raw_bytes': self.raw_bytes,
+                    'compressed_bytes': self.compressed_bytes,
+                    'ratio': self.raw_bytes / float(self.compressed_bytes) if self.compressed_bytes else None,
+                    'mb_per_s': self.raw_bytes / self.compress_time / 1e6 if self.compress_time else None,
+                    'pending': len(self._pending)}
+
+    def _collect(self):
+        tag, raw_length, release, future = self._pending.popleft()
+        try:
+            payload = future.result()
+        finally:
+            if release is not None:
+                release()
+        return tag, self.codec_id, payload, raw_length
+
+
+def synthetic_blocks(gains=(1, 19, 37), n_blocks=4, block_size=BLOCK_SIZE, frequency=1.625e9):
+    """{label: [blocks]} of simulated captures at each gain, from quiet to near full scale."""
+    from simulation import SimulatedRadio, SyntheticAdcSource
+    captures = collections.OrderedDict()
+    for gain in gains:
+        radio = SimulatedRadio()
+        radio.tune(frequency, gain)
+        radio.settled_at = 0.0
+        source = SyntheticAdcSource(radio, block_size=block_size, cache_blocks=n_blocks)
+        captures['synthetic gain %i dB' % gain] = [source.next_block().tobytes() for _ in range(n_blocks)]
+    return captures
+
+
+def recorded_blocks(path, block_size=BLOCK_SIZE, max_blocks=16):
+    """[blocks] of a raw capture file (8-bit ADC samples as written by the sensor)."""
+    blocks = []
+    with open(path, 'rb') as fp:
+        while len(blocks) < max_blocks:
+            block = fp.read(block_size)
+            if not block:
+                break
+            blocks.append(block)
+    return blocks
+
+
+def benchmark(captures, codecs=(('zlib', 1), ('zlib', 6), ('lzma', 0), ('bitpack', None)), workers=2):
+    """Compress every capture set with every (codec, level); returns a list of result dicts."""
+    results = []
+    for label, blocks in captures.items():
+        for codec, level in codecs:
+            with CompressionStage(codec, level, workers=workers) as stage:
+                t0 = time.perf_counter()
+                for block in blocks:
+                    stage.put(block)
+                payloads = stage.drain()
+                wall = time.perf_counter() - t0
+                # Check the round trip on the first block
+                _, codec_id, payload, raw_length = payloads[0]
+                if bytes(decompress(codec_id, payload, raw_length)) != bytes(blocks[0]):
+                    raise CompressionError('%s did not round-trip %s' % (codec, label))
+                stats = stage.stats()
+            stats['capture'] = label
+            stats['wall_mb_per_s'] = stats['raw_bytes'] / wall / 1e6
+            results.append(stats)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compression benchmark for raw ADC blocks")
+    parser.add_argument("inputs", nargs="*", help="Recorded raw capture files; synthetic captures when none")
+    parser.add_argument("--blocks", type=int, default=4, help="Blocks per capture set")
+    parser.add_argument("--workers", type=int, default=2, help="Compression worker threads")
+    args = parser.parse_args()
+
+    if args.inputs:
+        captures = collections.OrderedDict((path, recorded_blocks(path, max_blocks=args.blocks)) for path in args.inputs)
+    else:
+        captures = synthetic_blocks(n_blocks=args.blocks)
+
+    print("%-28s %-8s %5s %7s %11s %10s" % ("capture", "codec", "level", "ratio", "MB/s/thread", "MB/s wall"))
+    for r in benchmark(captures, workers=args.workers):
+        print("%-28s %-8s %5s %7.2f %11.1f %10.1f" % (r['capture'], r['codec'], r['level'], r['ratio'],
+                                                     r['mb_per_s'], r['wall_mb_per_s']))
+
+
+if __name__ == "__main__":
+    main()
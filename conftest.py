@@ -0,0 +1,2 @@
+# test_read.py is a benchmark script for a BeagleBone with /dev/beaglelogic, not a pytest module
+collect_ignore = ['test_read.py']
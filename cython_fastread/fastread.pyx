@@ -2,32 +2,172 @@
 # cython: language_level=3
 
 from cpython.bytes   cimport PyBytes_FromStringAndSize, PyBytes_AS_STRING
-from cpython.ref     cimport PyObject
+from cpython.exc     cimport PyErr_CheckSignals
+from libc.stdlib     cimport malloc, free
 
 cdef extern from "unistd.h":
-    ssize_t read(int fd, void *buf, size_t count)
+    ssize_t read(int fd, void *buf, size_t count) nogil
+
+cdef extern from "sys/uio.h":
+    struct iovec:
+        void *iov_base
+        size_t iov_len
+    ssize_t readv(int fd, const iovec *iov, int iovcnt) nogil
+
+cdef extern from "limits.h":
+    int IOV_MAX
 
 cdef extern from "errno.h":
     int errno
+    int EINTR
+
+import os
+
+
+cdef _raise_errno(int err):
+    raise OSError(err, os.strerror(err))
+
+
+cdef Py_ssize_t _read_full(int fd, unsigned char *data, size_t count) except -1:
+    # 循环 read() 直到填满或读到 EOF；系统调用期间释放 GIL，EINTR 时先处理信号再重试
+    cdef size_t total = 0
+    cdef ssize_t nread
+    cdef int err = 0
+    while total < count:
+        with nogil:
+            nread = read(fd, data + total, count - total)
+            if nread < 0:
+                err = errno
+        if nread < 0:
+            if err == EINTR:
+                PyErr_CheckSignals()
+                continue
+            _raise_errno(err)
+        if nread == 0:
+            break
+        total += nread
+    return total
 
-def fast_read(int fd, size_t count):
+
+def fast_read(int fd, size_t count, pool=None):
     """
     直接分配未初始化的 bytes 缓冲区，然后 read() 写入，避免 double-memset，
-    并且用 C 指针检查失败。
+    并且用 C 指针检查失败。read() 期间释放 GIL。
+
+    传入 pool (buffer_pool.BufferPool) 时不再分配新对象：从池中取出一个
+    预分配缓冲区原地填充，返回其 memoryview，用完后需 pool.release()。
     """
-    cdef PyObject *buf = PyBytes_FromStringAndSize(NULL, count)
-    if buf == NULL:
-        raise MemoryError()
+    if pool is not None:
+        return _fast_read_pooled(fd, count, pool)
 
+    cdef bytes buf = PyBytes_FromStringAndSize(NULL, count)
     cdef void *data = <void*>PyBytes_AS_STRING(buf)
-    cdef ssize_t nread = read(fd, data, count)
+    cdef ssize_t nread
+    cdef int err = 0
+    while True:
+        with nogil:
+            nread = read(fd, data, count)
+            if nread < 0:
+                err = errno
+        if nread < 0 and err == EINTR:
+            PyErr_CheckSignals()
+            continue
+        break
     if nread < 0:
-        raise OSError(errno, "read failed")
+        _raise_errno(err)
 
     # 如果读到的数据比请求的少，就截断
-    if nread != count:
-        return (<bytes>buf)[:nread]
+    if <size_t>nread != count:
+        return buf[:nread]
+
+    return buf
+
+
+def fast_readinto(int fd, buffer):
+    """
+    读入调用方提供的可写缓冲区 (bytearray / memoryview / numpy 数组)，
+    处理短读和 EINTR，直到填满或 EOF。返回实际读取的字节数。
+    """
+    cdef unsigned char[::1] dst = memoryview(buffer).cast('B')
+    if dst.shape[0] == 0:
+        return 0
+    return _read_full(fd, &dst[0], dst.shape[0])
+
+
+def fast_readv(int fd, buffers):
+    """
+    一次 readv() 填充多个缓冲区，短读时推进 iovec 继续读，直到每个缓冲区
+    都填满或 EOF。返回读取的总字节数。
+    """
+    views = [memoryview(b).cast('B') for b in buffers]
+    cdef Py_ssize_t n = len(views)
+    if n == 0:
+        return 0
+
+    cdef iovec *iov = <iovec*>malloc(n * sizeof(iovec))
+    if iov == NULL:
+        raise MemoryError()
+
+    cdef unsigned char[::1] dst
+    cdef Py_ssize_t i, idx = 0, count = 0
+    cdef size_t total = 0, left
+    cdef ssize_t nread
+    cdef int err = 0
+    try:
+        # 跳过空缓冲区；views 保持导出，保证指针在读取期间有效
+        for i in range(n):
+            if views[i].nbytes == 0:
+                continue
+            dst = views[i]
+            iov[count].iov_base = &dst[0]
+            iov[count].iov_len = dst.shape[0]
+            count += 1
+
+        while idx < count:
+            with nogil:
+                nread = readv(fd, &iov[idx], min(count - idx, <Py_ssize_t>IOV_MAX))
+                if nread < 0:
+                    err = errno
+            if nread < 0:
+                if err == EINTR:
+                    PyErr_CheckSignals()
+                    continue
+                _raise_errno(err)
+            if nread == 0:
+                break
+            total += nread
+
+            # 按读到的字节数推进 iovec
+            left = nread
+            while left > 0 and idx < count:
+                if left >= iov[idx].iov_len:
+                    left -= iov[idx].iov_len
+                    idx += 1
+                else:
+                    iov[idx].iov_base = <unsigned char*>iov[idx].iov_base + left
+                    iov[idx].iov_len -= left
+                    left = 0
+    finally:
+        free(iov)
+    return total
+
 
-    return <bytes>buf
+cdef _fast_read_pooled(int fd, size_t count, pool):
+    view = pool.acquire()
+    cdef unsigned char[::1] dst = view
+    if count > <size_t>dst.shape[0]:
+        count = dst.shape[0]
 
+    cdef Py_ssize_t nread
+    try:
+        nread = _read_full(fd, &dst[0], count)
+    except BaseException:
+        pool.release(view)
+        raise
+    if nread == 0:
+        pool.release(view)
+        return None
 
+    if <size_t>nread != <size_t>dst.shape[0]:
+        return view[:nread]
+    return view
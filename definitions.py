@@ -14,6 +14,8 @@ DATA_TOPIC_BASE = 'radiohound/clients/data/'
 CMD_TOPIC_BASE = 'radiohound/clients/command/'
 FEEDBACK_TOPIC_BASE = 'radiohound/clients/feedback/'
 DEFAULT_DEBUG_TOPIC = 'icarus/debug'
+# Raw capture frames published by main_mmap.py (see framing.py)
+RAW_TOPIC = 'radiohound/raw'
 ANSIBLE_TIMESTAMP = '/opt/icarus/ansible_timestamp'
 
 # Heartbeat periodicity
@@ -69,6 +71,7 @@ key_percent_complete = '%_complete'
 key_disable_jobs = 'disable_background_jobs'
 key_validate_code = 'validate_code'
 key_msp_version = 'msp_version'
+key_capture_backend = 'capture_backend'
 
 # Key names for jobs
 key_job_type = 'job_type'
@@ -120,6 +123,15 @@ defaultNumOnShortSide = 100
 # default values for periodogram
 defaultNfft = 1024
 defaultWindow = 'hanning'
+STITCHER_CACHE_SIZE = 8 # spectrum stitchers kept by scan_spectrum() for repeated sweeps
+
+# Automatic gain control: converged gains per AGC_FREQUENCY_BIN Hz, cached across restarts
+AGC_GAIN_CACHE_FILE = '/opt/icarus/icarus/agcGainCache.json'
+AGC_FREQUENCY_BIN = 1e6
+
+# ADC samples: 8-bit offset binary, code ADC_OFFSET is 0 V and +-ADC_OFFSET codes span +-ADC_FULL_SCALE volts
+ADC_FULL_SCALE = 0.512
+ADC_OFFSET = 128
 
 # CALIBRATION
 # File for caching calibration data on local disk from MSP.
@@ -137,6 +149,18 @@ RH_HW_CONNECTED_GPIO_PIN = 6
 # Threshold for high/low path selection Rev3.1
 THRESHOLD_FREQ = 1E9
 
+# Front end settling after MSP commands (see pll_settle.py)
+MAX_SETTLE_TIME = 0.05 # seconds, longest wait for PLL lock after a retune
+GAIN_SETTLE_TIME = 0.001 # seconds, wait after a gain-only change
+# Lock detect readback. Register and bit are not confirmed against the PLL
+# register map; SettleController waits MAX_SETTLE_TIME after every retune
+# until it has seen them go from unlocked to locked after one.
+PLL_LOCK_REG = 0x00 # PLL register read back for lock detect
+PLL_LOCK_MASK = 0x01 # lock detect bit in the first byte read back
+
+# MSP firmware versions whose multi (0x02) mode is known to tune to fcStart of each frame; none confirmed yet
+MSP_SWEEP_VERSIONS = ()
+
 # How many of each command from an individual browser can be queued at a time
 # Additional messages will be skipped to prevent short-interval jobs from monopolizing queue
 max_sub_message_queued = 5
@@ -149,6 +173,10 @@ max_sub_job_queued = 2
 # printing format
 strformat = '%-37s'
 
+# beaglelogic character device and its sysfs attributes (state, lasterror, triggerflags, ...)
+BEAGLELOGIC_DEV = '/dev/beaglelogic'
+BEAGLELOGIC_SYSFS = '/sys/devices/virtual/misc/beaglelogic/'
+
 # Buffer size from the beaglelogic driver, which is then generalized for the number of raw captures
 # BUFFER_SIZE = 1024 * 1024
 # This is used for default sample_rate_max, gain_max, and frequency_max,
@@ -160,3 +188,16 @@ BUFFER_SIZE = 1024*1024
 BUF_UNIT_SIZE = 1048576
 TOT_BLOCKS = BUFFER_SIZE // BUF_UNIT_SIZE
 BLOCK_SIZE = 1024 * 1024 
+
+# Size of the whole driver ring mapped by the mmap capture backend
+RING_BUFFER_SIZE = 64*1024*1024
+
+# Number of preallocated capture buffers used by the readinto capture path
+BUFFER_POOL_SIZE = 4
+
+# Bytes kept free in front of every pooled capture buffer: one frame header (see framing.py)
+FRAME_HEADROOM = 64
+
+# Capture backend used when neither the caller nor the local config file picks one
+# (os_read, fast_read, pool or mmap, see capture_backends.py)
+DEFAULT_CAPTURE_BACKEND = 'os_read'
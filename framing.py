@@ -0,0 +1,143 @@
+import collections
+import struct
+import time
+
+from definitions import BLOCK_SIZE, FRAME_HEADROOM
+
+# Fixed-layout, little-endian frame header; the payload follows right after it.
+#
+#   offset  size  field
+#   0       4     magic b'RHRF'
+#   4       1     version (FRAME_VERSION)
+#   5       1     codec of the payload (CODEC_*, see compression.py)
+#   6       2     flags, 0
+#   8       8     capture sequence number (counts frames sent)
+#   16      8     block index (ring sequence number for the mmap backend)
+#   24      8     time.monotonic_ns() of the capture
+#   32      8     time.time_ns() of the capture
+#   40      8     center frequency (Hz, float64)
+#   48      4     gain (dB, float32)
+#   52      4     payload length in bytes
+#   56      4     raw length: payload bytes before encoding by the codec
+#   60      4     reserved, 0
+FRAME_MAGIC = b'RHRF'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<4sBBHQQqqdfIII')
+HEADER_SIZE = FRAME_HEADER.size
+
+# Payload codecs
+CODEC_NONE = 0              # raw ADC bytes
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_DELTA_BITPACK = 3
+
+assert HEADER_SIZE == FRAME_HEADROOM, 'FRAME_HEADROOM must hold exactly one frame header'
+
+FrameHeader = collections.namedtuple('FrameHeader', [
+    'version', 'codec', 'flags', 'capture_seq', 'block_index', 'monotonic_ns', 'wall_ns',
+    'center_frequency', 'gain', 'payload_length', 'raw_length'])
+
+
+class FrameError(ValueError):
+    pass
+
+
+def pack_header(buf, offset, capture_seq, block_index, center_frequency, gain, payload_length,
+                codec=CODEC_NONE, raw_length=None, monotonic_ns=None, wall_ns=None, flags=0):
+    """Write a frame header into the writable buffer buf at offset; timestamps default to now."""
+    FRAME_HEADER.pack_into(buf, offset, FRAME_MAGIC, FRAME_VERSION, codec, flags,
+                           capture_seq, block_index,
+                           time.monotonic_ns() if monotonic_ns is None else monotonic_ns,
+                           time.time_ns() if wall_ns is None else wall_ns,
+                           center_frequency, gain, payload_length,
+                           payload_length if raw_length is None else raw_length, 0)
+
+
+def decode_header(frame):
+    """FrameHeader of the frame (any bytes-like object starting with a header)."""
+    if len(frame) < HEADER_SIZE:
+        raise FrameError('frame of %i bytes is shorter than the %i byte header' % (len(frame), HEADER_SIZE))
+    magic, version, codec, flags, capture_seq, block_index, monotonic_ns, wall_ns, \
+        center_frequency, gain, payload_length, raw_length, _ = FRAME_HEADER.unpack_from(frame, 0)
+    if magic != FRAME_MAGIC:
+        raise FrameError('not a RadioHound frame (magic %r)' % magic)
+    if version > FRAME_VERSION:
+        raise FrameError('frame version %i is newer than supported (%i)' % (version, FRAME_VERSION))
+    return FrameHeader(version, codec, flags, capture_seq, block_index, monotonic_ns, wall_ns,
+                       center_frequency, gain, payload_length, raw_length)
+
+
+def decode_frame(frame):
+    """(FrameHeader, payload) of a frame; payload is a memoryview into frame, nothing is copied."""
+    header = decode_header(frame)
+    payload = memoryview(frame)[HEADER_SIZE:]
+    if len(payload) != header.payload_length:
+        raise FrameError('frame carries %i payload bytes, header says %i' % (len(payload), header.payload_length))
+    return header, payload
+
+
+class FrameWriter(object):
+    def __init__(self, pool=None, capacity=BLOCK_SIZE):
+        """
+        Puts a frame header in front of capture blocks without copying them
+        into a new object each time.
+
+        Parameters:
+            pool:      buffer_pool.BufferPool the blocks come from; its
+                       buffers keep FRAME_HEADROOM bytes in front of the data,
+                       so the header is written there and the frame is the
+                       pool buffer itself
+            capacity:  payload size of the reused frame buffer for blocks
+                       without headroom (mmap ring blocks, bytes); grown when
+                       a larger block comes along
+
+        frame() returns one contiguous frame, for MQTT. parts() returns
+        [header, block] for scatter-gather writes (socket.sendmsg), which
+        never touch the block. Both return views that stay valid only until
+        the next call, or until the pooled block is released."""
+        self.pool = pool if pool is not None and getattr(pool, 'headroom', 0) >= HEADER_SIZE else None
+        self._buffer = bytearray(HEADER_SIZE + int(capacity))
+        self._view = memoryview(self._buffer)
+        self._header = bytearray(HEADER_SIZE)
+        self.frames = 0
+        self.copied = 0     # frames that went through the reused buffer
+
+    def frame(self, block, capture_seq, block_index, center_frequency, gain, **fields):
+        """
+        Contiguous frame of header and block. A full pool buffer or reused
+        buffer is returned as the bytearray itself, otherwise a memoryview.
+        fields go to pack_header (codec, raw_length, timestamps)."""
+        n = _nbytes(block)
+        self.frames += 1
+        if self.pool is not None and isinstance(block, memoryview) and self.pool.owns(block):
+            pack_header(block.obj, self.pool.headroom - HEADER_SIZE,
+                        capture_seq, block_index, center_frequency, gain, n, **fields)
+            return self.pool.framed(block, HEADER_SIZE)
+
+        if HEADER_SIZE + n > len(self._buffer):
+            self._buffer = bytearray(HEADER_SIZE + n)
+            self._view = memoryview(self._buffer)
+        pack_header(self._buffer, 0, capture_seq, block_index, center_frequency, gain, n, **fields)
+        # memoryview assignment is a plain memcpy; bytearray slice assignment is much slower
+        self._view[HEADER_SIZE:HEADER_SIZE + n] = block
+        self.copied += 1
+        if HEADER_SIZE + n == len(self._buffer):
+            return self._buffer
+        return self._view[:HEADER_SIZE + n]
+
+    def parts(self, block, capture_seq, block_index, center_frequency, gain, **fields):
+        """[header, block] for scatter-gather writes; the header buffer is reused."""
+        pack_header(self._header, 0, capture_seq, block_index, center_frequency, gain, _nbytes(block), **fields)
+        self.frames += 1
+        return [self._header, block]
+
+
+def as_payload(frame):
+    """frame as bytes or bytearray, which is what paho-mqtt publishes (copies memoryviews only)."""
+    return frame if isinstance(frame, (bytes, bytearray)) else bytes(frame)
+
+
+def _nbytes(block):
+    if isinstance(block, memoryview):
+        return block.nbytes
+    return len(block)
@@ -0,0 +1,103 @@
+import functools
+
+import numpy as np
+
+from definitions import ADC_FULL_SCALE, ADC_OFFSET
+
+IQ_LAYOUTS = ('iq', 'real')
+
+
+@functools.lru_cache(maxsize=8)
+def lookup_table(scale=ADC_FULL_SCALE / ADC_OFFSET, offset=ADC_OFFSET):
+    """Read-only float32 table mapping each 8-bit offset-binary code to volts."""
+    lut = ((np.arange(256, dtype=np.float64) - offset) * scale).astype(np.float32)
+    lut.flags.writeable = False
+    return lut
+
+
+class IqDecoder(object):
+    def __init__(self, layout='iq', dtype=np.complex64, scale=ADC_FULL_SCALE / ADC_OFFSET, offset=ADC_OFFSET):
+        """
+        Turns raw capture buffers into sample arrays.
+
+        Parameters:
+            layout:  'iq'    bytes are interleaved I, Q, I, Q, ... codes;
+                             one sample per byte pair
+                     'real'  every byte is one real sample
+            dtype:   np.complex64, or np.float32 for (n, 2) I/Q pairs
+                     (always float32 for the 'real' layout)
+            scale:   volts per code step
+            offset:  code of 0 V
+
+        Buffers are read through np.frombuffer, so bytes, bytearrays,
+        memoryviews (pooled buffers, mmap ring blocks) and uint8 arrays are
+        all decoded in place. Conversion is one lookup-table take into the
+        output array; pass out= to reuse an array across blocks.
+        decode() also accepts a list of blocks, as returned by the mmap
+        backend, and decodes them back to back into one array."""
+
+        if layout not in IQ_LAYOUTS:
+            raise ValueError('layout must be one of %s.' % ", ".join(IQ_LAYOUTS))
+        dtype = np.dtype(dtype)
+        if dtype not in (np.dtype(np.complex64), np.dtype(np.float32)):
+            raise ValueError('dtype must be complex64 or float32.')
+        self.layout = layout
+        self.dtype = np.dtype(np.float32) if layout == 'real' else dtype
+        self.lut = lookup_table(scale, offset)
+
+    @property
+    def bytes_per_sample(self):
+        return 2 if self.layout == 'iq' else 1
+
+    def n_samples(self, block):
+        """Number of samples decode() produces for block (or list of blocks)."""
+        if isinstance(block, (list, tuple)):
+            return sum(self.n_samples(b) for b in block)
+        return _nbytes(block) // self.bytes_per_sample
+
+    def empty(self, n_samples):
+        """Output array for n_samples samples, to be reused through out=."""
+        if self.layout == 'iq' and self.dtype == np.float32:
+            return np.empty((n_samples, 2), dtype=np.float32)
+        return np.empty(n_samples, dtype=self.dtype)
+
+    def decode(self, block, out=None):
+        """
+        Decode block into out (allocated when None) and return out, or the
+        leading part of out when it is larger than needed. A trailing odd
+        byte of an 'iq' block is ignored."""
+        n = self.n_samples(block)
+        if out is None:
+            out = self.empty(n)
+        elif len(out) < n:
+            raise ValueError('output array holds %i samples, %i needed.' % (len(out), n))
+        elif out.dtype != self.dtype or not out.flags.c_contiguous:
+            raise ValueError('output array must be a contiguous %s array.' % self.dtype.name)
+
+        flat = out.reshape(-1).view(np.float32)
+        pos = 0
+        for b in (block if isinstance(block, (list, tuple)) else (block,)):
+            codes = np.frombuffer(b, dtype=np.uint8)
+            count = (len(codes) // self.bytes_per_sample) * self.bytes_per_sample
+            # mode='clip' lets take() write straight into out; codes are always valid indices
+            np.take(self.lut, codes[:count], out=flat[pos:pos + count], mode='clip')
+            pos += count
+        return out[:n]
+
+
+def decode(block, layout='iq', out=None):
+    """Decode block with a default IqDecoder for layout, see IqDecoder.decode."""
+    return _decoder(layout).decode(block, out)
+
+
+@functools.lru_cache(maxsize=None)
+def _decoder(layout):
+    return IqDecoder(layout)
+
+
+def _nbytes(block):
+    if isinstance(block, memoryview):
+        return block.nbytes
+    if isinstance(block, np.ndarray):
+        return block.nbytes
+    return len(block)
@@ -2,6 +2,9 @@ import time
 import argparse
 from datetime import datetime
 from receiver import RadioHoundSensorV3
+from definitions import BUFFER_POOL_SIZE
+from capture_engine import CaptureEngine, OVERFLOW_POLICIES
+from capture_backends import BACKENDS
 
 
 def main():
@@ -12,28 +15,90 @@ def main():
         default=None,
         help="Scanning time in seconds; infinite by default"
     )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(BACKENDS),
+        default=None,
+        help="Capture backend; defaults to the one in the local config file"
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=BUFFER_POOL_SIZE,
+        help="Number of preallocated capture buffers for the pool backend"
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=0,
+        help="Capture on a background thread feeding a queue of this depth; 0 reads inline"
+    )
+    parser.add_argument(
+        "--overflow",
+        choices=OVERFLOW_POLICIES,
+        default="block",
+        help="What the capture thread does when the queue is full"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Keep the receiver locked and tuned and read blocks back-to-back instead of one raw() per block"
+    )
     args = parser.parse_args()
 
-    sensor = RadioHoundSensorV3()
+    pool_size = args.pool_size
+    if args.queue_depth:
+        # One buffer being filled and one being consumed on top of the queued ones
+        pool_size = max(pool_size, args.queue_depth + 2)
+    sensor = RadioHoundSensorV3(backend=args.backend, pool_size=pool_size)
+    engine = None
+    if args.queue_depth:
+        engine = CaptureEngine(sensor, 1.625e9, 1, queue_depth=args.queue_depth, overflow=args.overflow,
+                               stream=args.stream)
+        engine.start()
     print("Starting raw capture…")
     start_time = time.time()
     total_bytes = 0
     capture_count = 0
 
     try:
-        while True:
+        if args.stream and engine is None:
+            # Lock and tune once, then read back-to-back
+            with sensor.stream(1.625e9, 1, duration=args.duration) as blocks:
+                for data in blocks:
+                    total_bytes += len(data)
+                    capture_count += 1
+                    sensor.release(data)
+
+        while engine is not None or not args.stream:
             # Exit when duration elapsed
             if args.duration is not None and (time.time() - start_time) >= args.duration:
                 break
 
             # Read 1 MiB without pacing delay for max throughput
-            data = sensor.raw(1.625e9, 1)
-            total_bytes += len(data)
-            capture_count += 1
+            if engine is not None:
+                item = engine.get(timeout=1)
+                if item is None:
+                    continue
+                data = item[1]
+            else:
+                data = sensor.raw(1.625e9, 1)
+                if data is None:
+                    continue
+            # The mmap backend returns the list of ring blocks filled since the last capture
+            for block in data if isinstance(data, list) else [data]:
+                total_bytes += len(block)
+                capture_count += 1
+                sensor.release(block)
 
     except KeyboardInterrupt:
         print("Interrupted by user.")
 
+    if engine is not None:
+        engine.stop()
+        print(f"Capture thread: {engine.captured} blocks read, {engine.dropped} dropped, "
+              f"max queue depth {engine.max_depth}")
+
     # Final statistics
     elapsed_total = time.time() - start_time
     mbps = total_bytes / elapsed_total / 1e6
@@ -1,21 +1,68 @@
 import paho.mqtt.client as mqtt
 import time
 import argparse
-from datetime import datetime
-from receiver_map import RadioHoundSensorV3
+from definitions import RAW_TOPIC, BUFFER_POOL_SIZE
+from receiver import RadioHoundSensorV3
+from capture_engine import CaptureEngine, OVERFLOW_POLICIES
+from capture_backends import BACKENDS
+from framing import FrameWriter
+from publisher import MqttPublisher, BACKPRESSURE_POLICIES
+from compression import CompressionStage, CODECS
 
 BROKER_HOST = "127.0.0.1"  
 BROKER_PORT = 1883
-TOPIC = "radiohound/raw"
+TOPIC = RAW_TOPIC
+CENTER_FREQUENCY = 1.625e9
+GAIN = 1
 
 def main():
     parser = argparse.ArgumentParser(description="RadioHound MQTT raw capture sender")
     parser.add_argument("--duration", type=float, default=None, help="Scanning time, infinite as default")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="mmap",
+                        help="Capture backend used to read the ADC")
+    parser.add_argument("--queue-depth", type=int, default=0,
+                        help="Capture on a background thread feeding a queue of this many blocks; 0 reads inline")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES, default="block",
+                        help="What the capture thread does when the queue is full")
+    parser.add_argument("--max-inflight", type=int, default=8,
+                        help="Messages handed to the MQTT client but not yet sent")
+    parser.add_argument("--max-inflight-mb", type=float, default=8,
+                        help="MiB of messages handed to the MQTT client but not yet sent")
+    parser.add_argument("--backpressure", choices=BACKPRESSURE_POLICIES, default="block",
+                        help="What publishing does when the in-flight limits are reached")
+    parser.add_argument("--codec", choices=list(CODECS), default="none",
+                        help="Compress blocks before publishing (see compression.py for a benchmark)")
+    parser.add_argument("--level", type=int, default=None, help="zlib level or lzma preset")
+    parser.add_argument("--compress-workers", type=int, default=2, help="Compression worker threads")
     args = parser.parse_args()
 
-    sensor = RadioHoundSensorV3()
+    stage = None
+    if args.codec != "none":
+        stage = CompressionStage(args.codec, args.level, workers=args.compress_workers)
+
+    # Pooled blocks stay out while queued in the engine and while waiting in the compression stage
+    held = (stage.max_pending if stage is not None else 0) + args.queue_depth
+    sensor = RadioHoundSensorV3(backend=args.backend, pool_size=max(BUFFER_POOL_SIZE, held + 2))
     client = mqtt.Client()
     client.connect(BROKER_HOST, BROKER_PORT, 60)
+    publisher = MqttPublisher(client, TOPIC, max_inflight_messages=args.max_inflight,
+                              max_inflight_bytes=int(args.max_inflight_mb * 1024 * 1024),
+                              backpressure=args.backpressure)
+    publisher.start()
+
+    # Binary frame header in front of every block, written into the pool's headroom when there is one
+    writer = FrameWriter(pool=sensor.pool)
+
+    def publish_compressed(result):
+        (count, i, monotonic_ns, wall_ns), codec_id, payload, raw_length = result
+        frame = writer.frame(payload, count, i, CENTER_FREQUENCY, GAIN, codec=codec_id, raw_length=raw_length,
+                             monotonic_ns=monotonic_ns, wall_ns=wall_ns)
+        publisher.publish(frame)
+
+    engine = None
+    if args.queue_depth:
+        engine = CaptureEngine(sensor, CENTER_FREQUENCY, GAIN, queue_depth=args.queue_depth, overflow=args.overflow)
+        engine.start()
 
     print("Starting raw capture...")
     start_time = time.time()
@@ -27,22 +74,61 @@ def main():
                 break
 
             # sensor.raw 返回的是块列表，每块约 1MB
-            blocks = sensor.raw(1.625e9, 1)
+            if engine is not None:
+                item = engine.get(timeout=1)
+                blocks = [item[1]] if item is not None else None
+                # Ring sequence number with mmap, so ring overruns show up as block_index gaps
+                seqs = [item[0] if item[2] is None else item[2]] if item is not None else None
+            else:
+                blocks = sensor.raw(CENTER_FREQUENCY, GAIN)
+                seqs = sensor.last_block_seqs
+                if blocks is not None and not isinstance(blocks, list):
+                    # Non-ring backends return one buffer per capture
+                    blocks = [blocks]
+                    seqs = [capture_count]
             if not blocks:
                 continue
 
-            for i, block in enumerate(blocks):
+            # seq 为环形缓冲区中块的序号，跳号即表示丢块
+            for i, block in zip(seqs, blocks):
                 capture_count += 1
                 print(f"Captured block {i} with {len(block)} bytes of raw data.")
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-                header_str = f"RAW|CAP#{capture_count}|BLOCK#{i}|TIME:{timestamp}|"
-                header_bytes = header_str.encode("utf-8")
-                payload = header_bytes + block
-                client.publish(TOPIC, payload, qos=0)
+                if stage is None:
+                    frame = writer.frame(block, capture_count, i, CENTER_FREQUENCY, GAIN)
+                    publisher.publish(frame, release=lambda block=block: sensor.release(block))
+                    continue
+                # Compressed frames keep the capture time; the raw block goes back once it is compressed
+                tag = (capture_count, i, time.monotonic_ns(), time.time_ns())
+                for result in stage.put(block, tag, release=lambda block=block: sensor.release(block)):
+                    publish_compressed(result)
+                result = stage.get(wait=False)
+                while result is not None:
+                    publish_compressed(result)
+                    result = stage.get(wait=False)
 
     except KeyboardInterrupt:
         print("Interrupted by user.")
 
+    if engine is not None:
+        engine.stop()
+        print(f"Capture thread: {engine.captured} blocks read, {engine.dropped} dropped, "
+              f"max queue depth {engine.max_depth}")
+
+    if stage is not None:
+        for result in stage.drain():
+            publish_compressed(result)
+        stage.close()
+        stats = stage.stats()
+        if stats['ratio'] is not None:
+            print(f"Compression ({stats['codec']}): ratio {stats['ratio']:.2f}, {stats['mb_per_s']:.1f} MB/s per worker")
+
+    publisher.stop()
+    stats = publisher.stats()
+    print(f"Publisher: {stats['published']} sent, {stats['dropped']} dropped, {stats['lost']} lost, "
+          f"max {stats['max_inflight']} in flight, {stats['blocked_time']:.2f}s blocked")
+    if stats['latency_p50'] is not None:
+        print(f"Publish latency: p50 {stats['latency_p50'] * 1e3:.1f} ms, p99 {stats['latency_p99'] * 1e3:.1f} ms")
+
     print("Finished data transmission.")
     client.disconnect()
     sensor.close()
@@ -0,0 +1,169 @@
+import math
+import time
+
+from definitions import MAX_SETTLE_TIME, GAIN_SETTLE_TIME
+from tools import bcolors
+
+SETTLE_KINDS = ('retune', 'gain')
+
+
+class SettleController(object):
+    def __init__(self, lock_probe=None, max_settle=MAX_SETTLE_TIME, gain_settle=GAIN_SETTLE_TIME,
+                 poll_interval=0.0005, smoothing=0.25, margin=1.25, max_lock_failures=3):
+        """
+        Waits for the front end to settle after an MSP command, for as long
+        as it actually needs instead of a fixed delay.
+
+        Parameters:
+            lock_probe:         callable returning True once the PLL reports
+                                lock, False while unlocked and None when lock
+                                detect cannot be read
+            max_settle:         longest wait after a retune; also the wait
+                                used when no lock detect is available
+            gain_settle:        wait after a gain-only change (no retune, so
+                                only the VGA has to settle)
+            poll_interval:      pause between lock detect reads
+            smoothing:          weight of a new measurement in the learned
+                                settle time of its frequency step
+            margin:             factor applied to a learned settle time when
+                                it is used without lock detect
+            max_lock_failures:  consecutive retunes without lock detect
+                                reporting lock before polling is given up
+
+        After a retune the PLL lock detect is polled until it reports lock.
+        PLL_LOCK_REG/PLL_LOCK_MASK are not confirmed against the PLL
+        register map, so a retune only ends before max_settle when the
+        probe reads unlocked right after it and locked later; that also
+        marks the probe verified. A probe that reads locked at once is
+        indistinguishable from a stuck bit and waits max_settle until then.
+
+        Measured lock times are kept per frequency step (bucketed by log2
+        of the step in MHz): polling starts once most of the learned time
+        has passed, which keeps SPI traffic down, and when lock detect is
+        unavailable the learned time (times margin) replaces max_settle."""
+
+        self.lock_probe = lock_probe
+        self.max_settle = max_settle
+        self.gain_settle = gain_settle
+        self.poll_interval = poll_interval
+        self.smoothing = smoothing
+        self.margin = margin
+        self.max_lock_failures = max_lock_failures
+
+        self.lock_detect = lock_probe is not None
+        self.probe_verified = False     # lock detect has been seen going from unlocked to locked after a retune
+        self.table = {}     # frequency step bucket -> learned settle time (s)
+        self._lock_failures = 0
+
+        # Counters
+        self.counts = dict((kind, 0) for kind in SETTLE_KINDS)
+        self.total_time = dict((kind, 0.0) for kind in SETTLE_KINDS)
+        self.max_time = dict((kind, 0.0) for kind in SETTLE_KINDS)
+        self.last_time = 0.0
+        self.polls = 0
+        self.timeouts = 0
+        self.unverified_locks = 0   # retunes where lock detect read locked at once, before it was trusted
+
+    @staticmethod
+    def bucket(delta):
+        # None (first tune, unknown step) gets its own bucket
+        if delta is None:
+            return None
+        return int(math.log2(1 + abs(delta) / 1e6))
+
+    def expected(self, delta):
+        """Settle time expected for a retune by delta Hz, without lock detect."""
+        learned = self.table.get(self.bucket(delta))
+        if learned is None:
+            return self.max_settle
+        return min(self.max_settle, learned * self.margin)
+
+    def wait(self, kind, delta=None):
+        """
+        Block until the front end has settled after a 'retune' by delta Hz
+        or a 'gain' change. Returns the time waited in seconds."""
+        if kind not in SETTLE_KINDS:
+            raise ValueError('settle kind must be one of %s.' % ", ".join(SETTLE_KINDS))
+        start = time.monotonic()
+        if kind == 'gain':
+            time.sleep(self.gain_settle)
+        elif self.lock_detect:
+            self._poll_lock(start, delta)
+        else:
+            time.sleep(self.expected(delta))
+        return self._record(kind, time.monotonic() - start)
+
+    def stats(self):
+        stats = {'lock_detect': self.lock_detect,
+                 'probe_verified': self.probe_verified,
+                 'unverified_locks': self.unverified_locks,
+                 'polls': self.polls,
+                 'timeouts': self.timeouts,
+                 'last_time': self.last_time,
+                 'table': dict(self.table)}
+        for kind in SETTLE_KINDS:
+            stats[kind + 's'] = self.counts[kind]
+            stats['mean_' + kind + '_time'] = self.total_time[kind] / self.counts[kind] if self.counts[kind] else 0.0
+            stats['max_' + kind + '_time'] = self.max_time[kind]
+        return stats
+
+    def _poll_lock(self, start, delta):
+        key = self.bucket(delta)
+        deadline = start + self.max_settle
+        verifying = not self.probe_verified
+        if verifying:
+            # Read lock detect straight after the retune: if it already says
+            # locked it cannot be told apart from a bit stuck at 1
+            locked = self._probe()
+            if locked is None:
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                return
+            if locked:
+                self.unverified_locks += 1
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                return
+        learned = self.table.get(key)
+        if learned is not None:
+            # No point asking the PLL before most of its usual lock time has passed
+            time.sleep(min(learned * 0.75, self.max_settle))
+        while True:
+            locked = self._probe()
+            if locked is None:
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                return
+            elapsed = time.monotonic() - start
+            if locked:
+                self._lock_failures = 0
+                if verifying:
+                    # Unlocked, then locked: the probe follows the PLL
+                    self.probe_verified = True
+                self.table[key] = elapsed if learned is None else \
+                    (1 - self.smoothing) * learned + self.smoothing * elapsed
+                return
+            if time.monotonic() >= deadline:
+                self.timeouts += 1
+                self._lock_failures += 1
+                if self._lock_failures >= self.max_lock_failures:
+                    print(bcolors.WARNING + "PLL lock detect never reported lock after %i retunes, " % self._lock_failures + \
+                    "settling for a fixed %.0f ms from now on" % (self.max_settle * 1e3) + bcolors.ENDC)
+                    self.lock_detect = False
+                return
+            time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+
+    def _probe(self):
+        self.polls += 1
+        try:
+            locked = self.lock_probe()
+        except Exception as err:
+            print(bcolors.WARNING + "PLL lock detect unavailable: " + str(err) + bcolors.ENDC)
+            locked = None
+        if locked is None:
+            self.lock_detect = False
+        return locked
+
+    def _record(self, kind, elapsed):
+        self.counts[kind] += 1
+        self.total_time[kind] += elapsed
+        self.max_time[kind] = max(self.max_time[kind], elapsed)
+        self.last_time = elapsed
+        return elapsed
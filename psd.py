@@ -0,0 +1,183 @@
+import functools
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy import fft as sp_fft
+from scipy import signal
+
+from definitions import defaultNfft, defaultWindow, ADC_FULL_SCALE, ADC_OFFSET
+
+PSD_MODES = ('mean', 'max', 'min')
+
+# numpy-style window names used in definitions.py that scipy does not know
+_WINDOW_ALIASES = {'hanning': 'hann'}
+
+
+@functools.lru_cache(maxsize=32)
+def get_window(window, nfft):
+    """Read-only float32 window of nfft points, cached per (window, nfft)."""
+    w = signal.get_window(_WINDOW_ALIASES.get(window, window), nfft, fftbins=True).astype(np.float32)
+    w.flags.writeable = False
+    return w
+
+
+def segment_view(x, nfft, step):
+    """
+    (n_segments, nfft) read-only view of the 1-D array x, segments starting
+    step samples apart. Nothing is copied; a trailing partial segment is
+    left out."""
+    n_segments = (len(x) - nfft) // step + 1 if len(x) >= nfft else 0
+    return as_strided(x, shape=(n_segments, nfft), strides=(x.strides[0] * step, x.strides[0]),
+                      writeable=False)
+
+
+class PsdEngine(object):
+    def __init__(self, nfft=defaultNfft, window=defaultWindow, overlap=0.0, mode='mean',
+                 sample_rate=48e6, batch=256, workers=1):
+        """
+        Welch power spectral density of raw captures.
+
+        Parameters:
+            nfft:         FFT length (samples per segment)
+            window:       scipy.signal window name ('hanning' is accepted)
+            overlap:      fraction of nfft consecutive segments overlap
+            mode:         how segment periodograms are combined:
+                          'mean' Welch average, 'max' max-hold, 'min' min-hold
+            sample_rate:  sample rate of the captures (Hz)
+            batch:        segments transformed per FFT call, bounding the
+                          scratch memory to batch * nfft samples
+            workers:      threads used by scipy.fft per call
+
+        Blocks may be raw capture buffers (bytes, memoryview, uint8 arrays
+        of 8-bit offset-binary ADC samples, converted to volts) or decoded
+        float/complex sample arrays. Real input gives the one-sided
+        spectrum of nfft//2+1 bins from 0 to sample_rate/2, complex input
+        the centered nfft-bin spectrum. Output is in V^2/Hz.
+
+        The block is viewed as an (n_segments, nfft) strided array and
+        windowed into a preallocated scratch buffer, then each batch of
+        segments goes through one rfft/fft call. The window and its
+        normalization are cached per (nfft, window), and scipy.fft keeps
+        its FFT plans per length, so repeated scans pay no setup cost.
+
+        The engine can be passed directly as scan reducer/process: called
+        as engine(f_lims, block) it returns the PSD."""
+
+        if mode not in PSD_MODES:
+            raise ValueError('PSD mode must be one of %s.' % ", ".join(PSD_MODES))
+        if not 0 <= overlap < 1:
+            raise ValueError('overlap must be in [0, 1).')
+        self.nfft = int(nfft)
+        self.window_name = window
+        self.window = get_window(window, self.nfft)
+        self.step = max(1, self.nfft - int(round(self.nfft * overlap)))
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.batch = int(batch)
+        self.workers = workers
+
+        # Density scale of one periodogram: 1 / (fs * sum(w^2))
+        self._norm = 1.0 / (sample_rate * float(np.sum(self.window.astype(np.float64) ** 2)))
+        self._scratch = {}
+
+        # Counters
+        self.blocks = 0
+        self.segments = 0
+
+    def __call__(self, f_lims, block):
+        return self.psd(block)
+
+    @property
+    def n_bins(self):
+        return self.nfft // 2 + 1
+
+    def frequencies(self, complex_input=False):
+        """Frequency of each output bin relative to the capture's baseband (Hz)."""
+        if complex_input:
+            return sp_fft.fftshift(sp_fft.fftfreq(self.nfft, 1.0 / self.sample_rate))
+        return sp_fft.rfftfreq(self.nfft, 1.0 / self.sample_rate)
+
+    def psd(self, block, out=None):
+        """PSD of one block, written to out (float64 array of the output size) if given."""
+        x, offset, scale = self._samples(block)
+        segments = segment_view(x, self.nfft, self.step)
+        n_segments = segments.shape[0]
+        if n_segments == 0:
+            raise ValueError('block of %i samples is shorter than nfft=%i.' % (len(x), self.nfft))
+        is_complex = np.iscomplexobj(x)
+        n_out = self.nfft if is_complex else self.n_bins
+        if out is None:
+            out = np.empty(n_out, dtype=np.float64)
+
+        first = True
+        for start in range(0, n_segments, self.batch):
+            power = self._periodograms(segments[start:start + self.batch], offset, is_complex)
+            if self.mode == 'mean':
+                reduced = power.sum(axis=0, dtype=np.float64)
+                if first:
+                    out[:] = reduced
+                else:
+                    out += reduced
+            elif self.mode == 'max':
+                reduced = power.max(axis=0)
+                if first:
+                    out[:] = reduced
+                else:
+                    np.maximum(out, reduced, out=out)
+            else:
+                reduced = power.min(axis=0)
+                if first:
+                    out[:] = reduced
+                else:
+                    np.minimum(out, reduced, out=out)
+            first = False
+
+        out *= self._norm * scale * scale / (n_segments if self.mode == 'mean' else 1)
+        if is_complex:
+            out[:] = sp_fft.fftshift(out)
+        else:
+            # One-sided spectrum: fold the negative frequencies onto the positive ones
+            out[1:-1 if self.nfft % 2 == 0 else None] *= 2
+        self.blocks += 1
+        self.segments += n_segments
+        return out
+
+    def stats(self):
+        return {'nfft': self.nfft,
+                'window': self.window_name,
+                'mode': self.mode,
+                'blocks': self.blocks,
+                'segments': self.segments}
+
+    def _samples(self, block):
+        # 1-D sample array of the block, the offset to remove and the scale to volts
+        if isinstance(block, np.ndarray):
+            x = block.reshape(-1)
+        else:
+            x = np.frombuffer(block, dtype=np.uint8)
+        if x.dtype == np.uint8:
+            return x, float(ADC_OFFSET), ADC_FULL_SCALE / ADC_OFFSET
+        return x, 0.0, 1.0
+
+    def _periodograms(self, segments, offset, is_complex):
+        # |FFT|^2 of the windowed segments, one batched transform
+        n = segments.shape[0]
+        dtype = np.complex64 if is_complex else np.float32
+        key = (n, dtype)
+        work = self._scratch.get(key)
+        if work is None:
+            if len(self._scratch) > 4:
+                self._scratch.clear()
+            work = self._scratch[key] = np.empty((n, self.nfft), dtype=dtype)
+        if offset:
+            np.subtract(segments, offset, out=work, dtype=dtype, casting='unsafe')
+            work *= self.window
+        else:
+            np.multiply(segments, self.window, out=work, casting='unsafe')
+        if is_complex:
+            spectrum = sp_fft.fft(work, axis=1, overwrite_x=True, workers=self.workers)
+        else:
+            spectrum = sp_fft.rfft(work, axis=1, overwrite_x=True, workers=self.workers)
+        power = spectrum.real ** 2
+        power += spectrum.imag ** 2
+        return power
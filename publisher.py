@@ -0,0 +1,225 @@
+import collections
+import threading
+import time
+
+import numpy as np
+
+from definitions import BLOCK_SIZE
+from tools import bcolors
+
+try:
+    from paho.mqtt.client import MQTT_ERR_SUCCESS
+except ImportError:
+    MQTT_ERR_SUCCESS = 0
+
+BACKPRESSURE_POLICIES = ('block', 'drop-newest')
+
+
+class MqttPublisher(object):
+    def __init__(self, client, topic, qos=0, max_inflight_messages=8, max_inflight_bytes=8 * BLOCK_SIZE,
+                 backpressure='block', block_timeout=None, latency_window=1024):
+        """
+        Publishes frames through a paho-mqtt client whose network loop runs
+        on its own thread, with a cap on what is handed to paho but not yet
+        written to the broker.
+
+        Parameters:
+            client:                 connected (or connecting) paho Client
+            topic:                  topic frames are published to
+            qos:                    MQTT QoS of the messages
+            max_inflight_messages:  messages handed to paho and not yet sent
+                                    (qos 0) or acknowledged (qos 1, 2)
+            max_inflight_bytes:     payload bytes allowed in flight
+            backpressure:           what publish() does when a cap is reached:
+                                    'block'       wait for paho to catch up
+                                    'drop-newest' drop the frame being published
+            block_timeout:          seconds 'block' waits before dropping the
+                                    frame (None waits as long as it takes)
+            latency_window:         publish latencies kept for percentiles
+
+        Without the network loop running, paho only queues messages and
+        memory grows until disconnect. Here the loop runs from start() to
+        stop(), and on_publish retires each message, measuring its latency
+        from publish() to the socket write (qos 0) or broker acknowledgement.
+
+        paho copies qos 0 payloads while publishing, so the frame, or the
+        pooled capture it lives in, can be released as soon as publish()
+        returns. Payloads for qos 1 and 2 are kept by paho for
+        retransmission and are copied to bytes first unless they already
+        are bytes."""
+
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError('backpressure must be one of %s.' % ", ".join(BACKPRESSURE_POLICIES))
+        if max_inflight_messages < 1:
+            raise ValueError('max_inflight_messages must be at least 1.')
+        self.client = client
+        self.topic = topic
+        self.qos = qos
+        self.max_inflight_messages = int(max_inflight_messages)
+        self.max_inflight_bytes = int(max_inflight_bytes)
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+
+        self._cond = threading.Condition()
+        self._inflight = {}             # mid -> (bytes, publish time)
+        self._done_early = set()        # mids retired by on_publish before publish() returned them
+        self._inflight_bytes = 0
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._started = False
+
+        # Counters
+        self.published = 0
+        self.published_bytes = 0
+        self.dropped = 0
+        self.lost = 0
+        self.errors = 0
+        self.blocked_time = 0.0
+        self.max_inflight = 0
+
+        client.on_publish = self._on_publish
+        client.on_disconnect = self._on_disconnect
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def inflight(self):
+        with self._cond:
+            return len(self._inflight)
+
+    @property
+    def inflight_bytes(self):
+        with self._cond:
+            return self._inflight_bytes
+
+    def start(self):
+        if not self._started:
+            self.client.loop_start()
+            self._started = True
+
+    def stop(self, timeout=5.0):
+        """Wait up to timeout seconds for messages in flight, then stop the network loop."""
+        self.flush(timeout)
+        if self._started:
+            self.client.loop_stop()
+            self._started = False
+
+    def flush(self, timeout=None):
+        """Wait until nothing is in flight; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def publish(self, payload, release=None):
+        """
+        Publish payload (bytes-like), applying the backpressure policy when
+        the in-flight caps are reached. release(), when given, is called
+        once paho no longer needs the payload, whether it was sent or
+        dropped. Returns True if the message was handed to paho."""
+        size = len(payload) if not isinstance(payload, memoryview) else payload.nbytes
+        try:
+            if not self._wait_for_room(size):
+                self.dropped += 1
+                return False
+            if not isinstance(payload, bytes) and (self.qos > 0 or not isinstance(payload, bytearray)):
+                payload = bytes(payload)
+
+            t0 = time.monotonic()
+            # Count the message before paho sees it: on_publish may run before publish() returns
+            with self._cond:
+                self._inflight_bytes += size
+            info = self.client.publish(self.topic, payload, qos=self.qos)
+            with self._cond:
+                if info.rc != MQTT_ERR_SUCCESS:
+                    self._inflight_bytes -= size
+                    self.errors += 1
+                    self._cond.notify_all()
+                    return False
+                if info.mid in self._done_early:
+                    self._done_early.discard(info.mid)
+                    self._retire(size, t0)
+                else:
+                    self._inflight[info.mid] = (size, t0)
+                    self.max_inflight = max(self.max_inflight, len(self._inflight))
+            return True
+        finally:
+            if release is not None:
+                release()
+
+    def stats(self):
+        with self._cond:
+            latencies = np.array(self._latencies) if self._latencies else None
+            stats = {'published': self.published,
+                     'published_bytes': self.published_bytes,
+                     'dropped': self.dropped,
+                     'lost': self.lost,
+                     'errors': self.errors,
+                     'inflight': len(self._inflight),
+                     'inflight_bytes': self._inflight_bytes,
+                     'max_inflight': self.max_inflight,
+                     'blocked_time': self.blocked_time}
+        for p in (50, 90, 99):
+            stats['latency_p%i' % p] = float(np.percentile(latencies, p)) if latencies is not None else None
+        return stats
+
+    def _wait_for_room(self, size):
+        # True once size more bytes fit in flight (a lone message always fits), False to drop
+        with self._cond:
+            if self._has_room(size):
+                return True
+            if self.backpressure == 'drop-newest':
+                return False
+            t0 = time.monotonic()
+            deadline = None if self.block_timeout is None else t0 + self.block_timeout
+            try:
+                while not self._has_room(size):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self.blocked_time += time.monotonic() - t0
+
+    def _has_room(self, size):
+        if not self._inflight:
+            return True
+        return len(self._inflight) < self.max_inflight_messages and \
+            self._inflight_bytes + size <= self.max_inflight_bytes
+
+    def _retire(self, size, t0):
+        # Called with self._cond held
+        self._latencies.append(time.monotonic() - t0)
+        self.published += 1
+        self.published_bytes += size
+        self._inflight_bytes -= size
+        self._cond.notify_all()
+
+    def _on_publish(self, client, userdata, mid):
+        with self._cond:
+            entry = self._inflight.pop(mid, None)
+            if entry is None:
+                self._done_early.add(mid)
+                return
+            self._retire(*entry)
+
+    def _on_disconnect(self, client, userdata, rc):
+        # qos 0 messages still queued are gone with the connection; do not wait for them
+        with self._cond:
+            if self.qos == 0 and self._inflight:
+                self.lost += len(self._inflight)
+                for size, _ in self._inflight.values():
+                    self._inflight_bytes -= size
+                self._inflight.clear()
+                self._cond.notify_all()
+        if rc != 0:
+            print(bcolors.WARNING + "MQTT connection lost (rc %i), paho reconnects in the background" % rc + bcolors.ENDC)
@@ -3,7 +3,21 @@ import math
 from definitions import *
 import threading
 import time
+import contextlib
+import collections
 from tools import *
+from capture_backends import make_backend
+from validity import BlockValidator
+from receiver_lock import ReceiverLock
+from pll_settle import SettleController
+from scan_planner import plan_scan
+from scan_pipeline import ScanPipeline
+from iq import IqDecoder
+from psd import PsdEngine
+from stitch import SpectrumStitcher
+from agc import AutoGain, GainCache
+from cal_transport import CalibrationTransport, encode_table, parse_header
+import calibration
 import os
 import subprocess
 from scipy import signal
@@ -19,13 +33,20 @@ except ImportError:
 
 # Template for a receiver sensor
 class Receiver(object):
-    def __init__(self, capabilities={}):
+    # Order of scan captures, see scan_planner.SCAN_ORDERS
+    scan_order = 'nearest'
+    # Sample layout of raw captures, see iq.IQ_LAYOUTS
+    iq_layout = 'iq'
+
+    def __init__(self, capabilities={}, lock_policy='fifo'):
         """
         Receiver parameters:
             frequency:     center frequency of sensor
             sample_rate:   sample rate of iq data
             gain:          gain of receiver
-            N_samples:     number of samples to capture"""
+            N_samples:     number of samples to capture
+            lock_policy:   order in which jobs waiting for the receiver are
+                           served, 'fifo' or 'priority' (see receiver_lock.py)"""
         
         # Default values
         defaults = { 'frequency_min': 0,
@@ -50,9 +71,10 @@ class Receiver(object):
         print("sample_rate_max:", self.sample_rate_max)
         self.capabilities = defaults
 
-        self.lock = threading.Lock()
-        self.lock_timestamp = 0
-        self.lock_thread_ident = 0
+        self.lock = ReceiverLock(policy=lock_policy)
+        self.agc = None     # agc.AutoGain used by raw()/scan() with agc=True
+        self.calibration = None     # calibration.Calibration used by scan_spectrum(calibrated=True)
+        self._stitchers = collections.OrderedDict()     # scan_spectrum() stitchers by plan and bin layout
         self.percentComplete = None
         self.last_frequency = None
         self.last_gain = None
@@ -114,6 +136,10 @@ class Receiver(object):
     def close(self):
         # close any open handles
         pass
+
+    def release(self, data):
+        # return a capture buffer obtained from raw() once the consumer is done with it
+        pass
     ###########################################################################
     
     
@@ -121,28 +147,13 @@ class Receiver(object):
     ###########################################################################
     # Sensor functions
     ###########################################################################
-    def capture(self):
-
-        # Check for lock for self.timeout seconds, if we don't get it, bail
-        # This avoids blocking forever waiting on the lock
-        if self.timeout:
-            lock_time = time.time()
-            while self.lock.locked():
-                time.sleep(1)
-                cur_time = time.time()
-                if (cur_time - lock_time > self.timeout):
-                    if self.lock.locked():
-                        s = ("%s timed out by %f seconds when attempting to acquire "+\
-                        "lock for data capture") %\
-                        (self.__class__.__name__, (cur_time - lock_time))
-                        raise RuntimeError(s)      
-                        return
-                    else:
-                        break
+    def capture(self, priority=0):
 
-        self.lock.acquire()
-        data = self._collect_sensor_data()
-        self.lock.release()
+        self._acquire_lock(priority)
+        try:
+            data = self._collect_sensor_data()
+        finally:
+            self.lock.release()
         return data
     
     @property
@@ -155,93 +166,252 @@ class Receiver(object):
     def dt(self):
         return 1.0/self.sample_rate
 
-    def raw(self, center_frequency, gain=1):
+    @property
+    def lock_timestamp(self):
+        # Wall-clock time the current holder took the receiver lock, 0 when free
+        return self.lock.acquired_at
+
+    @property
+    def lock_thread_ident(self):
+        return self.lock.owner_ident
 
-        # Check for lock for self.timeout seconds, if we don't get it, bail
+    def _acquire_lock(self, priority=0):
+        # Wait up to self.timeout seconds for the receiver lock (forever without a timeout), then bail.
         # This avoids blocking forever waiting on the lock
-        if self.timeout:
-            #Check for old lock file 
-            cur_time = time.time()
-            if ( self.lock.locked() and self.lock_timestamp != 0 and cur_time - self.lock_timestamp > MAX_LOCKTIME ):
-                print("Found stale lockfile (set " + str(cur_time - self.lock_timestamp) + " seconds ago).  Removing.")
-                self.lock.release()
-
-            while self.lock.locked():
-                time.sleep(1)
-                cur_time = time.time()
-                if (cur_time - self.lock_timestamp > self.timeout):
-                    if self.lock.locked():
-                        s = ("%s timed out by %f seconds when attempting to acquire "+\
-                        "lock for data capture") %\
-                        (self.__class__.__name__, (cur_time - self.lock_timestamp))
-                        raise RuntimeError(s)      
-                        return
-                    else:
-                        break
+        lock_time = time.time()
+        if not self.lock.acquire(timeout=self.timeout or None, priority=priority):
+            s = ("%s timed out by %f seconds when attempting to acquire "+\
+            "lock for data capture") %\
+            (self.__class__.__name__, (time.time() - lock_time))
+            raise RuntimeError(s)
 
-        with self.lock:
-            self.lock_timestamp = time.time()
-            from threading import current_thread
-            self.lock_thread_ident = current_thread().ident
-            try:
-                data = self._raw(center_frequency,gain)
-            except Exception as err:
-                print("**** FAILED SCAN THREAD **** " + str(err))
-                data = None
+    def raw(self, center_frequency, gain=1, priority=0, agc=False):
+
+        self._acquire_lock(priority)
+        try:
+            data = self._raw(center_frequency,gain,agc)
+        except Exception as err:
+            print("**** FAILED SCAN THREAD **** " + str(err))
+            data = None
+        finally:
+            self.lock.release()
 
         return data
 
 
-    def _raw(self,center_frequency,gain):
+    @contextlib.contextmanager
+    def stream(self, center_frequency, gain=1, max_blocks=None, duration=None, priority=0):
+        """
+        Capture back-to-back blocks at one tuning. The receiver lock is taken
+        and the hardware configured once on entry; the yielded iterator then
+        returns blocks until max_blocks or duration (seconds) is reached, or
+        until the with block is left. Other jobs wait for the lock meanwhile.
+
+            with sensor.stream(1.625e9, 1, duration=10) as blocks:
+                for block in blocks:
+                    ...
+                    sensor.release(block)"""
+        self._acquire_lock(priority)
+        try:
+            self.frequency = center_frequency
+            self.gain = gain
+            self.N_samples = int(getattr(self, '_capture_size', BUFFER_SIZE))
+            blocks = self._stream_blocks(max_blocks, duration)
+            try:
+                yield blocks
+            finally:
+                blocks.close()
+        finally:
+            self.lock.release()
+
+    def _stream_blocks(self, max_blocks, duration):
+        deadline = None if duration is None else time.monotonic() + duration
+        count = 0
+        source = self._collect_sensor_data_stream()
+        try:
+            for block in source:
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.release(block)
+                    break
+                yield block
+                count += 1
+                if max_blocks is not None and count >= max_blocks:
+                    break
+        finally:
+            source.close()
+
+    def _collect_sensor_data_stream(self):
+        # Generic fallback: one full raw capture per block
+        while True:
+            yield self._collect_sensor_data_raw()
+
+    def _collect_sensor_data_sweep(self, frequencies):
+        # Generic fallback: retune and capture at each center frequency in turn.
+        # Yields (center frequency actually used, data).
+        for f_c in frequencies:
+            self.frequency = np.float64(f_c)
+            yield f_c, self._collect_sensor_data()
+
+    def _collect_sensor_data_agc(self, frequencies, gain):
+        # Per-step capture with the gain settled by self.agc, starting from its cached gain
+        self._require_agc()
+        for f_c in frequencies:
+            yield f_c, self.agc.capture(self, self._collect_sensor_data, np.float64(f_c), gain)
+
+    def _require_agc(self):
+        if self.agc is None:
+            raise ValueError('%s has no automatic gain control.' % self.__class__.__name__)
+
+    def _raw(self,center_frequency,gain,agc=False):
         self.frequency = center_frequency
         self.gain = gain
-        self.N_samples = int(BUFFER_SIZE)          # Here the N_smamples is the number of complex samples, and the buffer size is the number of real samples/bytes, so we need to divide by 2. This is radiohound specific, not sure how we are going to generalize this.
+        self.N_samples = int(getattr(self, '_capture_size', BUFFER_SIZE))          # N_samples counts the bytes of one capture; iq_decoder.n_samples() gives the number of decoded samples for iq_layout.
+        if agc:
+            self._require_agc()
+            return self.agc.capture(self, self._collect_sensor_data_raw, center_frequency, gain)
         return self._collect_sensor_data_raw()
 
+    @property
+    def iq_decoder(self):
+        # Decoder for this receiver's raw captures, created on first use
+        decoder = self.__dict__.get('_iq_decoder')
+        if decoder is None or decoder.layout != self.iq_layout:
+            decoder = self._iq_decoder = IqDecoder(self.iq_layout)
+        return decoder
+
+    def raw_iq(self, center_frequency, gain=1, out=None, priority=0):
+        """
+        raw() decoded to samples (complex64 for the 'iq' layout, float32 for
+        'real') in volts, written to out when given so it can be reused
+        across calls. The raw buffer is released once decoded. Returns None
+        when raw() got no data."""
+        data = self.raw(center_frequency, gain, priority=priority)
+        if data is None:
+            return None
+        try:
+            return self.iq_decoder.decode(data, out)
+        finally:
+            self.release(data)
+
 
     def _collect_sensor_data_raw():
         pass
 
     def scan(self,frequency_start,frequency_end,
              N_samples=None,rbw=None,
-             ibw=None,sample_rate=None, gain=1, sensor=None, debug=0):
+             ibw=None,sample_rate=None, gain=1, sensor=None, debug=0, priority=0,
+             process=None, agc=False):
 
-        # Check for lock for self.timeout seconds, if we don't get it, bail
-        # This avoids blocking forever waiting on the lock
-        if self.timeout:
-            #Check for old lock file 
-            cur_time = time.time()
-            if ( self.lock.locked() and self.lock_timestamp != 0 and cur_time - self.lock_timestamp > MAX_LOCKTIME ):
-                print("Found stale lockfile (set " + str(cur_time - self.lock_timestamp) + " seconds ago).  Removing.")
-                self.lock.release()
-
-            while self.lock.locked():
-                time.sleep(1)
-                cur_time = time.time()
-                if (cur_time - self.lock_timestamp > self.timeout):
-                    if self.lock.locked():
-                        s = ("%s timed out by %f seconds when attempting to acquire "+\
-                        "lock for data capture") %\
-                        (self.__class__.__name__, (cur_time - self.lock_timestamp))
-                        raise RuntimeError(s)      
-                        return
-                    else:
-                        break
-
-        with self.lock:
-            self.lock_timestamp = time.time()
-            from threading import current_thread
-            self.lock_thread_ident = current_thread().ident
+        self._acquire_lock(priority)
+        try:
             data = self._scan(frequency_start,frequency_end,
                             N_samples,rbw,
-                            ibw,sample_rate, gain=gain, sensor=sensor, debug=debug)
+                            ibw,sample_rate, gain=gain, sensor=sensor, debug=debug, process=process, agc=agc)
+        finally:
+            self.lock.release()
 
 
         return data
               
+    def scan_iter(self, frequency_start, frequency_end,
+                  N_samples=None, rbw=None,
+                  ibw=None, sample_rate=None, gain=1, sensor=None, reducer=None, priority=0, agc=False):
+        """
+        Generator version of scan(): yields (f_lims, iq) for each segment as
+        soon as it is captured, in capture order, so only one segment has to
+        be held at a time. Parameters are those of scan().
+
+        reducer(f_lims, iq), e.g. a PSD, replaces iq in what is yielded and
+        the raw capture is released right after it; it must copy whatever
+        it keeps of iq. Without a reducer, pass each iq to release() when
+        done with it.
+
+        The receiver lock is held from the first segment until the generator
+        is exhausted or closed, so close it (or use contextlib.closing) when
+        stopping early. percentComplete is updated as segments are yielded."""
+        self._acquire_lock(priority)
+        try:
+            plan = self._scan_setup(frequency_start, frequency_end, N_samples, rbw,
+                                    ibw, sample_rate, gain, sensor)
+            for f_lims, y in self._scan_segments(plan, agc):
+                if reducer is not None:
+                    try:
+                        reduced = reducer(f_lims, y)
+                    finally:
+                        self.release(y)
+                    y = reduced
+                yield f_lims, y
+        finally:
+            self.lock.release()
+
+    def scan_spectrum(self, frequency_start, frequency_end,
+                      N_samples=None, rbw=None,
+                      ibw=None, sample_rate=None, gain=1, psd_engine=None, overlap='mean', out=None, priority=0,
+                      agc=False, calibrated=False):
+        """
+        Sweep like scan() and return one stitched spectrum as (frequencies,
+        psd) arrays instead of a list of segments. Each segment goes through
+        psd_engine (a psd.PsdEngine, default: defaultNfft/defaultWindow at
+        the scan's sample rate) as it is captured, is trimmed to the usable
+        band f_min..f_max and lands in one frequency-ordered array; bins
+        seen by several segments are combined by overlap ('mean' or 'max').
+        See stitch.SpectrumStitcher; one is kept per segment and bin
+        layout, so repeating a sweep, in either direction, reuses its
+        output layout.
+
+        With calibrated, the spectrum is referred to the antenna through
+        self.calibration: one multiply of the stitched spectrum, or one per
+        segment with agc, whose segments differ in gain."""
+        if calibrated and self.calibration is None:
+            raise ValueError('%s has no calibration table loaded.' % self.__class__.__name__)
+        engine = psd_engine if psd_engine is not None else \
+            PsdEngine(sample_rate=sample_rate if sample_rate is not None else self.sample_rate)
+        decoded = []
+
+        def reducer(f_lims, y):
+            if self.iq_layout == 'iq':
+                if not decoded or len(decoded[0]) < self.iq_decoder.n_samples(y):
+                    decoded[:] = [self.iq_decoder.empty(self.iq_decoder.n_samples(y))]
+                y = self.iq_decoder.decode(y, decoded[0])
+            return engine.psd(y)
+
+        def calibrated_reducer(f_lims, y):
+            psd = reducer(f_lims, y)
+            return self.calibration.apply(psd, f_lims[0] + bin_offsets(), self.gain, out=psd)
+
+        def bin_offsets():
+            if self.iq_layout == 'iq':
+                return engine.frequencies(True) + self.scan_plan.ibw / 2.0
+            return engine.frequencies()
+
+        stitcher = key = None
+        for f_lims, psd in self.scan_iter(frequency_start, frequency_end, N_samples, rbw, ibw, sample_rate,
+                                          gain=gain, reducer=calibrated_reducer if calibrated and agc else reducer,
+                                          priority=priority, agc=agc):
+            if stitcher is None:
+                plan = self.scan_plan
+                offsets = bin_offsets()
+                # Sorted, so the same ranges swept up or down (scan_order 'nearest') share one layout
+                edges = np.sort(plan.centers) - plan.ibw / 2.0
+                key = (edges.tobytes(), overlap, self.f_min, self.f_max, offsets.tobytes())
+                # Taken out of the cache while in use, so a concurrent sweep builds its own
+                stitcher = self._stitchers.pop(key, None)
+                if stitcher is None:
+                    stitcher = SpectrumStitcher(offsets, self.f_min, self.f_max, overlap)
+                stitcher.reset(edges)
+            stitcher.add(f_lims, psd)
+        frequencies, spectrum = stitcher.result(out)
+        self._stitchers[key] = stitcher
+        if len(self._stitchers) > STITCHER_CACHE_SIZE:
+            self._stitchers.popitem(last=False)
+        if calibrated and not agc:
+            self.calibration.apply(spectrum, frequencies, self.gain, out=spectrum)
+        return frequencies, spectrum
+
     def _scan(self, frequency_start, frequency_end,
               samples_per_capture=None, rbw=None,  # Must specify either N_samples or rbw
-              ibw=None, sample_rate=None, gain=1, sensor=None, debug=0): # can limit ibw/sample rate as desired):
+              ibw=None, sample_rate=None, gain=1, sensor=None, debug=0, # can limit ibw/sample rate as desired
+              process=None, agc=False):
         """
         Captures a contiguous slice of spectrum between frequency_start and
         frequency_end; if the requested slice exceeds the sensor's maximum ibw
@@ -254,8 +424,85 @@ class Receiver(object):
         If frequency_start and frequency_end are supplied as arrays then the
         operation described above will take place for each frequency
         start/end pair.
+        Overlapping or adjacent pairs are merged and captured once (see
+        plan_scan), and one list of (f_lims, iq) is returned per pair; a
+        capture covering several pairs is the same object in each of their
+        lists, so anything done per capture must go by identity.
+        If process is given, process(f_lims, iq) runs on a worker thread
+        while the receiver retunes and captures the next segment, and its
+        result replaces iq in the returned tuples (order is unchanged).
+        With agc, every segment is captured at the gain the receiver's
+        agc.AutoGain settles on, starting from the gain cached for that
+        frequency, instead of the fixed gain.
+        Without process, captures from a buffer pool are copied to bytes and
+        their buffers handed back at once, so a sweep longer than the pool
+        never exhausts it and nothing returned needs release().
         Returns iq data."""
 
+        plan = self._scan_setup(frequency_start, frequency_end, samples_per_capture, rbw,
+                                ibw, sample_rate, gain, sensor)
+
+        # With a process callback, segment N is post-processed on a worker
+        # while the sweep already retunes for segment N+1
+        pipeline = ScanPipeline(process, release=self.release) if process is not None else None
+        captures = []
+        try:
+            for f_lims, y in self._scan_segments(plan, agc):
+                if pipeline is not None:
+                    pipeline.submit(len(captures), f_lims, y)
+                    captures.append(None)
+                else:
+                    captures.append((f_lims, self._detach(y)))
+            if pipeline is not None:
+                captures = pipeline.finish(len(captures))
+                self.pipeline_stats = pipeline.stats()
+        finally:
+            if pipeline is not None:
+                pipeline.close()
+
+        # One list of (f_lims, y) per requested range, ascending in frequency
+        data_all = [[captures[i] for i in members] for members in plan.members]
+        if np.ndim(frequency_start) != 0:
+            return data_all
+        return data_all[0]
+
+    def _detach(self, data):
+        # Copy of a pooled capture, with the pool buffer handed back right away.
+        # Captures a caller keeps (a plain scan() result) must not pin the pool.
+        pool = getattr(self, 'pool', None)
+        if pool is None or not isinstance(data, memoryview) or not pool.owns(data):
+            return data
+        try:
+            return bytes(data)
+        finally:
+            self.release(data)
+
+    def _scan_setup(self, frequency_start, frequency_end, samples_per_capture, rbw,
+                    ibw, sample_rate, gain, sensor):
+        # Validate the scan parameters, configure the receiver and return the plan to run
+        samples_per_capture, ibw, rbw = self._scan_parameters(frequency_start, frequency_end,
+                                                              samples_per_capture, rbw, ibw, sample_rate)
+
+        # Set gain variable
+        self.gain = gain
+
+        # Several f_start/f_end pairs are merged into one plan, so overlapping
+        # ranges are captured once and the whole job shares gain and sensor.
+        plan = self._plan(frequency_start, frequency_end, ibw, rbw)
+        print("Frequency start:", frequency_start)
+        print("ibw:", ibw)
+        print("Scan plan:", plan.summary())
+
+        # configure sensor and capture data set(s)
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        self.N_samples = samples_per_capture
+        self.sensor = sensor
+        self.scan_plan = plan
+        return plan
+
+    def _scan_parameters(self, frequency_start, frequency_end, samples_per_capture, rbw, ibw, sample_rate):
+        # (samples_per_capture, ibw, rbw) for a scan, whichever of them the caller gave
         # check for incompatible parameter settings
         try:
             f_s_length = len(frequency_start)
@@ -280,22 +527,6 @@ class Receiver(object):
                              'as these parameters control the same underlying ' + \
                              'hardware configuration.')
 
-        # Set gain variable
-        self.gain = gain
-
-        # In the case that the user specifies several f_start/f_end pairs,
-        # recursively call this function with each pair as an argument.
-        # Otherwise, proceed with the scan.
-        if f_s_length != 0:
-            data_all = []
-            for i in range(f_s_length):
-                args = {'frequency_start': frequency_start[i],
-                        'frequency_end': frequency_end[i],
-                        'N_samples': samples_per_capture, 'rbw': rbw,
-                        'ibw': ibw, 'sample_rate': sample_rate, 'debug':debug}
-                data_all.append(self._scan(**args))
-            return data_all
-
         # determine ibw based on input parameters
         if ibw is None and sample_rate is None:
             ibw = self.ibw_max
@@ -321,58 +552,38 @@ class Receiver(object):
         elif samples_per_capture is not None and rbw is None:
             rbw = ibw / samples_per_capture
         samples_per_capture = np.min((self.N_samples_max, samples_per_capture)) # seems duplicated with the setter of N_samples, suggest to remove this line
-
-        print("Frequency start:", frequency_start)
-        f_c = frequency_start + ((ibw // 2) - 0)  # 0 is where ubw1 will go
-        # if f_c < 1e9:
-        #     f_c = frequency_start - ((ibw // 2) - 0)  # 0 is where ubw2 will go
-        print("ibw:", ibw)
-        print("f_c:", f_c)
-        f_span = frequency_end - frequency_start
-
-        # configure sensor and capture data set(s)
-        self.sample_rate = sample_rate
-        self.N_samples = samples_per_capture
-        self.sensor = sensor
-        if f_span <= ibw:
-            print("f_c:", f_c)
-            self.frequency = np.float64(f_c)
-            y = self._collect_sensor_data()
-            print("y:", type(y))
-            if isinstance(y, np.ndarray):
-                print("y size:", y.shape)
-            if y is None:
-                raise Exception("Failed to collect sensor data.")
-            else:
-                f_lims = (f_c - ibw / 2.0, f_c + ibw / 2.0)
-                print("f_lims:", f_lims)
-                return [(f_lims, y), ]
-        else:
-            # generates a smallest list of center frequencies f_arr such that
-            # the desired frequency range (frequency_start to frequency_end)
-            # is a subset of {x: f-ibw/2 <= x <= f+ibw/2, for all f in f_arr}
-            N = int(np.ceil(f_span / (1.0 * ibw)))
-            f_arr = np.array([f_c + i * (ibw + rbw) for i in range(N)])
-            # iterate over f_arr to capture iq that includes desired frequency
-            # range
-            data = []
-            loops = 0
-            f_arrLength = len(f_arr)
-            for f_c in f_arr:
-                self.frequency = np.float64(f_c)
-                y = self._collect_sensor_data()
+        return samples_per_capture, ibw, rbw
+
+    def _scan_segments(self, plan, agc=False):
+        # Yields (f_lims, y) for each capture of the plan, in capture order
+        self.percentComplete = 0
+        loops = 0
+        for run in plan.runs:
+            # A hardware sweep runs at one gain, so AGC captures step by step
+            segments = self._collect_sensor_data_agc(run, self.gain) if agc else self._collect_sensor_data_sweep(run)
+            for f_c, y in segments:
                 if y is None:
                     self.percentComplete = 1
                     raise Exception("Failed to collect sensor data.")
-                else:
-                    f_lims = (f_c - ibw / 2.0, f_c + ibw / 2.0)
-                    data.append((f_lims, y))
-                    loops = loops + 1
-                    self.percentComplete = float(loops) / f_arrLength
-                    from threading import current_thread
-                    print(("[" + str(current_thread().ident) + "] Scanning... " + str(
+                loops = loops + 1
+                self.percentComplete = float(loops) / len(plan)
+                if len(plan) > 1:
+                    print(("[" + str(threading.current_thread().ident) + "] Scanning... " + str(
                         int(round(self.percentComplete * 100))) + "% complete"))
-            return data
+                yield (f_c - plan.ibw / 2.0, f_c + plan.ibw / 2.0), y
+
+    def plan_scan(self, frequency_start, frequency_end, N_samples=None, rbw=None, ibw=None, sample_rate=None):
+        """
+        Frequency plan scan() would execute for these ranges and parameters
+        (as in scan(), give N_samples or rbw), see scan_planner.ScanPlan.
+        Useful to see what a job costs before running it; nothing is tuned."""
+        _, ibw, rbw = self._scan_parameters(frequency_start, frequency_end, N_samples, rbw, ibw, sample_rate)
+        return self._plan(frequency_start, frequency_end, ibw, rbw)
+
+    def _plan(self, frequency_start, frequency_end, ibw, rbw):
+        # Memoized plan in this receiver's scan order, starting near its current tuning
+        return plan_scan(frequency_start, frequency_end, ibw, rbw, order=self.scan_order,
+                         from_frequency=self.last_frequency)
 
     def calcSuggestedGain(self,Pn=None):
 
@@ -395,64 +606,156 @@ class Receiver(object):
 
 
 class RadioHoundSensorV3(Receiver):    
-    def __init__(self, capabilities={}):
+    def __init__(self, capabilities={}, backend=None, buffer_size=None, block_size=BLOCK_SIZE,
+                 pool_size=BUFFER_POOL_SIZE, validity_check='full', dev_path=BEAGLELOGIC_DEV,
+                 sysfs_path=BEAGLELOGIC_SYSFS, spi=None, hardware_checks=None, lock_policy='fifo',
+                 hardware_sweep=None, iq_layout='real', agc_cache=AGC_GAIN_CACHE_FILE,
+                 calibration_file=calFileCache, board_id=None):
+        """
+        backend:         capture backend, one of capture_backends.BACKENDS
+                         (os_read, fast_read, pool, mmap). None uses the
+                         key_capture_backend entry of the local config file.
+        buffer_size:     bytes per read, or the size of the mapped ring for the
+                         mmap backend. None uses the backend's default.
+        block_size:      size of one ring block for the mmap backend.
+        pool_size:       number of preallocated buffers for the pool backend,
+                         whose captures are memoryviews that must be handed
+                         back with release().
+        validity_check:  how captured blocks are tested for all-zero data,
+                         one of validity.VALIDITY_CHECKS.
+        dev_path:        beaglelogic character device.
+        sysfs_path:      beaglelogic sysfs directory (with trailing slash).
+        spi:             object with xfer2() connected to the MSP; None opens
+                         SPI(1,0).
+        hardware_checks: run validate() and the beaglelogic driver check.
+                         None runs them only on a BeagleBone.
+
+        lock_policy:     'fifo' or 'priority' ordering of jobs waiting for
+                         the receiver lock.
+        hardware_sweep:  tune evenly spaced scan frequencies with MSP
+                         "multi" frames (one per step, carrying the rest
+                         of the sweep) instead of "single" retunes. None
+                         enables it only for MSP versions in
+                         MSP_SWEEP_VERSIONS. Turned off automatically if
+                         PLL lock detect shows the MSP ignored the frame.
+        iq_layout:       sample layout of the ADC data for raw_iq() and
+                         iq_decoder: 'real' (one 8-bit sample per byte,
+                         as the 24 MHz usable bandwidth of the 48 MS/s ADC
+                         implies) or 'iq' (interleaved I/Q bytes).
+        agc_cache:       file the converged AGC gain of each frequency bin
+                         is kept in for raw()/scan() with agc=True;
+                         None keeps it in memory only.
+        calibration_file: calibration table (cached from the MSP) loaded
+                         into self.calibration for scan_spectrum(calibrated=True);
+                         None, a missing file or a table for another
+                         board leaves scans uncalibrated.
+        board_id:        board the calibration table must belong to; None
+                         takes it from the table in MSP memory (see
+                         mspBoardId).
+
+        dev_path, sysfs_path and spi can point at the stand-ins in
+        simulation.py to run without a RadioHound attached."""
 
         # Check the RH version
         rh_version = "3.6"
         capabilities = self.get_capabilities(rh_version)
 
-        if not subprocess.check_call(["/bin/grep -q BeagleBoard /etc/issue"], shell=True):
+        if hardware_checks is None:
+            hardware_checks = check_beagle()
+        validate_output = {}
+        if hardware_checks:
             #print("Validating Configuration...")
             validate_output, validate_failure = self.validate()
             if validate_failure:
                 raise Exception(" ".join(validate_failure))
         
-        Receiver.__init__(self,capabilities=capabilities)
+        Receiver.__init__(self,capabilities=capabilities,lock_policy=lock_policy)
         self.f_low = 0
         self.f_high = 24e6
         
 
         self.capabilities.update(validate_output)
 
+        self.validator = BlockValidator(validity_check)
+        self.backend = make_backend(backend, dev_path=dev_path, sysfs_path=sysfs_path, buffer_size=buffer_size,
+                                    block_size=block_size, pool_size=pool_size, validator=self.validator)
+        self.sysfs_path = sysfs_path
+        print(strformat % "Capture backend:", self.backend.name)
 
         # default values
         self._frequency = 1e9
         self._sample_rate = 48e6
         self._gain = 1  #dB
-        self._buffer_size = BUFFER_SIZE
-        self._N_samples = int(self._buffer_size)
+        self._buffer_size = self.backend.buffer_size
+        # Bytes delivered per capture: one ring block for mmap, one read otherwise
+        self._capture_size = getattr(self.backend, 'block_size', self._buffer_size)
+        self._N_samples = int(self._capture_size)
+
+        # Wait after retunes polls PLL lock detect instead of sleeping a fixed time
+        self.settle = SettleController(lock_probe=self.pllLocked)
+        if hardware_sweep is None:
+            hardware_sweep = self.capabilities.get('msp_version') in MSP_SWEEP_VERSIONS
+        self.hardware_sweep = hardware_sweep
+        self.iq_layout = iq_layout
 
         self._gainlst = np.arange(-5,41,3)                                    #  valid VGA gain: range of -5, 40 with steps of 3
         self._targetPower = 0.512**2/2.0/2.0                                  # Assume the target power is 3 dB away from the maximum power of a sin wave without saturation
         self.suggested_gain = 1
-        try:
-            # For Adafruit_BBIO v1.1.1 to use spidev1.0, use SPI(1,0). If using Adafruit_BBIO v1.0.3, change to SPI(0,0).
-            self.spi = SPI(1,0)
-            self.spi.cshigh = True
-            self.spi.lsbfirst = False
-            self.spi.bpw = 8
-            self.spi.mode = 0b01
-            self.spi.threewire = False
-            self.spi.msh = int(125000)
-        except:
-            print(bcolors.WARNING + "SPI module initialization error, this will prevent " + \
-            " the MSP communication with BeagleBone"  + bcolors.ENDC)
+        self.agc = AutoGain(GainCache(agc_cache))
+        if spi is not None:
+            self.spi = spi
+        else:
+            try:
+                # For Adafruit_BBIO v1.1.1 to use spidev1.0, use SPI(1,0). If using Adafruit_BBIO v1.0.3, change to SPI(0,0).
+                self.spi = SPI(1,0)
+                self.spi.cshigh = True
+                self.spi.lsbfirst = False
+                self.spi.bpw = 8
+                self.spi.mode = 0b01
+                self.spi.threewire = False
+                self.spi.msh = int(125000)
+            except:
+                print(bcolors.WARNING + "SPI module initialization error, this will prevent " + \
+                " the MSP communication with BeagleBone"  + bcolors.ENDC)
+
+        if calibration_file is not None:
+            self.calibration = self._loadCalibration(calibration_file, board_id)
 
         # Check if the ADC driver version is as expected, i.e., containing "_RH?". If yes, set continuous flag and setattribute, open the device; otherwise, open the device for each time.
 
-        output = subprocess.check_output("/sbin/modinfo beaglelogic", shell=True, text=True)
+        if hardware_checks:
+            output = subprocess.check_output("/sbin/modinfo beaglelogic", shell=True, text=True)
         
         self.continousflag = True
 
-        subprocess.call(["echo 1 > /sys/devices/virtual/misc/beaglelogic/triggerflags"],shell=True)
+        # Continuous capture (the driver requires the device to be opened only once)
+        try:
+            with open(self.sysfs_path + "triggerflags", "w") as fp:
+                fp.write("1")
+        except OSError as e:
+            print(bcolors.WARNING + "Unable to set beaglelogic triggerflags: " + str(e) + bcolors.ENDC)
         print("ADC driver: New. Open ADC device only once.")
 
-        try:
-            self.dev = os.open("/dev/beaglelogic", os.O_RDONLY)
-            self.fdev = os.fdopen(self.dev)
-        except OSError:
-            print(bcolors.WARNING + "Device /dev/beaglelogic cannot be opened" + bcolors.ENDC)
+        self.backend.open()
+
+    @property
+    def scan_order(self):
+        # The MSP multi sweep only steps upwards
+        return 'ascending' if self.hardware_sweep else 'nearest'
+
+    @property
+    def pool(self):
+        # Buffer pool of the pool backend, None for backends that allocate per capture
+        return getattr(self.backend, 'pool', None)
+
+    @property
+    def last_block_seqs(self):
+        # Ring sequence numbers of the blocks returned by the last mmap capture
+        return getattr(self.backend, 'last_block_seqs', [])
 
+    @property
+    def overruns(self):
+        return getattr(self.backend, 'overruns', 0)
 
     @property
     def gain(self):
@@ -674,17 +977,96 @@ class RadioHoundSensorV3(Receiver):
         if N_samples!=None:
             self.N_samples = N_samples
 
+    def _collect_sensor_data(self):
+        return self.captureBinaryIQ()
+
     def _collect_sensor_data_raw(self):
         return self.captureBinaryIQ()
     
     def captureBinaryIQ(self):
+        self.configureMsp()
+
+        rawData = self.readAdcIq()
+        if rawData is None:
+            raise Exception("****Failed to get IQ samples: No valid ADC data received")
+        else:
+            return rawData
+
+    def _collect_sensor_data_stream(self):
+        # Configure the MSP once, then read back-to-back
+        self.configureMsp()
+        failures = 0
+        while True:
+            rawData = self.readAdcIq()
+            if rawData is None:
+                failures += 1
+                if failures >= 10:
+                    raise Exception("****Failed to get IQ samples: No valid ADC data received")
+                continue
+            failures = 0
+            if isinstance(rawData, list):
+                for block in rawData:
+                    yield block
+            else:
+                yield rawData
+
+    def _collect_sensor_data_sweep(self, frequencies):
+        # Evenly spaced frequencies go to the MSP as "multi" frames; anything else is retuned step by step
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        plan = self._sweepPlan(frequencies) if self.hardware_sweep else None
+        if plan is None:
+            for item in Receiver._collect_sensor_data_sweep(self, frequencies):
+                yield item
+            return
+
+        fcStart, fcStop, stepSize = plan
+        for step in range(len(frequencies)):
+            # A multi frame only says where the sweep starts, so each step restarts it at its own
+            # frequency with the rest of the run still ahead in fcStop and stepSize
+            khz = fcStart + step * stepSize
+            responseMSP = self.mspCommandBeagle("multi", self._gain, khz, fcStop, stepSize)
+            if responseMSP != 0:
+                raise Exception("****Failed to communicate with MSP: Error code {}".format(responseMSP))
+            if step == 0 and self.settle.probe_verified and khz * 1e3 != self.last_frequency and self.pllLocked():
+                # A retune drops lock, so a PLL still locked right after the frame never saw it
+                print(bcolors.WARNING + "MSP ignored the multi sweep, retuning per step instead" + bcolors.ENDC)
+                self.hardware_sweep = False
+                for item in Receiver._collect_sensor_data_sweep(self, frequencies):
+                    yield item
+                return
+            delta = None if self.last_frequency is None else khz * 1e3 - self.last_frequency
+            self.settle.wait('retune', delta)
+            self._frequency = khz * 1e3
+            self.last_frequency = self._frequency
+            self.last_gain = self._gain
+            rawData = self.readAdcIq()
+            if rawData is None:
+                raise Exception("****Failed to get IQ samples: No valid ADC data received")
+            yield self._frequency, rawData
+
+    def _sweepPlan(self, frequencies):
+        # (fcStart, fcStop, stepSize) in kHz, or None if the frequencies cannot be swept by the MSP
+        if len(frequencies) < 2:
+            return None
+        steps = np.diff(frequencies)
+        stepSize = int(round(steps[0] / 1e3))
+        if stepSize <= 0 or stepSize > 0xFFFF or not np.allclose(steps, steps[0], rtol=0, atol=500):
+            return None
+        fcStart = int(round(frequencies[0] / 1e3))
+        return fcStart, fcStart + stepSize * (len(frequencies) - 1), stepSize
+
+    def configureMsp(self):
+        # Send the retune or gain command only when the setting differs from the last one applied
         if not (self._frequency == self.last_frequency):
             responseMSP = self.mspCommandBeagle("single", self._gain, int(self._frequency/1e3))
             print("MSP config response:", responseMSP)
-            time.sleep(0.05)  
+            if responseMSP == 0:
+                delta = None if self.last_frequency is None else self._frequency - self.last_frequency
+                self.settle.wait('retune', delta)
         elif (self._gain != self.last_gain and self._frequency == self.last_frequency):
             responseMSP = self.mspCommandBeagle("setGain", self._gain)
-            time.sleep(0.05)
+            if responseMSP == 0:
+                self.settle.wait('gain')
         else:
             responseMSP = 0
 
@@ -694,19 +1076,53 @@ class RadioHoundSensorV3(Receiver):
         if responseMSP != 0:
             raise Exception("****Failed to communicate with MSP: Error code {}".format(responseMSP))
         
-        rawData = self.readAdcIq()
-        if rawData is None:
-            raise Exception("****Failed to get IQ samples: No valid ADC data received")
-        else:
-            return rawData
-        
+
+    def pllLocked(self):
+        # PLL lock detect, None when the MSP returns nothing to read it from
+        if self.mspCommandBeagle("readPLLReg", regAddress=PLL_LOCK_REG) != 0:
+            return None
+        rbuf = getattr(self, 'pllReadback', None)
+        if not rbuf or len(rbuf) < 2:
+            return None
+        return bool(rbuf[1] & PLL_LOCK_MASK)
+
+    def mspBoardId(self, table=None):
+        """
+        board_id of the calibration table in MSP memory, None when the MSP
+        holds no table or cannot be read. When table (e.g. the cached copy)
+        is what the MSP holds, as the container CRC shows, its board_id is
+        returned without reading the whole memory."""
+        try:
+            transport = CalibrationTransport(spi=self.spi)
+            if table is not None:
+                header = transport.read_header()
+                if header is not None and header[3] == parse_header(encode_table(table))[3]:
+                    return table.get(calibration.CAL_KEY_BOARD_ID)
+            msp_table = transport.read_table()
+        except Exception as e:
+            print(bcolors.WARNING + "Unable to read the MSP calibration memory: " + str(e) + bcolors.ENDC)
+            return None
+        if not isinstance(msp_table, dict):
+            return None
+        return msp_table.get(calibration.CAL_KEY_BOARD_ID)
+
+    def _loadCalibration(self, path, board_id=None):
+        # Calibration for the table at path if it belongs to this board, None otherwise
+        try:
+            cal = calibration.load(path, msp_version=self.capabilities.get('msp_version'))
+            if board_id is None:
+                board_id = self.mspBoardId(cal.table)
+            if board_id is None:
+                print(bcolors.WARNING + "Board id unknown, calibration table " + path + \
+                " is not checked against this board" + bcolors.ENDC)
+            return cal.validate(board_id=board_id)
+        except (calibration.CalibrationError, ValueError) as e:
+            print(bcolors.WARNING + "Scans will be uncalibrated: " + str(e) + bcolors.ENDC)
+            return None
 
     def findActualGain(self):
-        # VGA gain set by the digital interface
-        vgaGainSet = int((self._gain+5)/3)*3 - 5
-        gainActual = vgaGainSet + IFAMPGAINV3
-        #print "The total gain (dB) is :", gainActual
-        return gainActual
+        # VGA gain set by the digital interface plus the fixed IF amp gain
+        return calibration.actual_gain(self._gain)
 
 
     # MSP commands to hardware
@@ -723,7 +1139,7 @@ class RadioHoundSensorV3(Receiver):
         # regVal: Value to be written to PLL register
         # debugPath: 0 for low-frequency path, 1 for high-frequency path
 
-        # TODO: Impement modes other than "single", "debug", and "readPLLReg"
+        # TODO: Impement modes other than "single", "multi", "debug", and "readPLLReg"
 
         try:
             self.spi
@@ -763,8 +1179,30 @@ class RadioHoundSensorV3(Receiver):
             self.spi.xfer2(tbuf)
 
         elif mode=="multi":
+            # Sweep from fcStart to fcStop in stepSize kHz steps; the MSP tunes to fcStart first
             ctrlByte = 0b00000010   #0x02
-            pass
+            if fcStop is None or stepSize is None or stepSize <= 0 or stepSize > 0xFFFF or fcStop < fcStart:
+                print(("Error, Invalid sweep. fcStart {}, fcStop {}, stepSize {}".format(fcStart, fcStop, stepSize)))
+                return 3
+            fcStart1 = (fcStart >> 24) & 0b11111111
+            fcStart2 = (fcStart >> 16) & 0b11111111
+            fcStart3 = (fcStart >> 8) & 0b11111111
+            fcStart4 = fcStart & 0b11111111
+            fcStop1 = (fcStop >> 24) & 0b11111111
+            fcStop2 = (fcStop >> 16) & 0b11111111
+            fcStop3 = (fcStop >> 8) & 0b11111111
+            fcStop4 = fcStop & 0b11111111
+            stepSize1 = (stepSize >> 8) & 0b11111111
+            stepSize2 = stepSize & 0b11111111
+            vgaGainBin = int((vgaGain +5)/3) & 0b00001111
+            fillerByte = 0b11111111
+
+            tbuf = [ctrlByte,\
+                    fcStart1,fcStart2,fcStart3,fcStart4,\
+                    fcStop1,fcStop2,fcStop3,fcStop4,\
+                    stepSize1,stepSize2,\
+                    vgaGainBin,fillerByte]
+            self.spi.xfer2(tbuf)
 
         elif mode=="setGain":
             ctrlByte = 0b00000100   #0x04
@@ -791,9 +1229,8 @@ class RadioHoundSensorV3(Receiver):
                     fillerByte,fillerByte,fillerByte,fillerByte,\
                     fillerByte,fillerByte,\
                     fillerByte,fillerByte]
-            print(("Bytes sent to MSP: {}".format(tbuf)))
-            self.spi.xfer2(tbuf)
-            print(("Bytes received from MSP: {}".format(tbuf)))
+            # Bytes read back are kept for pllLocked(); it polls this mode, so nothing is printed
+            self.pllReadback = self.spi.xfer2(tbuf)
 
         elif mode=="writePllReg":
             ctrlByte = 0b00010000   #0x10
@@ -906,36 +1343,15 @@ class RadioHoundSensorV3(Receiver):
 
 
     def readAdcIq(self):
-        # —— 只在第一次打开设备
-        if self.continousflag:
-            if not hasattr(self, "dev"):
-                self.dev = os.open("/dev/beaglelogic", os.O_RDONLY)
-            fd = self.dev
-        else:
-            fd = os.open("/dev/beaglelogic", os.O_RDONLY)
-    
-        try:
-            # —— 1MiB 一次读
-            buf = os.read(fd, 1048576)
-    
-            # —— 插入 NumPy 求和检查并计时
-            t0 = time.perf_counter()
-            arr = np.frombuffer(buf, dtype=np.uint8)
-            s = arr.sum()
-            t1 = time.perf_counter()
-            print(f"[PROFILE-np] np.sum: {(t1-t0)*1000:.1f} ms, sum={s}")
-    
-            # —— 原有全零分支逻辑
-            if s == 0:
-                if not self.continousflag:
-                    os.close(fd)
-                return None
-    
-            return buf
-    
-        finally:
-            if not self.continousflag:
-                os.close(fd)
+        # One capture from the configured backend: bytes, a pooled memoryview, or a list of ring blocks
+        return self.backend.read()
+
+    def readRingBuffer(self):
+        # Blocks filled since the last call (mmap backend); sequence numbers are in last_block_seqs
+        blocks = self.backend.read()
+        if blocks is None:
+            return []
+        return blocks if isinstance(blocks, list) else [blocks]
     
     
     # def readAdcIq(self):
@@ -973,8 +1389,13 @@ class RadioHoundSensorV3(Receiver):
 
 
 
+    def release(self, data):
+        # Hand a buffer returned by raw() back to the backend; bytes need no release
+        self.backend.release(data)
+
     def close(self):
         print("Closing ADC...")
-        self.fdev.close()
+        self.agc.cache.save()
+        self.backend.close()
 
 
@@ -0,0 +1,146 @@
+import heapq
+import itertools
+import threading
+import time
+
+from definitions import MAX_LOCKTIME
+from tools import bcolors
+
+LOCK_POLICIES = ('fifo', 'priority')
+
+
+class ReceiverLock(object):
+    def __init__(self, policy='fifo', max_hold=MAX_LOCKTIME, stale_check_interval=0.5):
+        """
+        Arbitrates access to a receiver between capture jobs.
+
+        Parameters:
+            policy:                'fifo' serves waiters in arrival order;
+                                   'priority' serves the highest priority first
+                                   and arrival order among equals
+            max_hold:              seconds after which a holder is reported as
+                                   suspicious (it is never released while its
+                                   thread is alive)
+            stale_check_interval:  how often waiters check whether the owner
+                                   thread died while holding the lock
+
+        Release hands the lock straight to the next waiter through a
+        condition variable, so there is no polling delay. Only the thread
+        holding the lock may release it. A lock whose owner thread has
+        exited is reclaimed by the next waiter."""
+
+        if policy not in LOCK_POLICIES:
+            raise ValueError('policy must be one of %s.' % ", ".join(LOCK_POLICIES))
+        self.policy = policy
+        self.max_hold = max_hold
+        self.stale_check_interval = stale_check_interval
+
+        self._cond = threading.Condition(threading.Lock())
+        self._waiters = []
+        self._tickets = itertools.count()
+        self._owner = None
+        self._acquired_at = 0.0
+        self._warned = False
+
+        # Counters
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.reclaimed = 0
+        self.total_wait = 0.0
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    @property
+    def owner_ident(self):
+        owner = self._owner
+        return owner.ident if owner is not None else 0
+
+    @property
+    def acquired_at(self):
+        # Wall-clock time the current holder took the lock, 0 when free
+        return self._acquired_at if self._owner is not None else 0
+
+    def locked(self):
+        return self._owner is not None
+
+    def acquire(self, blocking=True, timeout=None, priority=0):
+        """
+        Take the lock. Returns False if it could not be taken within timeout
+        seconds (or immediately when blocking is False)."""
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        me = threading.current_thread()
+        with self._cond:
+            if self._owner is me:
+                raise RuntimeError("ReceiverLock is not reentrant")
+            key = (-priority if self.policy == 'priority' else 0, next(self._tickets))
+            heapq.heappush(self._waiters, key)
+            try:
+                while True:
+                    self._reclaim_if_stale()
+                    if self._owner is None and self._waiters[0] == key:
+                        break
+                    if not blocking:
+                        self.timeouts += 1
+                        return False
+                    wait = self.stale_check_interval
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            return False
+                        wait = min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(key)
+                heapq.heapify(self._waiters)
+                # The head of the queue may have changed; let it re-check
+                self._cond.notify_all()
+
+            self._owner = me
+            self._acquired_at = time.time()
+            self._warned = False
+            self.acquisitions += 1
+            self.total_wait += time.monotonic() - start
+            return True
+
+    def release(self):
+        with self._cond:
+            if self._owner is None:
+                raise RuntimeError("release of an unlocked ReceiverLock")
+            if self._owner is not threading.current_thread():
+                raise RuntimeError("ReceiverLock held by thread " + str(self._owner.ident) + " released by thread " +
+                                   str(threading.get_ident()))
+            self._owner = None
+            self._acquired_at = 0.0
+            self._cond.notify_all()
+
+    def _reclaim_if_stale(self):
+        # Called with the condition held
+        owner = self._owner
+        if owner is None:
+            return
+        if not owner.is_alive():
+            print("Receiver lock held by exited thread " + str(owner.ident) + " for " +
+                  str(round(time.time() - self._acquired_at, 1)) + " seconds. Reclaiming.")
+            self._owner = None
+            self.reclaimed += 1
+        elif not self._warned and self.max_hold and time.time() - self._acquired_at > self.max_hold:
+            print(bcolors.WARNING + "Receiver lock held by live thread " + str(owner.ident) + " for more than " +
+                  str(self.max_hold) + " seconds; not releasing it" + bcolors.ENDC)
+            self._warned = True
+
+    def stats(self):
+        return {'policy': self.policy,
+                'locked': self.locked(),
+                'owner': self.owner_ident,
+                'waiters': len(self._waiters),
+                'acquisitions': self.acquisitions,
+                'timeouts': self.timeouts,
+                'reclaimed': self.reclaimed,
+                'mean_wait': self.total_wait / self.acquisitions if self.acquisitions else 0.0}
@@ -0,0 +1,93 @@
+import queue
+import threading
+import time
+
+
+class ScanPipeline(object):
+    def __init__(self, process, release=None, depth=2):
+        """
+        Runs the per-segment post-processing of a scan on a worker thread, so
+        the receiver can retune and capture the next segment meanwhile.
+
+        Parameters:
+            process:  callable(f_lims, y) whose return value replaces y in
+                      the scan result; it must copy whatever it keeps of y
+            release:  callable(y) handing the raw capture back once process
+                      is done with it (e.g. Receiver.release for pooled
+                      buffers)
+            depth:    segments that may wait for the worker before submit()
+                      blocks the capture loop
+
+        Results are stored by segment index, so the scan keeps its order
+        regardless of how long each segment takes to process. An exception
+        raised by process stops the worker and is re-raised by submit() or
+        finish(); every y submitted is released either way."""
+
+        if depth < 1:
+            raise ValueError('depth must be at least 1.')
+        self.process = process
+        self.release = release
+        self._queue = queue.Queue(maxsize=depth)
+        self._results = {}
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="scan-pipeline", daemon=True)
+        self._thread.start()
+
+        # Counters
+        self.processed = 0
+        self.process_time = 0.0     # time the worker spent in process()
+        self.stall_time = 0.0       # time the capture loop waited for the worker
+
+    def submit(self, index, f_lims, y):
+        if self._error is not None:
+            # The capture is not queued, so hand it back here
+            self._release(y)
+            raise self._error
+        start = time.monotonic()
+        self._queue.put((index, f_lims, y))
+        self.stall_time += time.monotonic() - start
+
+    def finish(self, count):
+        """Wait for the worker and return [(f_lims, process(f_lims, y)), ...] for segments 0..count-1."""
+        self.close()
+        self._raise_error()
+        return [self._results[i] for i in range(count)]
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {'processed': self.processed,
+                'process_time': self.process_time,
+                'stall_time': self.stall_time}
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            index, f_lims, y = item
+            if self._error is not None:
+                # Keep draining so submit() never blocks on a dead worker
+                self._release(y)
+                continue
+            start = time.monotonic()
+            try:
+                self._results[index] = (f_lims, self.process(f_lims, y))
+            except Exception as err:
+                self._error = err
+            finally:
+                self._release(y)
+            self.process_time += time.monotonic() - start
+            self.processed += 1
+
+    def _release(self, y):
+        if self.release is not None:
+            self.release(y)
@@ -0,0 +1,131 @@
+import functools
+
+import numpy as np
+
+SCAN_ORDERS = ('ascending', 'nearest')
+
+
+class ScanPlan(object):
+    def __init__(self, requested, ranges, ibw, rbw, runs, members):
+        """
+        Frequency plan for one scan job, built by plan_scan().
+
+        Attributes:
+            requested:  (start, end) pairs as requested, in request order
+            ranges:     the requested ranges after merging overlapping and
+                        adjacent ones, ascending
+            ibw, rbw:   instantaneous bandwidth and resolution used
+            runs:       evenly spaced center frequency arrays, one per merged
+                        range, in execution order
+            centers:    all center frequencies in execution order
+            members:    per requested range, indices into centers of the
+                        captures covering it, ascending in frequency
+
+        A capture shared by several requested ranges is taken once and
+        returned for each of them."""
+        self.requested = requested
+        self.ranges = ranges
+        self.ibw = ibw
+        self.rbw = rbw
+        self.runs = runs
+        self.centers = np.concatenate(runs) if runs else np.empty(0)
+        self.centers.flags.writeable = False
+        self.members = members
+
+    def __len__(self):
+        return len(self.centers)
+
+    def __iter__(self):
+        return iter(self.centers)
+
+    def __repr__(self):
+        return "<ScanPlan %s>" % self.summary()
+
+    @property
+    def retunes(self):
+        # One retune per capture; the gain is carried by the same MSP command
+        return len(self.centers)
+
+    @property
+    def travel(self):
+        # Total PLL frequency travel (Hz) between consecutive captures
+        return float(np.abs(np.diff(self.centers)).sum()) if len(self.centers) > 1 else 0.0
+
+    @property
+    def shared(self):
+        # Captures saved by merging: sum over requested ranges minus captures taken
+        return sum(len(m) for m in self.members) - len(self.centers)
+
+    def f_lims(self, index):
+        f_c = self.centers[index]
+        return (f_c - self.ibw / 2.0, f_c + self.ibw / 2.0)
+
+    def summary(self):
+        return "%i ranges -> %i merged, %i captures in %i runs, %.1f MHz PLL travel, %i shared" % \
+               (len(self.requested), len(self.ranges), self.retunes, len(self.runs), self.travel / 1e6, self.shared)
+
+
+def normalize_ranges(frequency_start, frequency_end):
+    """
+    Return ((start, end), ...) for scalar or sequence frequency_start and
+    frequency_end, with each pair ordered low to high."""
+    starts = np.atleast_1d(np.asarray(frequency_start, dtype=np.float64))
+    ends = np.atleast_1d(np.asarray(frequency_end, dtype=np.float64))
+    if starts.shape != ends.shape:
+        raise ValueError('frequency_start and frequency_end must be the same length.')
+    return tuple(zip(np.minimum(starts, ends).tolist(), np.maximum(starts, ends).tolist()))
+
+
+def merge_ranges(ranges):
+    """Merge overlapping and adjacent (start, end) ranges, returned ascending."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+
+def plan_scan(frequency_start, frequency_end, ibw, rbw, order='ascending', from_frequency=None):
+    """
+    Plan the captures of a scan over one or more start/end pairs.
+
+    Ranges are merged, and each merged range is covered by
+    ceil(span / ibw) captures (at least one) starting ibw/2 above its low
+    edge and spaced ibw + rbw apart, as in Receiver._scan. With order
+    'nearest' the plan runs downwards when from_frequency (the current
+    tuning) is closer to its top end. Plans are memoized, so repeated jobs
+    share one ScanPlan; do not modify it."""
+    if order not in SCAN_ORDERS:
+        raise ValueError('scan order must be one of %s.' % ", ".join(SCAN_ORDERS))
+    requested = normalize_ranges(frequency_start, frequency_end)
+    descending = False
+    if order == 'nearest' and from_frequency is not None:
+        low = min(start for start, _ in requested)
+        high = max(end for _, end in requested)
+        descending = abs(from_frequency - high) < abs(from_frequency - low)
+    return _build_plan(requested, float(ibw), float(rbw), descending)
+
+
+@functools.lru_cache(maxsize=64)
+def _build_plan(requested, ibw, rbw, descending):
+    ranges = merge_ranges(requested)
+    runs = []
+    for start, end in ranges:
+        n = max(1, int(np.ceil((end - start) / ibw)))
+        runs.append(start + (ibw // 2) + np.arange(n) * (ibw + rbw))
+
+    # Captures covering each requested range, as indices into the ascending center list
+    ascending = np.concatenate(runs)
+    members = []
+    for start, end in requested:
+        members.append(np.flatnonzero((ascending + ibw / 2.0 > start) & (ascending - ibw / 2.0 < end)))
+
+    if descending:
+        runs = [run[::-1] for run in runs[::-1]]
+        last = len(ascending) - 1
+        members = [last - m for m in members]
+    for m in members:
+        m.flags.writeable = False
+    return ScanPlan(requested, ranges, ibw, rbw, runs, tuple(members))
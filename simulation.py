@@ -0,0 +1,419 @@
+"""
+Hardware-free stand-ins for the RadioHound front end: a synthetic ADC feeding a
+fake /dev/beaglelogic, a fake beaglelogic sysfs directory and a fake MSP on
+SPI with retune latency. A RadioHoundSensorV3 built with simulated() runs its
+capture, scan and transport paths unmodified on any Linux box.
+
+Run directly to benchmark a capture backend:
+    python simulation.py --backend pool --duration 5 --byte-rate 48e6
+"""
+import argparse
+import collections
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from definitions import *
+
+
+class SimulatedRadio(object):
+    def __init__(self, emitters=None, noise=0.002, sample_rate=48e6, pll_lock_time=0.002,
+                 pll_lock_per_mhz=2e-6, gain_settle_time=0.0005, seed=0):
+        """
+        Shared state of the simulated front end.
+
+        Parameters:
+            emitters:          list of (rf_frequency_hz, amplitude_v) tones present
+                               at the antenna, amplitudes referred to 0 dB gain
+            noise:             rms noise (V) at the ADC input
+            sample_rate:       ADC sample rate (real samples, one byte each)
+            pll_lock_time:     seconds the PLL needs to lock after any retune
+            pll_lock_per_mhz:  extra lock time per MHz of frequency jump
+            gain_settle_time:  seconds the VGA needs after a gain-only change
+
+        The usable IF band 0..sample_rate/2 maps to
+        center - sample_rate/4 .. center + sample_rate/4, matching the f_lims
+        Receiver._scan reports for an ibw of sample_rate/2."""
+        self.emitters = list(emitters) if emitters is not None else [(1.6255e9, 0.05), (2.4e9, 0.02)]
+        self.noise = noise
+        self.sample_rate = sample_rate
+        self.pll_lock_time = pll_lock_time
+        self.pll_lock_per_mhz = pll_lock_per_mhz
+        self.gain_settle_time = gain_settle_time
+        self.rng = np.random.default_rng(seed)
+
+        self.frequency = None
+        self.gain = 1
+        self.settled_at = 0.0
+        self.retunes = 0
+        self.gain_changes = 0
+        self._lock = threading.Lock()
+
+    def tune(self, frequency, gain):
+        with self._lock:
+            delta = abs(frequency - self.frequency) if self.frequency is not None else 6e9
+            self.frequency = frequency
+            self.gain = gain
+            self.settled_at = time.monotonic() + self.pll_lock_time + self.pll_lock_per_mhz * delta / 1e6
+            self.retunes += 1
+
+    def set_gain(self, gain):
+        with self._lock:
+            self.gain = gain
+            self.settled_at = max(self.settled_at, time.monotonic() + self.gain_settle_time)
+            self.gain_changes += 1
+
+    @property
+    def locked(self):
+        return time.monotonic() >= self.settled_at
+
+    def state(self):
+        with self._lock:
+            return self.frequency, self.gain, self.locked
+
+
+class SyntheticAdcSource(object):
+    def __init__(self, radio, block_size=BLOCK_SIZE, cache_blocks=4):
+        """
+        Produces blocks of 8-bit offset-binary samples for the radio's current
+        tuning. Blocks are generated once per (frequency, gain) and then
+        cycled, so the source can keep up with the real 48 MB/s ADC rate.
+        While the PLL is unlocked the block is replaced by wideband garbage."""
+        self.radio = radio
+        self.block_size = int(block_size)
+        self.cache_blocks = int(cache_blocks)
+        self._cache = {}
+        self._index = 0
+        self._unlocked = None
+
+    def next_block(self):
+        frequency, gain, locked = self.radio.state()
+        if not locked:
+            if self._unlocked is None:
+                self._unlocked = self.radio.rng.integers(0, 256, self.block_size, dtype=np.uint8)
+            return self._unlocked
+        key = (frequency, gain)
+        blocks = self._cache.get(key)
+        if blocks is None:
+            if len(self._cache) > 64:
+                self._cache.clear()
+            blocks = self._cache[key] = self._generate(frequency, gain)
+        self._index = (self._index + 1) % len(blocks)
+        return blocks[self._index]
+
+    def _generate(self, frequency, gain):
+        fs = self.radio.sample_rate
+        n = self.block_size * self.cache_blocks
+        t = np.arange(n, dtype=np.float64) / fs
+        x = self.radio.noise * self.radio.rng.standard_normal(n)
+        if frequency is not None:
+            low_edge = frequency - fs / 4.0
+            for rf, amplitude in self.radio.emitters:
+                f_if = rf - low_edge
+                if 0 < f_if < fs / 2.0:
+                    x += amplitude * np.cos(2 * np.pi * f_if * t + self.radio.rng.uniform(0, 2 * np.pi))
+        x *= 10 ** (gain / 20.0)
+        codes = np.clip(np.round(x / ADC_FULL_SCALE * ADC_OFFSET + ADC_OFFSET), 0, 255).astype(np.uint8)
+        return [codes[i * self.block_size:(i + 1) * self.block_size] for i in range(self.cache_blocks)]
+
+
+class SimulatedSPI(object):
+    # MSP control bytes, see RadioHoundSensorV3.mspCommandBeagle
+    CTRL_SINGLE = 0x01
+    CTRL_MULTI = 0x02
+    CTRL_SET_GAIN = 0x04
+    CTRL_READ_PLL = 0x08
+    CTRL_WRITE_CAL = 0x20
+    CTRL_READ_CAL = 0x40
+
+    def __init__(self, radio, clock_hz=125000, msp_latency=0.0002, cal_size=12000):
+        """
+        Stand-in for Adafruit_BBIO.SPI talking to the MSP. Every transfer
+        costs its bit time at clock_hz plus msp_latency, and the commands
+        retune the shared SimulatedRadio. The calibration memory is a plain
+        bytearray of cal_size bytes."""
+        self.radio = radio
+        self.clock_hz = clock_hz
+        self.msp_latency = msp_latency
+        self.cal_memory = bytearray(cal_size)
+        self.sweep = None   # (fcStart, fcStop, stepSize) in kHz of the last multi frame
+        self._cal_pos = 0
+        self._last_ctrl = None
+        self.transfers = 0
+        self.bytes_transferred = 0
+        self.commands = collections.deque(maxlen=1024)   # most recent control bytes
+
+        # Attributes set by the receiver on a real SPI object
+        self.cshigh = True
+        self.lsbfirst = False
+        self.bpw = 8
+        self.mode = 0b01
+        self.threewire = False
+        self.msh = clock_hz
+
+    def xfer2(self, tbuf):
+        tbuf = list(tbuf)
+        time.sleep(len(tbuf) * 8.0 / self.clock_hz + self.msp_latency)
+        self.transfers += 1
+        self.bytes_transferred += len(tbuf)
+        rbuf = [0] * len(tbuf)
+        # The MSP handles one 13-byte frame at a time
+        for start in range(0, len(tbuf) - 12, 13):
+            self._frame(tbuf[start:start + 13], rbuf, start)
+        return rbuf
+
+    def writebytes(self, tbuf):
+        self.xfer2(tbuf)
+
+    def close(self):
+        pass
+
+    def _frame(self, frame, rbuf, start):
+        ctrl = frame[0]
+        self.commands.append(ctrl)
+        # A calibration read or write session starts over whenever another command came in between
+        if ctrl != self._last_ctrl:
+            self._cal_pos = 0
+        self._last_ctrl = ctrl
+
+        if ctrl == self.CTRL_SINGLE:
+            khz = (frame[1] << 24) | (frame[2] << 16) | (frame[3] << 8) | frame[4]
+            self.radio.tune(khz * 1e3, (frame[11] & 0x0f) * 3 - 5)
+        elif ctrl == self.CTRL_MULTI:
+            self._multi(frame, rbuf, start)
+        elif ctrl == self.CTRL_SET_GAIN:
+            self.radio.set_gain((frame[11] & 0x0f) * 3 - 5)
+        elif ctrl == self.CTRL_READ_PLL:
+            # Lock detect reported in bit 0 of the first returned data byte
+            rbuf[start + 1] = 1 if self.radio.locked else 0
+        elif ctrl == self.CTRL_WRITE_CAL:
+            end = min(self._cal_pos + 12, len(self.cal_memory))
+            self.cal_memory[self._cal_pos:end] = bytes(frame[1:1 + end - self._cal_pos])
+            self._cal_pos = end
+        elif ctrl == self.CTRL_READ_CAL:
+            # Data comes back one frame late, so the first read of a session is blank
+            if self._cal_pos == 0:
+                self._cal_pos = -1
+            else:
+                pos = max(self._cal_pos, 0)
+                end = min(pos + 12, len(self.cal_memory))
+                rbuf[start + 1:start + 1 + end - pos] = self.cal_memory[pos:end]
+                self._cal_pos = end
+
+
+    def _multi(self, frame, rbuf, start):
+        fc_start = (frame[1] << 24) | (frame[2] << 16) | (frame[3] << 8) | frame[4]
+        fc_stop = (frame[5] << 24) | (frame[6] << 16) | (frame[7] << 8) | frame[8]
+        step = (frame[9] << 8) | frame[10]
+        self.sweep = (fc_start, fc_stop, step)
+        self.radio.tune(fc_start * 1e3, (frame[11] & 0x0f) * 3 - 5)
+
+
+class SimulatedBeagleLogic(object):
+    def __init__(self, radio=None, mode='fifo', byte_rate=None, block_size=BLOCK_SIZE,
+                 ring_size=RING_BUFFER_SIZE, directory=None):
+        """
+        Fake beaglelogic device and sysfs directory fed by a SyntheticAdcSource.
+
+        Parameters:
+            radio:       SimulatedRadio shared with the fake SPI (default: new one)
+            mode:        'fifo'  named pipe in a temporary directory
+                         'pipe'  anonymous in-memory pipe, opened via /proc/self/fd
+                         'file'  regular file of ring_size bytes rewritten in place,
+                                 for the mmap backend
+            byte_rate:   bytes per second produced, None for as fast as possible
+            block_size:  bytes written per block
+            ring_size:   size of the ring file in 'file' mode
+            directory:   where to create the device and sysfs files"""
+        if mode not in ('fifo', 'pipe', 'file'):
+            raise ValueError("mode must be 'fifo', 'pipe' or 'file'.")
+        self.radio = radio if radio is not None else SimulatedRadio()
+        self.mode = mode
+        self.byte_rate = byte_rate
+        self.block_size = int(block_size)
+        self.ring_size = int(ring_size)
+        self.source = SyntheticAdcSource(self.radio, self.block_size)
+        self.spi = SimulatedSPI(self.radio)
+
+        self._own_dir = directory is None
+        self.directory = directory if directory is not None else tempfile.mkdtemp(prefix="sim_beaglelogic_")
+        self.sysfs_path = os.path.join(self.directory, "sysfs") + os.sep
+        os.makedirs(self.sysfs_path, exist_ok=True)
+        for name, value in (("state", "0"), ("lasterror", "0"), ("triggerflags", "0"),
+                            ("buffersize", str(self.ring_size)), ("bufunitsize", str(self.block_size))):
+            with open(self.sysfs_path + name, "w") as fp:
+                fp.write(value + "\n")
+
+        self._pipe = None
+        if mode == 'fifo':
+            self.dev_path = os.path.join(self.directory, "beaglelogic")
+            os.mkfifo(self.dev_path)
+        elif mode == 'pipe':
+            self._pipe = os.pipe()
+            self.dev_path = "/proc/self/fd/%i" % self._pipe[0]
+        else:
+            self.dev_path = os.path.join(self.directory, "beaglelogic")
+            with open(self.dev_path, "wb") as fp:
+                fp.truncate(self.ring_size)
+
+        self.bytes_written = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sim-beaglelogic", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self.mode == 'fifo' and self._thread is not None and self._thread.is_alive():
+            # Unblock a writer still waiting in open() for a reader
+            try:
+                os.close(os.open(self.dev_path, os.O_RDONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        if self._pipe is not None:
+            for fd in self._pipe:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self._pipe = None
+        if self._own_dir:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def sensor(self, backend=None, **kwargs):
+        """RadioHoundSensorV3 wired to this simulated device, SPI and sysfs."""
+        from receiver import RadioHoundSensorV3
+        if backend == 'mmap' and self.mode != 'file':
+            raise ValueError("the mmap backend needs a SimulatedBeagleLogic in 'file' mode.")
+        kwargs.setdefault('block_size', self.block_size)
+        # No calibration table on the host; pass calibration_file to try one
+        kwargs.setdefault('calibration_file', None)
+        # No gain cache on the host either; pass agc_cache to keep one
+        kwargs.setdefault('agc_cache', None)
+        # Like a real MSP, hardware_sweep stays off unless asked for
+        kwargs.setdefault('hardware_sweep', False)
+        if backend == 'mmap':
+            kwargs.setdefault('buffer_size', self.ring_size)
+        sensor = RadioHoundSensorV3(backend=backend, dev_path=self.dev_path, sysfs_path=self.sysfs_path,
+                                    spi=self.spi, hardware_checks=False, **kwargs)
+        if self.mode != 'file':
+            # The pipe plus the block the writer holds are still from before a retune or gain change
+            sensor.agc.discard = 2
+        return sensor
+
+    def _run(self):
+        try:
+            if self.mode == 'file':
+                fd = os.open(self.dev_path, os.O_WRONLY)
+            elif self.mode == 'pipe':
+                fd = self._pipe[1]
+            else:
+                fd = os.open(self.dev_path, os.O_WRONLY)
+        except OSError:
+            return
+        if self.mode != 'file':
+            # Let one read() return a whole block, as the driver does
+            try:
+                fcntl.fcntl(fd, getattr(fcntl, 'F_SETPIPE_SZ', 1031), self.block_size)
+            except OSError:
+                pass
+
+        t0 = time.monotonic()
+        offset = 0
+        try:
+            while not self._stop.is_set():
+                block = memoryview(self.source.next_block())
+                if self.mode == 'file':
+                    os.pwrite(fd, block, offset)
+                    offset = (offset + self.block_size) % self.ring_size
+                else:
+                    sent = 0
+                    while sent < len(block):
+                        sent += os.write(fd, block[sent:])
+                self.bytes_written += len(block)
+                if self.byte_rate:
+                    delay = t0 + self.bytes_written / float(self.byte_rate) - time.monotonic()
+                    if delay > 0:
+                        self._stop.wait(delay)
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            if self.mode != 'pipe':
+                os.close(fd)
+
+
+def simulated(backend=None, emitters=None, byte_rate=None, **kwargs):
+    """
+    Start a SimulatedBeagleLogic suited to backend and return (simulation,
+    sensor). Call sensor.close() and simulation.stop() when done."""
+    sim = SimulatedBeagleLogic(SimulatedRadio(emitters=emitters), mode='file' if backend == 'mmap' else 'fifo',
+                               byte_rate=byte_rate)
+    sim.start()
+    try:
+        sensor = sim.sensor(backend=backend, **kwargs)
+    except Exception:
+        sim.stop()
+        raise
+    return sim, sensor
+
+
+def main():
+    from capture_backends import BACKENDS
+    parser = argparse.ArgumentParser(description="Capture throughput benchmark against a simulated RadioHound")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="os_read", help="Capture backend to benchmark")
+    parser.add_argument("--duration", type=float, default=5.0, help="Benchmark length in seconds")
+    parser.add_argument("--byte-rate", type=float, default=None,
+                        help="Simulated ADC rate in bytes/s; unthrottled by default")
+    parser.add_argument("--frequency", type=float, default=1.625e9, help="Center frequency")
+    args = parser.parse_args()
+
+    sim, sensor = simulated(args.backend, byte_rate=args.byte_rate)
+    total_bytes = 0
+    captures = 0
+    try:
+        start = time.monotonic()
+        while time.monotonic() - start < args.duration:
+            data = sensor.raw(args.frequency, 1)
+            if data is None:
+                continue
+            blocks = data if isinstance(data, list) else [data]
+            for block in blocks:
+                total_bytes += len(block)
+            captures += 1
+            sensor.release(data)
+        elapsed = time.monotonic() - start
+    finally:
+        sensor.close()
+        sim.stop()
+
+    print(f"{args.backend}: {captures} captures, {total_bytes} bytes in {elapsed:.2f}s "
+          f"→ {total_bytes / elapsed / 1e6:.1f} MB/s")
+    stats = sensor.validator.stats()
+    print(f"validity check ({stats['mode']}): {stats['mean_time'] * 1e3:.3f} ms per block")
+    settle = sensor.settle.stats()
+    print(f"settle: {settle['retunes']} retunes, {settle['mean_retune_time'] * 1e3:.2f} ms mean "
+          f"(lock detect {'on' if settle['lock_detect'] else 'off'})")
+
+
+if __name__ == "__main__":
+    main()
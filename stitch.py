@@ -0,0 +1,129 @@
+import numpy as np
+
+OVERLAP_MODES = ('mean', 'max')
+
+
+class SpectrumStitcher(object):
+    def __init__(self, bin_offsets, f_min=0.0, f_max=None, overlap='mean'):
+        """
+        Combines per-segment PSDs of a sweep into one frequency-ordered
+        spectrum.
+
+        Parameters:
+            bin_offsets:  frequency of each PSD bin relative to the low edge
+                          f_lims[0] of its segment (for a real capture,
+                          PsdEngine.frequencies())
+            f_min, f_max: usable part of each segment in the same relative
+                          frequencies (Receiver.f_min / f_max); bins outside
+                          are trimmed as aliased or attenuated
+            overlap:      how bins covered by more than one segment are
+                          combined: 'mean' or 'max'
+
+        Bins land on one frequency grid with the PSD bin spacing, anchored
+        at the lowest segment edge. Only grid bins that some segment covers
+        are stored, so gaps between scan ranges cost nothing. reset() lays
+        out and preallocates the output for the expected segment edges; a
+        segment off that layout (e.g. a sweep step reported a few kHz away)
+        extends it."""
+
+        if overlap not in OVERLAP_MODES:
+            raise ValueError('overlap must be one of %s.' % ", ".join(OVERLAP_MODES))
+        offsets = np.asarray(bin_offsets, dtype=np.float64)
+        if offsets.ndim != 1 or len(offsets) < 2:
+            raise ValueError('bin_offsets must list at least two bins.')
+        self.df = float(offsets[1] - offsets[0])
+        if f_max is None:
+            f_max = offsets[-1]
+        self._keep = np.flatnonzero((offsets >= f_min) & (offsets <= f_max))
+        if len(self._keep) == 0:
+            raise ValueError('no PSD bin lies between f_min and f_max.')
+        self.offsets = offsets[self._keep]
+        self.overlap = overlap
+
+        self.f_ref = None
+        self._edges = None
+        self.grid = np.empty(0, dtype=np.int64)
+        self._acc = np.empty(0)
+        self._count = np.empty(0)
+        self.segments = 0
+
+    @property
+    def bins_per_segment(self):
+        return len(self._keep)
+
+    def reset(self, low_edges):
+        """
+        Start a new sweep whose segments have the given low edges
+        (f_lims[0]). The layout is reused when the edges match the previous
+        sweep, so repeated sweeps allocate nothing."""
+        edges = np.asarray(low_edges, dtype=np.float64).ravel()
+        if self._edges is None or not np.array_equal(edges, self._edges):
+            self._edges = edges
+            self.f_ref = float(edges.min())
+            self.grid = np.unique(self._indices(edges[:, None]))
+            self._acc = np.empty(len(self.grid))
+            self._count = np.empty(len(self.grid))
+        self._acc.fill(0.0 if self.overlap == 'mean' else -np.inf)
+        self._count.fill(0)
+        self.segments = 0
+
+    def add(self, f_lims, psd):
+        """Add one segment's PSD (all bins, as produced by the PSD engine)."""
+        psd = np.asarray(psd)
+        if self.f_ref is None:
+            self.reset([f_lims[0]])
+        idx = self._indices(f_lims[0])
+        pos = np.searchsorted(self.grid, idx)
+        if pos[-1] >= len(self.grid) or not np.array_equal(self.grid[pos], idx):
+            self._extend(idx)
+            pos = np.searchsorted(self.grid, idx)
+
+        values = psd[self._keep]
+        if self.overlap == 'mean':
+            self._acc[pos] += values
+        else:
+            self._acc[pos] = np.maximum(self._acc[pos], values)
+        self._count[pos] += 1
+        self.segments += 1
+
+    def result(self, out=None):
+        """
+        (frequencies, spectrum) of the sweep so far; spectrum is written to
+        out when given. Bins no segment has reached yet are NaN."""
+        if out is None:
+            out = np.empty(len(self.grid))
+        covered = self._count > 0
+        if self.overlap == 'mean':
+            np.divide(self._acc, self._count, out=out, where=covered)
+        else:
+            out[:] = self._acc
+        out[~covered] = np.nan
+        return self.frequencies(), out
+
+    def frequencies(self):
+        return self.f_ref + self.grid * self.df
+
+    def _indices(self, low_edge):
+        return np.rint((low_edge + self.offsets - self.f_ref) / self.df).astype(np.int64)
+
+    def _extend(self, idx):
+        grid = np.union1d(self.grid, idx)
+        pos = np.searchsorted(grid, self.grid)
+        acc = np.full(len(grid), 0.0 if self.overlap == 'mean' else -np.inf)
+        count = np.zeros(len(grid))
+        acc[pos] = self._acc
+        count[pos] = self._count
+        self.grid, self._acc, self._count = grid, acc, count
+        # The next reset() lays out from scratch
+        self._edges = None
+
+
+def stitch(segments, bin_offsets, f_min=0.0, f_max=None, overlap='mean'):
+    """
+    One-shot stitch of [(f_lims, psd), ...]; returns (frequencies, spectrum).
+    See SpectrumStitcher."""
+    stitcher = SpectrumStitcher(bin_offsets, f_min, f_max, overlap)
+    stitcher.reset([f_lims[0] for f_lims, _ in segments])
+    for f_lims, psd in segments:
+        stitcher.add(f_lims, psd)
+    return stitcher.result()
@@ -0,0 +1,690 @@
+import argparse
+import collections
+import json
+import os
+import socket
+import threading
+import time
+
+from capture_engine import RingIndex
+from definitions import BLOCK_SIZE, BUFFER_POOL_SIZE
+from framing import FRAME_VERSION, HEADER_SIZE, FrameError, decode_header, pack_header
+from tools import bcolors
+
+DEFAULT_PORT = 5555
+SLOW_CLIENT_POLICIES = ('drop-oldest', 'drop-newest', 'disconnect')
+MAX_HANDSHAKE = 4096
+HANDSHAKE_TIMEOUT = 5.0     # seconds a new connection has to send its handshake
+POOL_RESERVE = 1    # free pool buffers kept for the capture; below that, blocks are copied out
+
+
+class HandshakeError(ValueError):
+    pass
+
+
+def parse_address(address):
+    """'host:port' or ':port' -> (host, port) for TCP; anything else is a Unix socket path."""
+    if isinstance(address, tuple):
+        return address
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return (host or '0.0.0.0', int(port))
+    return address
+
+
+def _family(address):
+    return socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+
+
+def _read_line(sock, limit=MAX_HANDSHAKE):
+    # One newline-terminated line, read a byte at a time so nothing after it is consumed
+    line = bytearray()
+    while not line.endswith(b'\n'):
+        c = sock.recv(1)
+        if not c:
+            raise HandshakeError('connection closed during handshake')
+        line += c
+        if len(line) > limit:
+            raise HandshakeError('handshake line longer than %i bytes' % limit)
+    return line
+
+
+def _send_json(sock, message):
+    sock.sendall(json.dumps(message).encode() + b'\n')
+
+
+class _SharedBlock(object):
+    # A capture block queued to several clients, released to the sensor after the last one is done with it
+    __slots__ = ('header', 'block', 'nbytes', '_refs', '_lock', '_release')
+
+    def __init__(self, header, block, refs, release):
+        self.header = header
+        self.block = block
+        self.nbytes = block.nbytes if isinstance(block, memoryview) else len(block)
+        self._refs = refs
+        self._lock = threading.Lock()
+        self._release = release
+
+    def done(self):
+        with self._lock:
+            self._refs -= 1
+            last = self._refs == 0
+        if last:
+            self._release(self.block)
+
+
+class _Client(object):
+    def __init__(self, server, sock, peer):
+        self.server = server
+        self.sock = sock
+        self.peer = peer
+        self.backlog = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._send_loop, name='stream-client', daemon=True)
+        self.connected = time.monotonic()
+
+        # Counters
+        self.sent = 0
+        self.sent_bytes = 0
+        self.dropped = 0
+        self.max_backlog = 0
+
+    def offer(self, shared):
+        """Queue shared for sending, applying the slow-client policy; False if the client was disconnected."""
+        evicted = None
+        with self.cond:
+            if self.closed:
+                evicted = shared
+            elif len(self.backlog) >= self.server.backlog_blocks:
+                policy = self.server.policy
+                if policy == 'disconnect':
+                    self.closed = True
+                    self.cond.notify_all()
+                elif policy == 'drop-oldest':
+                    evicted = self.backlog.popleft()
+                    self.dropped += 1
+                else:
+                    self.dropped += 1
+                    evicted = shared
+            if not self.closed and evicted is not shared:
+                self.backlog.append(shared)
+                self.max_backlog = max(self.max_backlog, len(self.backlog))
+                self.cond.notify()
+        if evicted is not None:
+            evicted.done()
+        if self.closed:
+            if evicted is not shared:
+                shared.done()
+            self._abort()
+            return False
+        return True
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self._abort()
+
+    def _abort(self):
+        # Wakes the sender if it is blocked in sendmsg on a stalled peer
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _send_loop(self):
+        try:
+            while True:
+                with self.cond:
+                    while not self.backlog and not self.closed:
+                        self.cond.wait()
+                    if self.closed:
+                        break
+                    shared = self.backlog.popleft()
+                try:
+                    self._send(shared)
+                finally:
+                    shared.done()
+                self.sent += 1
+                self.sent_bytes += HEADER_SIZE + shared.nbytes
+        except OSError:
+            pass
+        finally:
+            with self.cond:
+                self.closed = True
+                pending = list(self.backlog)
+                self.backlog.clear()
+            for shared in pending:
+                shared.done()
+            self.sock.close()
+            self.server._remove(self)
+
+    def _send(self, shared):
+        # Scatter-gather write of header and block straight from the capture buffer
+        parts = [memoryview(shared.header), memoryview(shared.block).cast('B')]
+        while parts:
+            n = self.sock.sendmsg(parts)
+            while parts and n >= parts[0].nbytes:
+                n -= parts[0].nbytes
+                parts.pop(0)
+            if n:
+                parts[0] = parts[0][n:]
+
+    def stats(self):
+        with self.cond:
+            return {'peer': self.peer,
+                    'sent': self.sent,
+                    'sent_bytes': self.sent_bytes,
+                    'dropped': self.dropped,
+                    'backlog': len(self.backlog),
+                    'max_backlog': self.max_backlog}
+
+
+class StreamServer(object):
+    def __init__(self, sensor, address=('0.0.0.0', DEFAULT_PORT), backlog_blocks=4, policy='drop-oldest',
+                 max_clients=8, sndbuf=None):
+        """
+        Streams raw capture blocks to any number of TCP or Unix socket
+        clients, as an alternative to publishing them over MQTT.
+
+        Parameters:
+            sensor:          receiver providing stream() and release()
+            address:         (host, port) for TCP, a path for a Unix socket
+            backlog_blocks:  blocks queued per client before the policy applies
+            policy:          what happens to a client whose backlog is full:
+                             'drop-oldest' discard its oldest queued block
+                             'drop-newest' skip the block just captured
+                             'disconnect'  close the connection
+            max_clients:     connections accepted at once
+            sndbuf:          SO_SNDBUF of client sockets, system default if None
+
+        A client connects and sends one JSON line, {"frequency": Hz,
+        "gain": dB}, and gets one back, {"ok": true, ...} or {"ok": false,
+        "error": ...}, within HANDSHAKE_TIMEOUT seconds and on a thread of
+        its own, so a silent connection does not delay the others; after
+        that the server only sends frames, a framing.py
+        header followed by the raw block. The first client picks the tuning
+        and the capture runs while anyone is connected; later clients must
+        ask for the same tuning, or omit it, until everyone has left.
+
+        Each block is captured once and sent to every client with
+        socket.sendmsg() from the buffer it was read into, header and block
+        as separate iovecs, so nothing is copied per client. The buffer goes
+        back to the sensor once the last client has sent it or dropped it.
+        Every client has its own sender thread and bounded backlog: a slow
+        client loses blocks, the others and the capture do not wait for it.
+        Frames carry one capture_seq sequence for everyone, so a client sees
+        its drops as gaps (subscriber.Reassembler counts them as lost).
+        block_index is the ring sequence number with the mmap backend, so
+        blocks the ring lost show as gaps there, and capture_seq otherwise.
+
+        Queued blocks still pin pool buffers. Clients that keep up or drop
+        their oldest blocks share the same recent ones, so backlog_blocks + 2
+        buffers are enough. With 'drop-newest' every slow client keeps its
+        own old backlog, up to max_clients * (backlog_blocks + 1) buffers.
+        Whenever fewer than POOL_RESERVE buffers are free, a block is copied
+        out and its buffer released before it is queued. The capture
+        therefore never waits for a client; copied counts these blocks."""
+
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError('policy must be one of %s.' % ", ".join(SLOW_CLIENT_POLICIES))
+        if backlog_blocks < 1:
+            raise ValueError('backlog_blocks must be at least 1.')
+
+        self.sensor = sensor
+        self.address = parse_address(address)
+        self.backlog_blocks = int(backlog_blocks)
+        self.policy = policy
+        self.max_clients = int(max_clients)
+        self.sndbuf = sndbuf
+
+        self.pool = getattr(sensor, 'pool', None)
+        if self.pool is not None and len(self.pool) < self.backlog_blocks + 2:
+            print(bcolors.WARNING + "Buffer pool of %i is smaller than backlog_blocks + 2, " % len(self.pool) + \
+            "most blocks will be copied out of it" + bcolors.ENDC)
+
+        self._lock = threading.Condition()
+        self._clients = []
+        self._pending = set()           # sockets still in their handshake
+        self._tuning = None             # (frequency, gain) while clients are connected
+        self._stop = threading.Event()
+        self._listener = None
+        self._accept_thread = None
+        self._capture_thread = None
+
+        # Counters
+        self.captured = 0
+        self.captured_bytes = 0
+        self.copied = 0
+        self.connections = 0
+        self.refused = 0
+        self.errors = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def clients(self):
+        with self._lock:
+            return list(self._clients)
+
+    def start(self):
+        family = _family(self.address)
+        if family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self._listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(self.address)
+        self._listener.listen(self.max_clients)
+        # Unblocks accept() now and then so stop() is noticed
+        self._listener.settimeout(0.5)
+        if family == socket.AF_INET:
+            self.address = self._listener.getsockname()
+        self._stop.clear()
+        self._accept_thread = threading.Thread(target=self._accept_loop, name='stream-accept', daemon=True)
+        self._capture_thread = threading.Thread(target=self._capture_loop, name='stream-capture', daemon=True)
+        self._accept_thread.start()
+        self._capture_thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        with self._lock:
+            self._lock.notify_all()
+        with self._lock:
+            pending = list(self._pending)
+        for sock in pending:
+            # Ends a handshake still waiting for its client
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for client in self.clients:
+            client.close()
+        for thread in (self._accept_thread, self._capture_thread):
+            if thread is not None:
+                thread.join(timeout)
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            if _family(self.address) == socket.AF_UNIX and os.path.exists(self.address):
+                os.unlink(self.address)
+
+    def stats(self):
+        clients = [client.stats() for client in self.clients]
+        with self._lock:
+            return {'captured': self.captured,
+                    'captured_bytes': self.captured_bytes,
+                    'copied': self.copied,
+                    'connections': self.connections,
+                    'refused': self.refused,
+                    'errors': self.errors,
+                    'tuning': self._tuning,
+                    'clients': clients}
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                sock, peer = self._listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            # A client slow to send its handshake must not hold up the next accept()
+            with self._lock:
+                self._pending.add(sock)
+            threading.Thread(target=self._admit, args=(sock, peer), name='stream-handshake', daemon=True).start()
+
+    def _admit(self, sock, peer):
+        sock.settimeout(HANDSHAKE_TIMEOUT)
+        try:
+            client = self._handshake(sock, peer)
+        except (OSError, HandshakeError, ValueError) as e:
+            print("Stream client %s refused: %s" % (peer or 'local', e))
+            with self._lock:
+                self._pending.discard(sock)
+                self.refused += 1
+            sock.close()
+            return
+        sock.settimeout(None)
+        client.thread.start()
+
+    def _handshake(self, sock, peer):
+        try:
+            request = json.loads(_read_line(sock).decode())
+            if not isinstance(request, dict):
+                raise ValueError('handshake must be a JSON object')
+            frequency = request.get('frequency')
+            gain = request.get('gain')
+            frequency = None if frequency is None else float(frequency)
+            gain = None if gain is None else float(gain)
+        except ValueError as e:
+            _send_json(sock, {'ok': False, 'error': 'bad handshake: %s' % e})
+            raise
+        with self._lock:
+            self._pending.discard(sock)
+            error = None
+            if self._stop.is_set():
+                error = 'server stopping'
+            elif len(self._clients) >= self.max_clients:
+                error = 'server has %i clients already' % len(self._clients)
+            elif self._tuning is None:
+                if frequency is None:
+                    error = 'no capture running, frequency required'
+                else:
+                    self._tuning = (frequency, 1.0 if gain is None else gain)
+            elif (frequency is not None and frequency != self._tuning[0]) or \
+                    (gain is not None and gain != self._tuning[1]):
+                error = 'streaming %.6g Hz at gain %g to %i clients' % (self._tuning + (len(self._clients),))
+            if error is not None:
+                _send_json(sock, {'ok': False, 'error': error})
+                raise HandshakeError(error)
+            if self.sndbuf is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, int(self.sndbuf))
+            client = _Client(self, sock, peer)
+            self._clients.append(client)
+            self.connections += 1
+            _send_json(sock, {'ok': True, 'frequency': self._tuning[0], 'gain': self._tuning[1],
+                              'header_size': HEADER_SIZE, 'frame_version': FRAME_VERSION,
+                              'backlog_blocks': self.backlog_blocks, 'policy': self.policy})
+            self._lock.notify_all()
+        return client
+
+    def _remove(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+            if not self._clients:
+                self._tuning = None
+            self._lock.notify_all()
+
+    def _capture_loop(self):
+        seq = 0
+        while not self._stop.is_set():
+            with self._lock:
+                while self._tuning is None and not self._stop.is_set():
+                    self._lock.wait()
+                tuning = self._tuning
+            if tuning is None:
+                break
+            frequency, gain = tuning
+            ring = RingIndex(self.sensor)
+            try:
+                with self.sensor.stream(frequency, gain) as blocks:
+                    for block in blocks:
+                        block_index = ring.next()
+                        with self._lock:
+                            clients = list(self._clients) if self._tuning == tuning else []
+                        if not clients or self._stop.is_set():
+                            self.sensor.release(block)
+                            break
+                        self._fan_out(block, clients, seq, seq if block_index is None else block_index,
+                                      frequency, gain)
+                        seq += 1
+            except Exception as e:
+                self.errors += 1
+                print(bcolors.WARNING + "Stream capture failed: " + str(e) + bcolors.ENDC)
+                for client in self.clients:
+                    client.close()
+                time.sleep(0.5)
+
+    def _fan_out(self, block, clients, seq, block_index, frequency, gain):
+        nbytes = block.nbytes if isinstance(block, memoryview) else len(block)
+        header = bytearray(HEADER_SIZE)
+        pack_header(header, 0, seq, block_index, frequency, gain, nbytes)
+        self.captured += 1
+        self.captured_bytes += nbytes
+        if self.pool is not None and self.pool.available < POOL_RESERVE and self.pool.owns(block):
+            # Clients hold (almost) every pool buffer: queue a copy so the next read does not wait for them
+            data = bytes(block)
+            self.sensor.release(block)
+            block = data
+            self.copied += 1
+        # One reference per client plus ours, so the block outlives the loop below
+        shared = _SharedBlock(header, block, len(clients) + 1, self.sensor.release)
+        for client in clients:
+            client.offer(shared)
+        shared.done()
+
+
+class StreamClient(object):
+    def __init__(self, address, frequency=None, gain=None, rcvbuf=None, timeout=10.0):
+        """
+        Connects to a StreamServer and reads its frames.
+
+        Parameters:
+            address:    (host, port) or 'host:port' for TCP, a path for a Unix socket
+            frequency:  center frequency (Hz) to ask for; None joins the running capture
+            gain:       gain to ask for
+            rcvbuf:     SO_RCVBUF of the socket, system default if None
+            timeout:    seconds to wait for the connection and for each frame
+
+        Raises HandshakeError when the server refuses the request."""
+        self.address = parse_address(address)
+        self.sock = socket.socket(_family(self.address), socket.SOCK_STREAM)
+        if rcvbuf is not None:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, int(rcvbuf))
+        self.sock.settimeout(timeout)
+        self.sock.connect(self.address)
+        request = {}
+        if frequency is not None:
+            request['frequency'] = frequency
+        if gain is not None:
+            request['gain'] = gain
+        _send_json(self.sock, request)
+        self.reply = json.loads(_read_line(self.sock).decode())
+        if not self.reply.get('ok'):
+            self.sock.close()
+            raise HandshakeError(self.reply.get('error', 'refused'))
+        if self.reply.get('header_size') != HEADER_SIZE:
+            self.sock.close()
+            raise HandshakeError('server frame header is %s bytes, expected %i'
+                                 % (self.reply.get('header_size'), HEADER_SIZE))
+        self._header = bytearray(HEADER_SIZE)
+        self._buffer = bytearray(BLOCK_SIZE)
+
+        # Counters
+        self.frames = 0
+        self.bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def __iter__(self):
+        """
+        Yields (FrameHeader, payload) until the server closes the connection.
+        payload is a memoryview into a reused buffer, valid until the next
+        frame is read."""
+        while True:
+            if not self._read_into(memoryview(self._header)):
+                return
+            header = decode_header(self._header)
+            if header.payload_length > len(self._buffer):
+                self._buffer = bytearray(header.payload_length)
+            payload = memoryview(self._buffer)[:header.payload_length]
+            if not self._read_into(payload):
+                raise FrameError('connection closed inside a frame')
+            self.frames += 1
+            self.bytes += header.payload_length
+            yield header, payload
+
+    def _read_into(self, view):
+        # Fill view from the socket; False on a clean close before the first byte
+        got = 0
+        while got < len(view):
+            n = self.sock.recv_into(view[got:])
+            if not n:
+                if got:
+                    raise FrameError('connection closed inside a frame')
+                return False
+            got += n
+        return True
+
+
+def _consume(client, duration, counts, delay=0):
+    deadline = time.monotonic() + duration
+    last = None
+    try:
+        for header, _ in client:
+            if last is not None:
+                counts['gaps'] += header.capture_seq - last - 1
+            last = header.capture_seq
+            counts['frames'] += 1
+            counts['bytes'] += header.payload_length
+            if time.monotonic() >= deadline:
+                break
+            if delay:
+                time.sleep(delay)
+    except OSError:
+        pass
+    finally:
+        client.close()
+
+
+def benchmark_stream(sensor, address, clients=2, duration=5.0, frequency=1.625e9, gain=1, slow_client=False,
+                     **kwargs):
+    """
+    Throughput of StreamServer to local clients. With slow_client one more
+    client reads a frame every 50 ms to show the others are unaffected.
+    kwargs go to StreamServer."""
+    with StreamServer(sensor, address, **kwargs) as server:
+        readers = []
+        for i in range(clients + int(bool(slow_client))):
+            client = StreamClient(server.address, frequency, gain)
+            counts = {'frames': 0, 'bytes': 0, 'gaps': 0}
+            delay = 0.05 if i == clients else 0
+            thread = threading.Thread(target=_consume, args=(client, duration, counts, delay), daemon=True)
+            readers.append((thread, counts))
+        t0 = time.monotonic()
+        for thread, _ in readers:
+            thread.start()
+        for thread, _ in readers:
+            thread.join(duration + 10)
+        elapsed = time.monotonic() - t0
+        stats = server.stats()
+    results = [dict(counts, mb_per_s=counts['bytes'] / elapsed / 1e6) for _, counts in readers]
+    return {'elapsed': elapsed, 'server': stats, 'clients': results}
+
+
+def benchmark_mqtt(sensor, host, port=1883, duration=5.0, frequency=1.625e9, gain=1):
+    """
+    Throughput of the main_mmap.py path (FrameWriter, MqttPublisher) to a
+    Subscriber through the broker at host. None when no broker answers."""
+    import paho.mqtt.client as mqtt
+    from definitions import RAW_TOPIC
+    from framing import FrameWriter, as_payload
+    from publisher import MqttPublisher
+    from subscriber import Subscriber
+
+    subscriber = Subscriber()
+    try:
+        subscriber.connect(host, port, RAW_TOPIC)
+    except OSError:
+        return None
+    client = mqtt.Client()
+    client.connect(host, port, 60)
+    publisher = MqttPublisher(client, RAW_TOPIC)
+    writer = FrameWriter(pool=sensor.pool)
+    time.sleep(0.5)     # let the subscription settle
+    seq = 0
+    t0 = time.monotonic()
+    with publisher:
+        with sensor.stream(frequency, gain, duration=duration) as blocks:
+            for block in blocks:
+                frame = writer.frame(block, seq, seq, frequency, gain)
+                publisher.publish(as_payload(frame), release=lambda block=block: sensor.release(block))
+                seq += 1
+    time.sleep(1.0)     # let the subscriber drain
+    elapsed = time.monotonic() - t0
+    subscriber.close()
+    client.disconnect()
+    s = subscriber.stats()
+    return {'elapsed': elapsed, 'published': publisher.published, 'dropped': publisher.dropped,
+            'delivered': s['delivered'], 'lost': s['lost'], 'mb_per_s': s['bytes'] / elapsed / 1e6}
+
+
+def main():
+    from capture_backends import BACKENDS
+    parser = argparse.ArgumentParser(description="RadioHound raw capture streaming server")
+    parser.add_argument("--listen", default=":%i" % DEFAULT_PORT,
+                        help="host:port to listen on, or a Unix socket path")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="pool",
+                        help="Capture backend used to read the ADC")
+    parser.add_argument("--backlog", type=int, default=4, help="Blocks queued per client")
+    parser.add_argument("--policy", choices=SLOW_CLIENT_POLICIES, default="drop-oldest",
+                        help="What happens to a client that cannot keep up")
+    parser.add_argument("--max-clients", type=int, default=8, help="Connections accepted at once")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between statistics lines")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Measure against a simulated RadioHound instead of serving the real one")
+    parser.add_argument("--clients", type=int, default=2, help="Benchmark clients")
+    parser.add_argument("--slow-client", action="store_true", help="Add a benchmark client that reads slowly")
+    parser.add_argument("--duration", type=float, default=5.0, help="Benchmark length in seconds")
+    parser.add_argument("--broker", default=None, help="MQTT broker host to compare against, host[:port]")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_main(args)
+        return
+
+    from receiver import RadioHoundSensorV3
+    # Enough while clients share their backlogs; past that, StreamServer copies blocks out
+    sensor = RadioHoundSensorV3(backend=args.backend, pool_size=max(BUFFER_POOL_SIZE, args.backlog + 2))
+    server = StreamServer(sensor, args.listen, backlog_blocks=args.backlog, policy=args.policy,
+                          max_clients=args.max_clients)
+    server.start()
+    print("Streaming on %s" % (server.address,))
+    try:
+        while True:
+            time.sleep(args.interval)
+            s = server.stats()
+            print("%i blocks captured, %i clients%s" % (s['captured'], len(s['clients']), "".join(
+                "\n  %s: %i sent, %i dropped, backlog %i" % (c['peer'] or 'local', c['sent'], c['dropped'],
+                                                              c['backlog']) for c in s['clients'])))
+    except KeyboardInterrupt:
+        print("Interrupted by user.")
+    finally:
+        server.stop()
+        sensor.close()
+
+
+def benchmark_main(args):
+    from simulation import simulated
+    sim, sensor = simulated(args.backend, pool_size=max(BUFFER_POOL_SIZE, args.backlog + 2))
+    try:
+        r = benchmark_stream(sensor, args.listen, clients=args.clients, duration=args.duration,
+                             slow_client=args.slow_client, backlog_blocks=args.backlog, policy=args.policy,
+                             max_clients=args.max_clients)
+        s = r['server']
+        print("Stream (%s backend): %i blocks captured, %i copied out of the pool, %.1f MB/s" % (
+            args.backend, s['captured'], s['copied'], s['captured_bytes'] / r['elapsed'] / 1e6))
+        for i, c in enumerate(r['clients']):
+            print("  client %i: %i frames, %.1f MB/s, %i dropped (gaps)" % (i, c['frames'], c['mb_per_s'], c['gaps']))
+        if args.broker is None:
+            print("MQTT: skipped, no --broker given")
+            return
+        host, _, port = args.broker.partition(':')
+        m = benchmark_mqtt(sensor, host, int(port or 1883), duration=args.duration)
+        if m is None:
+            print("MQTT: skipped, no broker at " + args.broker)
+        else:
+            print("MQTT: %i published, %i dropped, %i delivered (%i lost), %.1f MB/s" % (
+                m['published'], m['dropped'], m['delivered'], m['lost'], m['mb_per_s']))
+    finally:
+        sensor.close()
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
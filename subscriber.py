@@ -0,0 +1,262 @@
+import argparse
+import collections
+import threading
+import time
+
+import numpy as np
+
+from definitions import RAW_TOPIC, DATA_TOPIC_BASE
+from framing import decode_frame, FrameError
+from compression import decompress, CompressionError
+
+
+class Reassembler(object):
+    def __init__(self, deliver, reorder_window=8):
+        """
+        Puts frames back in capture order.
+
+        Parameters:
+            deliver:         deliver(header, data) called for every frame, in
+                             capture_seq order
+            reorder_window:  frames held back waiting for a missing one; when
+                             more are waiting, the missing frames count as
+                             lost; two frames in a row further behind than
+                             this start a new stream (the sender restarted)
+
+        Frames that arrive after a later one and are still delivered count as
+        reordered; frames that arrive after their place has been given up
+        on, or twice, are counted as late and dropped. block_index steps
+        between delivered frames that lost frames do not explain are blocks
+        the sensor lost (ring overruns) before they were ever published."""
+        self.deliver = deliver
+        self.reorder_window = int(reorder_window)
+        self.expected = None
+        self._waiting = {}
+        self._max_seen = None
+        self._last = None       # (capture_seq, block_index) of the last delivered frame
+        self._behind = None     # (header, data) far behind expected: a straggler, or a restarted sender
+
+        # Counters
+        self.delivered = 0
+        self.lost = 0
+        self.reordered = 0
+        self.late = 0
+        self.sensor_gaps = 0
+        self.restarts = 0
+
+    def add(self, header, data):
+        seq = header.capture_seq
+        if self.expected is not None and seq < self.expected - self.reorder_window:
+            if self._behind is None:
+                # A late straggler or the first frame of a restarted sender; the next frame tells
+                self._behind = (header, data)
+                return
+            # Sequence numbers started over: finish the old stream and follow the new one
+            first = self._behind
+            self._behind = None
+            self.flush()
+            self.expected = None
+            self._max_seen = None
+            self._last = None
+            self.restarts += 1
+            self._add(*first)
+        elif self._behind is not None:
+            self._behind = None
+            self.late += 1
+        self._add(header, data)
+
+    def _add(self, header, data):
+        seq = header.capture_seq
+        if self.expected is None:
+            self.expected = seq
+        if seq < self.expected or seq in self._waiting:
+            self.late += 1
+            return
+        if self._max_seen is not None and seq < self._max_seen:
+            self.reordered += 1
+        self._max_seen = seq if self._max_seen is None else max(self._max_seen, seq)
+        self._waiting[seq] = (header, data)
+        self._release()
+        if len(self._waiting) > self.reorder_window:
+            # Give up on the missing frames before the oldest waiting one
+            first = min(self._waiting)
+            self.lost += first - self.expected
+            self.expected = first
+            self._release()
+
+    def flush(self):
+        """Deliver everything still waiting, counting the holes as lost."""
+        if self._behind is not None:
+            self._behind = None
+            self.late += 1
+        while self._waiting:
+            first = min(self._waiting)
+            self.lost += first - self.expected
+            self.expected = first
+            self._release()
+
+    def _release(self):
+        while self.expected in self._waiting:
+            header, data = self._waiting.pop(self.expected)
+            if self._last is not None:
+                # Block index steps not explained by frames lost on the way
+                skipped = (header.block_index - self._last[1]) - (header.capture_seq - self._last[0])
+                self.sensor_gaps += max(skipped, 0)
+            self._last = (header.capture_seq, header.block_index)
+            self.delivered += 1
+            self.expected += 1
+            self.deliver(header, data)
+
+
+class Subscriber(object):
+    def __init__(self, callback=None, output=None, reorder_window=8, latency_window=4096):
+        """
+        Consumer side of main_mmap.py: decodes raw capture frames, restores
+        their order and hands the samples on.
+
+        Parameters:
+            callback:        callback(header, samples) for every frame in
+                             order, samples a uint8 NumPy array of the raw
+                             ADC block (decompressed)
+            output:          file object the raw samples are appended to, in
+                             order (the format compression.recorded_blocks
+                             reads back)
+            reorder_window:  see Reassembler
+            latency_window:  latencies kept for percentiles
+
+        Latency is the time from the frame's wall-clock capture stamp to
+        its arrival here, so it includes any clock offset between the hosts.
+        handle() takes one message payload and can be fed from any
+        transport; connect() wires it to an MQTT broker."""
+        self.callback = callback
+        self.output = output
+        self.reassembler = Reassembler(self._deliver, reorder_window)
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self.client = None
+
+        self.started = time.monotonic()
+        self._mark = (self.started, 0)
+
+        # Counters
+        self.frames = 0
+        self.bytes = 0          # raw sample bytes delivered
+        self.wire_bytes = 0     # message bytes received
+        self.errors = 0
+
+    def handle(self, message):
+        """Decode one frame (bytes-like) and pass it on."""
+        received_ns = time.time_ns()
+        with self._lock:
+            self.wire_bytes += len(message)
+            try:
+                header, payload = decode_frame(message)
+                data = decompress(header.codec, payload, header.raw_length)
+            except (FrameError, CompressionError) as e:
+                self.errors += 1
+                print("Dropped undecodable frame: " + str(e))
+                return
+            self.frames += 1
+            self._latencies.append((received_ns - header.wall_ns) / 1e9)
+            self.reassembler.add(header, data)
+
+    def flush(self):
+        with self._lock:
+            self.reassembler.flush()
+
+    def connect(self, host, port=1883, topic=RAW_TOPIC, keepalive=60):
+        """Subscribe to topic on an MQTT broker, handling messages on paho's network thread."""
+        import paho.mqtt.client as mqtt
+        self.client = mqtt.Client()
+        self.client.on_connect = lambda client, userdata, flags, rc: client.subscribe(topic)
+        self.client.on_message = lambda client, userdata, msg: self.handle(msg.payload)
+        self.client.connect(host, port, keepalive)
+        self.client.loop_start()
+
+    def close(self):
+        if self.client is not None:
+            self.client.loop_stop()
+            self.client.disconnect()
+            self.client = None
+        self.flush()
+
+    def stats(self, interval=False):
+        """
+        Counters, throughput and latency percentiles. With interval, mb_per_s
+        covers the time since the previous stats(interval=True) call."""
+        with self._lock:
+            now = time.monotonic()
+            r = self.reassembler
+            if interval:
+                since, base = self._mark
+                self._mark = (now, self.bytes)
+            else:
+                since, base = self.started, 0
+            latencies = np.array(self._latencies) if self._latencies else None
+            stats = {'frames': self.frames,
+                     'delivered': r.delivered,
+                     'bytes': self.bytes,
+                     'wire_bytes': self.wire_bytes,
+                     'mb_per_s': (self.bytes - base) / max(now - since, 1e-9) / 1e6,
+                     'lost': r.lost,
+                     'loss_rate': r.lost / float(r.lost + r.delivered) if r.lost + r.delivered else 0.0,
+                     'reordered': r.reordered,
+                     'late': r.late,
+                     'sensor_gaps': r.sensor_gaps,
+                     'restarts': r.restarts,
+                     'errors': self.errors}
+        for p in (50, 90, 99):
+            stats['latency_p%i' % p] = float(np.percentile(latencies, p)) if latencies is not None else None
+        return stats
+
+    def _deliver(self, header, data):
+        self.bytes += header.raw_length
+        if self.output is not None:
+            self.output.write(data)
+        if self.callback is not None:
+            self.callback(header, np.frombuffer(data, dtype=np.uint8))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RadioHound raw capture subscriber")
+    parser.add_argument("--host", default="127.0.0.1", help="MQTT broker")
+    parser.add_argument("--port", type=int, default=1883, help="MQTT broker port")
+    parser.add_argument("--topic", default=RAW_TOPIC, help="Topic the sender publishes to")
+    parser.add_argument("--mac", default=None, help="Subscribe to the data topic of this sensor MAC instead")
+    parser.add_argument("--output", default=None, help="File the raw samples are written to")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to run, until interrupted by default")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between statistics lines")
+    parser.add_argument("--reorder-window", type=int, default=8, help="Frames held back waiting for a missing one")
+    args = parser.parse_args()
+
+    topic = DATA_TOPIC_BASE + args.mac if args.mac else args.topic
+    output = open(args.output, "wb") if args.output else None
+    subscriber = Subscriber(output=output, reorder_window=args.reorder_window)
+    subscriber.connect(args.host, args.port, topic)
+    print("Subscribed to " + topic)
+
+    start = time.monotonic()
+    try:
+        while args.duration is None or time.monotonic() - start < args.duration:
+            time.sleep(args.interval)
+            s = subscriber.stats(interval=True)
+            latency = "" if s['latency_p50'] is None else \
+                f", latency p50 {s['latency_p50'] * 1e3:.1f} / p90 {s['latency_p90'] * 1e3:.1f} / " \
+                f"p99 {s['latency_p99'] * 1e3:.1f} ms"
+            print(f"{s['delivered']} frames, {s['mb_per_s']:.1f} MB/s, loss {s['loss_rate'] * 100:.2f}% "
+                  f"({s['lost']} lost, {s['reordered']} reordered, {s['late']} late, "
+                  f"{s['sensor_gaps']} sensor gaps, {s['restarts']} restarts){latency}")
+    except KeyboardInterrupt:
+        print("Interrupted by user.")
+    finally:
+        subscriber.close()
+        if output is not None:
+            output.close()
+
+    s = subscriber.stats()
+    print(f"Total: {s['delivered']} frames, {s['bytes'] / 1e6:.1f} MB raw ({s['wire_bytes'] / 1e6:.1f} MB received), "
+          f"{s['mb_per_s']:.1f} MB/s, loss {s['loss_rate'] * 100:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
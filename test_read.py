@@ -1,5 +1,5 @@
 import os, time
-from cython_fastread.fastread import fast_read
+from cython_fastread.fastread import fast_read, fast_readinto, fast_readv
 
 DEV = "/dev/beaglelogic"
 SIZE = 1024 * 1024  # 1 MiB
@@ -36,4 +36,19 @@ print("os.read:  ",
       "first16=", buf_o[:16],
       f"  @ {SIZE/(t1-t0)/1e6:.1f} MB/s")
 
+# 4) 用 fast_readinto / fast_readv 读入预分配缓冲区（读取期间释放 GIL）
+buf_i = bytearray(SIZE)
+t0 = time.time()
+n = fast_readinto(fd, buf_i)
+t1 = time.time()
+print("fast_readinto:", "len=", n, "first16=", bytes(buf_i[:16]),
+      f"  @ {n/(t1-t0)/1e6:.1f} MB/s")
+
+bufs = [bytearray(SIZE) for _ in range(4)]
+t0 = time.time()
+n = fast_readv(fd, bufs)
+t1 = time.time()
+print("fast_readv:   ", "buffers=", len(bufs), "len=", n,
+      f"  @ {n/(t1-t0)/1e6:.1f} MB/s")
+
 os.close(fd)
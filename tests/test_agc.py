@@ -0,0 +1,178 @@
+import json
+
+import numpy as np
+import pytest
+
+from agc import AutoGain, GainCache
+from definitions import ADC_FULL_SCALE, ADC_OFFSET
+from receiver import Receiver, RadioHoundSensorV3
+from simulation import simulated
+
+BLOCK = 64 * 1024
+
+
+def codes_of(v):
+    return np.clip(np.round(v / ADC_FULL_SCALE * ADC_OFFSET + ADC_OFFSET), 0, 255).astype(np.uint8)
+
+
+class FakeReceiver(object):
+    # The receiver side of the AGC loop: RadioHoundSensorV3's gain grid and the receivers' gain suggestion
+    calcSuggestedGain = Receiver.calcSuggestedGain
+    getPermissibleGain = RadioHoundSensorV3.getPermissibleGain
+
+    def __init__(self, ideal_gain=19, gain=1):
+        self._gainlst = np.arange(-5, 41, 3)
+        self._targetPower = 0.512 ** 2 / 2.0 / 2.0
+        self.ideal_gain = ideal_gain
+        self.frequency = None
+        self._gain = gain
+        self.last_frequency = None
+        self.last_gain = None
+        self.suggested_gain = None
+        self.captured_at = []
+        self.released = []
+        self.rng = np.random.default_rng(0)
+
+    @property
+    def gain(self):
+        return self._gain
+
+    @gain.setter
+    def gain(self, value):
+        self._gain = self.getPermissibleGain(value)
+
+    def collect(self):
+        # Noise reaching the target power at ideal_gain, clipped at the ADC rails above it
+        self.captured_at.append(self.gain)
+        self.last_frequency, self.last_gain = self.frequency, self.gain
+        rms = np.sqrt(self._targetPower) * 10 ** ((self.gain - self.ideal_gain) / 20.0)
+        return codes_of(rms * self.rng.standard_normal(BLOCK)).tobytes()
+
+    def release(self, data):
+        self.released.append(data)
+
+
+def test_converges_from_a_low_gain_and_caches_it():
+    receiver = FakeReceiver()
+    agc = AutoGain(max_iterations=8)
+    data = agc.capture(receiver, receiver.collect, 100e6, 1)
+    assert abs(receiver.gain - receiver.ideal_gain) <= 3
+    # Gains only step up towards the target, and every capture but the returned one is released
+    assert receiver.captured_at == sorted(receiver.captured_at) and len(receiver.captured_at) > 2
+    assert len(receiver.released) == len(receiver.captured_at) - 1 and data not in receiver.released
+    assert agc.unconverged == 0 and agc.recaptures == agc.captures - 1
+    assert agc.cache.get(100e6) == receiver.gain
+
+
+def test_cache_hit_starts_at_the_converged_gain():
+    receiver = FakeReceiver()
+    agc = AutoGain(max_iterations=8)
+    agc.capture(receiver, receiver.collect, 100e6, 1)
+    converged = receiver.gain
+    captures = agc.captures
+    # Same frequency bin, whatever gain is asked for
+    agc.capture(receiver, receiver.collect, 100.2e6, 40)
+    assert agc.cache_hits == 1
+    assert agc.captures == captures + 1 and receiver.captured_at[-1] == converged
+    # Another bin misses and starts from the requested gain
+    first = len(receiver.captured_at)
+    agc.capture(receiver, receiver.collect, 300e6, 40)
+    assert agc.cache_hits == 1 and receiver.captured_at[first] == 40
+    assert agc.stats()['cached_bins'] == 2
+
+
+def test_saturated_capture_backs_off():
+    receiver = FakeReceiver(gain=40)
+    agc = AutoGain(max_iterations=8)
+    agc.capture(receiver, receiver.collect, 100e6, 40)
+    assert agc.saturated >= 1
+    assert abs(receiver.gain - receiver.ideal_gain) <= 3
+    assert not agc.estimate_power(receiver.collect())[1]
+
+
+def test_clipping_overrides_a_low_power_estimate():
+    # Mostly mid-scale with 10% of the samples at the rails: low power, yet clipped
+    block = np.full(BLOCK, ADC_OFFSET, dtype=np.uint8)
+    block[::10] = 255
+    receiver = FakeReceiver(gain=19)
+    receiver.collect = lambda: block.tobytes()
+    agc = AutoGain(max_iterations=1, decimation=1)
+    power, clipped = agc.estimate_power(block.tobytes())
+    assert clipped and power < receiver._targetPower
+    agc.capture(receiver, receiver.collect, 100e6, 19)
+    # The power alone asks for more gain; the backoff takes it down by at least saturation_step
+    assert receiver.suggested_gain > 19
+    assert agc.cache.get(100e6) == 16 and agc.saturated == 1 and agc.unconverged == 1
+
+
+def test_discards_captures_after_a_retune():
+    receiver = FakeReceiver(ideal_gain=1)
+    agc = AutoGain(discard=2)
+    agc.capture(receiver, receiver.collect, 100e6, 1)
+    assert agc.captures == 1 and len(receiver.released) == 2
+    # Nothing changed: nothing to discard
+    agc.capture(receiver, receiver.collect, 100e6, 1)
+    assert len(receiver.released) == 2
+
+
+def test_cache_persists_and_reloads(tmp_path):
+    path = str(tmp_path / 'agcGainCache.json')
+    cache = GainCache(path)
+    assert len(cache) == 0
+    cache.set(100e6, 19)
+    cache.set(433.9e6, -5)
+    cache.save()
+    assert not cache.dirty
+    with open(path) as fp:
+        assert json.load(fp) == {'bin_width': 1e6, 'gains': {'100': 19, '434': -5}}
+    reloaded = GainCache(path)
+    assert reloaded.get(100.3e6) == 19 and reloaded.get(434e6) == -5 and len(reloaded) == 2
+    # A cache of another bin width is not used
+    assert len(GainCache(path, bin_width=5e6)) == 0
+
+
+def test_maybe_save_waits_for_the_interval(tmp_path):
+    path = tmp_path / 'agcGainCache.json'
+    cache = GainCache(str(path), save_interval=3600)
+    cache.set(100e6, 19)
+    cache.maybe_save()
+    assert path.exists()
+    cache.set(200e6, 22)
+    cache.maybe_save()
+    assert cache.dirty and len(GainCache(str(path))) == 1
+    cache.save()
+    assert len(GainCache(str(path))) == 2
+    # Unchanged gains do not dirty the cache
+    cache.set(200e6, 22)
+    assert not cache.dirty
+
+
+def test_unreadable_cache_starts_empty(tmp_path):
+    path = tmp_path / 'agcGainCache.json'
+    path.write_text('{"bin_width": 1e6, "gai')
+    assert len(GainCache(str(path))) == 0
+    assert len(GainCache(str(tmp_path / 'missing.json'))) == 0
+
+
+def test_sensor_keeps_its_gains_across_restarts(tmp_path):
+    path = str(tmp_path / 'agcGainCache.json')
+    sim, sensor = simulated('pool', agc_cache=path)
+    try:
+        sensor.release(sensor.raw(100e6, gain=10, agc=True))
+        converged = sensor.gain
+    finally:
+        sensor.close()
+        sim.stop()
+    assert GainCache(path).get(100e6) == converged
+    sim, sensor = simulated('pool', agc_cache=path)
+    try:
+        sensor.release(sensor.raw(100e6, gain=-5, agc=True))
+        assert sensor.agc.cache_hits == 1 and sensor.gain == converged
+    finally:
+        sensor.close()
+        sim.stop()
+
+
+def test_bad_parameters():
+    with pytest.raises(ValueError):
+        AutoGain(max_iterations=0)
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from buffer_pool import BufferPool
+
+
+def test_acquire_release_cycles_buffers():
+    pool = BufferPool(pool_size=2, buffer_size=16, timeout=0)
+    a = pool.acquire()
+    b = pool.acquire()
+    assert pool.available == 0
+    assert len(a) == 16 and a.obj is not b.obj
+    pool.release(a)
+    c = pool.acquire()
+    assert c.obj is a.obj
+    pool.release(b)
+    pool.release(c)
+    assert pool.available == 2
+    assert pool.acquired == 3 and pool.released == 3
+
+
+def test_exhausted_pool_raises():
+    pool = BufferPool(pool_size=1, buffer_size=16, timeout=0)
+    pool.acquire()
+    with pytest.raises(RuntimeError, match='exhausted'):
+        pool.acquire()
+
+
+def test_double_release_is_rejected():
+    pool = BufferPool(pool_size=2, buffer_size=16)
+    view = pool.acquire()
+    pool.release(view)
+    with pytest.raises(ValueError, match='twice'):
+        pool.release(view)
+    assert pool.available == 2
+
+
+def test_foreign_buffer_is_rejected():
+    pool = BufferPool(pool_size=1, buffer_size=16)
+    with pytest.raises(ValueError, match='does not belong'):
+        pool.release(memoryview(bytearray(16)))
+    assert not pool.owns(memoryview(bytearray(16)))
+
+
+def test_headroom_and_framed():
+    pool = BufferPool(pool_size=1, buffer_size=32, headroom=8)
+    view = pool.acquire()
+    assert len(view) == 32 and len(view.obj) == 40
+    assert pool.owns(view)
+    assert pool.framed(view, 8) is view.obj
+    assert pool.framed(view[:10], 4).nbytes == 14
+    with pytest.raises(ValueError):
+        pool.framed(view, 9)
+
+
+def test_read_fills_buffer_and_releases_on_eof():
+    pool = BufferPool(pool_size=2, buffer_size=8)
+    r, w = os.pipe()
+    try:
+        os.write(w, b'0123456789')
+        os.close(w)
+        w = None
+        first = pool.read(r)
+        second = pool.read(r)
+        assert bytes(first) == b'01234567'
+        assert bytes(second) == b'89'
+        pool.release(first)
+        pool.release(second)
+        assert pool.read(r) is None
+        assert pool.available == 2
+    finally:
+        os.close(r)
+        if w is not None:
+            os.close(w)
@@ -0,0 +1,73 @@
+import json
+import zlib
+
+import pytest
+
+from cal_transport import (CAL_HEADER, CalibrationFormatError, CalibrationTransport, FRAME_SIZE, PLL_READ_CTRL,
+                           decode_table, encode_table, parse_header)
+from simulation import SimulatedRadio, SimulatedSPI
+
+TABLE = {'board_id': 'RH-0001', 'frequencies': [100, 1000, 6000], 'gain': {'-5': [1.0, 2.0, 3.0]}}
+
+
+class RecordingSPI(SimulatedSPI):
+    def __init__(self):
+        SimulatedSPI.__init__(self, SimulatedRadio(), clock_hz=1e9, msp_latency=0.0)
+        self.sent = []
+
+    def xfer2(self, data):
+        self.sent.append(list(data))
+        return SimulatedSPI.xfer2(self, data)
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_container_round_trip(compress):
+    data = encode_table(TABLE, compress=compress)
+    version, flags, length, crc = parse_header(data)
+    assert length == len(data) - CAL_HEADER.size
+    assert crc == zlib.crc32(data[CAL_HEADER.size:])
+    assert decode_table(data) == TABLE
+
+
+def test_crc_mismatch_is_rejected():
+    data = bytearray(encode_table(TABLE))
+    data[-1] ^= 0xff
+    with pytest.raises(CalibrationFormatError, match='CRC'):
+        decode_table(data)
+
+
+def test_truncated_payload_is_rejected():
+    with pytest.raises(CalibrationFormatError, match='truncated'):
+        decode_table(encode_table(TABLE)[:-4])
+
+
+def test_legacy_json_and_blank_memory():
+    legacy = json.dumps(TABLE).encode() + b'\x00' * 64
+    assert decode_table(legacy) == TABLE
+    assert decode_table(bytes(256)) is None
+
+
+def test_transport_writes_reads_and_skips_identical_writes():
+    spi = RecordingSPI()
+    transport = CalibrationTransport(spi=spi)
+    assert transport.read_table() is None
+    assert transport.write_table(TABLE)
+    assert transport.read_table() == TABLE
+    assert parse_header(encode_table(TABLE))[3] == transport.read_header()[3]
+    assert not transport.write_table(TABLE)
+    assert transport.skipped_writes == 1
+    assert transport.write_table(TABLE, force=True)
+
+
+def test_session_break_frame_only_reads_the_pll():
+    spi = RecordingSPI()
+    transport = CalibrationTransport(spi=spi)
+    transport.write_table(TABLE)
+    transport.read_table()
+    frames = [sent[i:i + FRAME_SIZE] for sent in spi.sent for i in range(0, len(sent), FRAME_SIZE)]
+    pll = [frame for frame in frames if frame[0] == PLL_READ_CTRL]
+    assert pll
+    for frame in pll:
+        # Bit 7 of byte 1 makes it a register read, as in mspCommandBeagle("readPLLReg")
+        assert frame[1] & 0x80
+        assert frame[2:] == [0xff] * (FRAME_SIZE - 2)
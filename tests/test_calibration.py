@@ -0,0 +1,66 @@
+import json
+
+import numpy as np
+import pytest
+
+import calibration
+import tools
+from calibration import Calibration, CalibrationError, actual_gain
+
+TABLE = {'board_id': 'RH-0001', 'msp_version': '7', 'frequencies': [100, 6000], 'gain': [10.0, 20.0]}
+
+
+def test_grid_holds_linear_correction_factors():
+    cal = Calibration(TABLE, resolution=10.0, gains=[1])
+    expected = 10 ** (-(np.interp(cal.frequencies, [100, 6000], [10.0, 20.0]) + actual_gain(1)) / 10.0)
+    assert np.allclose(cal.grid[0], expected)
+    psd = np.ones(3)
+    freqs = np.array([100e6, 3050e6, 6000e6])
+    assert np.allclose(cal.apply(psd, freqs, 1), cal.factors(freqs, 1))
+    assert cal.factors(freqs, 1) is cal.factors(freqs.copy(), 1)
+
+
+def test_validate_checks_board_and_msp_version():
+    cal = Calibration(TABLE, resolution=100.0)
+    assert cal.validate(msp_version='7', board_id='RH-0001') is cal
+    with pytest.raises(CalibrationError, match='board'):
+        cal.validate(board_id='RH-0002')
+    with pytest.raises(CalibrationError, match='MSP version'):
+        cal.validate(msp_version='8')
+    with pytest.raises(CalibrationError, match='no RadioHound'):
+        cal.validate(msp_version='255')
+
+
+def test_load_rejects_another_board(tmp_path):
+    path = str(tmp_path / 'cal.json')
+    with open(path, 'w') as fp:
+        json.dump(TABLE, fp)
+    assert calibration.load(path, board_id='RH-0001', resolution=100.0).table == TABLE
+    with pytest.raises(CalibrationError):
+        calibration.load(path, board_id='RH-0002', resolution=100.0)
+
+
+def test_cached_table_is_copied(tmp_path):
+    path = str(tmp_path / 'cal.json')
+    with open(path, 'w') as fp:
+        json.dump(TABLE, fp)
+    tools.load_calibration_data(path)['gain'].append(0.0)
+    assert tools.load_calibration_data(path) == TABLE
+    assert tools.load_calibration_data(str(tmp_path / 'missing.json')) is None
+
+
+def test_sensor_applies_only_its_own_board_table(tmp_path):
+    from cal_transport import CalibrationTransport
+    from simulation import simulated
+    sim, sensor = simulated('pool')
+    try:
+        CalibrationTransport(spi=sensor.spi).write_table(TABLE)
+        assert sensor.mspBoardId() == 'RH-0001'
+        for board, applied in (('RH-0001', True), ('RH-0002', False)):
+            path = str(tmp_path / (board + '.json'))
+            with open(path, 'w') as fp:
+                json.dump(dict(TABLE, board_id=board, msp_version=None), fp)
+            assert (sensor._loadCalibration(path) is not None) == applied
+    finally:
+        sensor.close()
+        sim.stop()
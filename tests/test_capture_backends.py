@@ -0,0 +1,92 @@
+import itertools
+
+import pytest
+
+from capture_backends import MmapRingBackend
+from simulation import SimulatedBeagleLogic
+
+BLOCK = 4096
+RING_BLOCKS = 8
+
+
+@pytest.fixture
+def ring():
+    # The writer thread is never started: the ring file is filled by hand
+    sim = SimulatedBeagleLogic(mode='file', block_size=BLOCK, ring_size=BLOCK * RING_BLOCKS)
+    with open(sim.dev_path, 'r+b') as fp:
+        for i in range(RING_BLOCKS):
+            fp.write(bytes([i + 1]) * BLOCK)
+    backend = MmapRingBackend(dev_path=sim.dev_path, buffer_size=BLOCK * RING_BLOCKS, block_size=BLOCK,
+                              sysfs_path=sim.sysfs_path)
+    yield sim, backend
+    backend.close()
+    sim.stop()
+
+
+def ready(backend, *counts):
+    # Make the driver report counts[0] filled blocks for the first read(), counts[1] for the next, ...
+    # read() stops asking once it has taken a whole ring
+    pending = itertools.chain.from_iterable([True] * n + [False] * (n < RING_BLOCKS) for n in counts)
+    backend._blockReady = lambda timeout: next(pending, False)
+
+
+def set_lasterror(sim, value):
+    with open(sim.sysfs_path + 'lasterror', 'w') as fp:
+        fp.write('%#x\n' % value)
+
+
+def test_read_returns_the_filled_blocks_in_order(ring):
+    sim, backend = ring
+    ready(backend, 3, 2)
+    blocks = backend.read()
+    assert backend.last_block_seqs == [0, 1, 2]
+    assert [block[0] for block in blocks] == [1, 2, 3]
+    backend.read()
+    assert backend.last_block_seqs == [3, 4]
+    assert backend.overruns == 0
+    with open(sim.sysfs_path + 'state') as fp:
+        assert fp.read().strip() == '1'
+
+
+def test_nothing_filled_returns_none(ring):
+    sim, backend = ring
+    ready(backend, 0)
+    assert backend.read() is None
+    assert backend.last_block_seqs == []
+
+
+def test_lapped_ring_shows_up_as_a_sequence_gap(ring):
+    sim, backend = ring
+    ready(backend, 2, RING_BLOCKS, 1)
+    backend.read()
+    assert backend.last_block_seqs == [0, 1]
+    backend.read()
+    assert backend.overruns == 1
+    assert backend.last_block_seqs == list(range(2 + RING_BLOCKS, 2 + 2 * RING_BLOCKS))
+    backend.read()
+    assert backend.last_block_seqs == [2 + 2 * RING_BLOCKS]
+
+
+def test_driver_error_counts_as_an_overrun_once(ring):
+    sim, backend = ring
+    ready(backend, 1, 1, 1)
+    backend.read()
+    set_lasterror(sim, 0x10000)
+    backend.read()
+    assert backend.overruns == 1
+    assert backend.last_block_seqs == [1 + RING_BLOCKS]
+    # Still latched from before: not a new error
+    backend.read()
+    assert backend.overruns == 1
+    assert backend.last_block_seqs == [2 + RING_BLOCKS]
+
+
+def test_all_zero_block_is_skipped_but_consumed(ring):
+    sim, backend = ring
+    with open(sim.dev_path, 'r+b') as fp:
+        fp.seek(BLOCK)
+        fp.write(bytes(BLOCK))
+    ready(backend, 3)
+    blocks = backend.read()
+    assert backend.last_block_seqs == [0, 2]
+    assert [block[0] for block in blocks] == [1, 3]
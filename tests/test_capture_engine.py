@@ -0,0 +1,118 @@
+import contextlib
+import time
+
+import pytest
+
+from capture_engine import CaptureEngine
+
+
+class RingSensor(object):
+    # mmap-like sensor: every read returns two blocks, skipping one ring slot in between
+    pool = None
+
+    def __init__(self):
+        self.next_seq = 0
+        self.last_block_seqs = []
+
+    def _read(self):
+        self.last_block_seqs = [self.next_seq, self.next_seq + 2]
+        self.next_seq += 3
+        return [b'a', b'b']
+
+    def raw(self, center_frequency, gain):
+        return self._read()
+
+    @contextlib.contextmanager
+    def stream(self, center_frequency, gain):
+        def blocks():
+            while True:
+                for block in self._read():
+                    yield block
+        yield blocks()
+
+    def release(self, block):
+        pass
+
+
+def _items(stream, n=6):
+    with CaptureEngine(RingSensor(), 1e9, queue_depth=n, stream=stream) as engine:
+        return [engine.get(timeout=2) for _ in range(n)]
+
+
+def test_items_carry_the_ring_sequence():
+    for stream in (False, True):
+        items = _items(stream)
+        assert [item[0] for item in items] == list(range(6))
+        assert [item[2] for item in items] == [0, 2, 3, 5, 6, 8]
+
+
+def test_block_index_is_none_off_the_ring():
+    class PlainSensor(RingSensor):
+        def raw(self, center_frequency, gain):
+            return b'block'
+
+    with CaptureEngine(PlainSensor(), 1e9, queue_depth=2) as engine:
+        seq, block, index = engine.get(timeout=2)
+    assert block == b'block' and index is None
+
+
+class CountingSensor(object):
+    # Numbered blocks from raw(), one per ms; records what the engine hands back
+    pool = None
+
+    def __init__(self):
+        self.n = 0
+        self.released = []
+
+    def raw(self, center_frequency, gain):
+        time.sleep(0.001)
+        self.n += 1
+        return self.n - 1
+
+    def release(self, block):
+        self.released.append(block)
+
+
+def test_block_policy_loses_nothing_to_a_slow_consumer():
+    sensor = CountingSensor()
+    with CaptureEngine(sensor, 1e9, queue_depth=2, overflow='block') as engine:
+        items = []
+        for _ in range(10):
+            items.append(engine.get(timeout=2))
+            time.sleep(0.01)
+    assert [item[0] for item in items] == list(range(10))
+    assert [item[1] for item in items] == list(range(10))
+    assert engine.dropped == 0 and engine.max_depth == 2
+    # Whatever was still queued, or waiting to be, at stop() went back to the sensor
+    assert sorted(sensor.released) == list(range(10, engine.captured))
+
+
+def test_drop_newest_keeps_the_queued_blocks():
+    sensor = CountingSensor()
+    with CaptureEngine(sensor, 1e9, queue_depth=3, overflow='drop-newest') as engine:
+        time.sleep(0.05)
+        first = [engine.get(timeout=2) for _ in range(4)]
+        dropped = engine.dropped
+    assert [item[1] for item in first[:3]] == [0, 1, 2]
+    assert dropped > 0
+    # Sequence numbers count every block read, so the drops show as a gap
+    assert first[3][0] == first[3][1] > 3
+    assert len(sensor.released) == engine.captured - 4
+
+
+def test_drop_oldest_keeps_the_newest_blocks():
+    sensor = CountingSensor()
+    with CaptureEngine(sensor, 1e9, queue_depth=3, overflow='drop-oldest') as engine:
+        time.sleep(0.05)
+        item = engine.get(timeout=2)
+        dropped = engine.dropped
+    assert dropped > 0
+    assert item[0] == item[1] >= dropped
+    # Every dropped block went back to the sensor, oldest first
+    assert sensor.released[:dropped] == list(range(dropped))
+    assert len(sensor.released) == engine.captured - 1
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        CaptureEngine(CountingSensor(), 1e9, overflow='drop-all')
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from compression import CODECS, CompressionError, CompressionStage, bitpack_decode, bitpack_encode, decompress
+
+RNG = np.random.default_rng(1)
+BLOCKS = {
+    'narrow': (128 + RNG.integers(-3, 4, 10000)).astype(np.uint8).tobytes(),
+    'full scale': RNG.integers(0, 256, 10000).astype(np.uint8).tobytes(),
+    'constant': bytes([128]) * 5000,
+    'odd length': (128 + RNG.integers(-20, 20, 4097)).astype(np.uint8).tobytes(),
+    'empty': b'',
+}
+
+
+@pytest.mark.parametrize('codec', list(CODECS))
+@pytest.mark.parametrize('name', list(BLOCKS))
+def test_codec_round_trip(codec, name):
+    block = BLOCKS[name]
+    codec_id, factory = CODECS[codec]
+    payload = factory(None)[0](block)
+    assert bytes(decompress(codec_id, payload, len(block))) == block
+
+
+def test_bitpack_shrinks_narrow_data():
+    block = BLOCKS['narrow']
+    payload = bitpack_encode(block)
+    assert len(payload) < len(block) / 2
+    assert bytes(bitpack_decode(payload)) == block
+
+
+def test_decompress_checks_codec_and_length():
+    with pytest.raises(CompressionError, match='unknown'):
+        decompress(99, b'')
+    codec_id, factory = CODECS['zlib']
+    with pytest.raises(CompressionError, match='header says'):
+        decompress(codec_id, factory(None)[0](b'abc'), 4)
+
+
+def test_stage_keeps_order_and_releases_blocks():
+    released = []
+    blocks = [bytes([i]) * 1000 for i in range(10)]
+    results = []
+    with CompressionStage('zlib', workers=2, max_pending=3) as stage:
+        for i, block in enumerate(blocks):
+            results.extend(stage.put(block, tag=i, release=lambda i=i: released.append(i)))
+            assert len(stage) <= 3
+        results.extend(stage.drain())
+    assert [tag for tag, _, _, _ in results] == list(range(10))
+    assert sorted(released) == list(range(10))
+    for tag, codec_id, payload, raw_length in results:
+        assert decompress(codec_id, payload, raw_length) == blocks[tag]
@@ -0,0 +1,61 @@
+import pytest
+
+from buffer_pool import BufferPool
+from definitions import FRAME_HEADROOM
+from framing import (CODEC_ZLIB, FRAME_VERSION, HEADER_SIZE, FrameError, FrameWriter, decode_frame, decode_header,
+                     pack_header)
+
+
+def test_header_round_trip():
+    buf = bytearray(HEADER_SIZE)
+    pack_header(buf, 0, 7, 42, 1.625e9, 10.0, 1000, codec=CODEC_ZLIB, raw_length=4096,
+                monotonic_ns=123, wall_ns=456)
+    header = decode_header(buf)
+    assert header.version == FRAME_VERSION
+    assert (header.capture_seq, header.block_index) == (7, 42)
+    assert (header.monotonic_ns, header.wall_ns) == (123, 456)
+    assert header.center_frequency == 1.625e9 and header.gain == 10.0
+    assert (header.codec, header.payload_length, header.raw_length) == (CODEC_ZLIB, 1000, 4096)
+
+
+def test_bad_frames_are_rejected():
+    with pytest.raises(FrameError, match='shorter'):
+        decode_header(bytes(HEADER_SIZE - 1))
+    with pytest.raises(FrameError, match='magic'):
+        decode_header(bytes(HEADER_SIZE))
+    writer = FrameWriter(capacity=16)
+    frame = bytes(writer.frame(b'x' * 16, 1, 1, 1e9, 1))
+    with pytest.raises(FrameError, match='payload'):
+        decode_frame(frame[:-1])
+
+
+def test_copied_frame_decodes_to_the_block():
+    writer = FrameWriter(capacity=8)
+    frame = writer.frame(b'abcdefgh', 3, 5, 1e9, 1)
+    assert isinstance(frame, bytearray)
+    header, payload = decode_frame(frame)
+    assert bytes(payload) == b'abcdefgh' and header.capture_seq == 3
+    # A larger block grows the reused buffer
+    header, payload = decode_frame(writer.frame(b'z' * 20, 4, 6, 1e9, 1))
+    assert bytes(payload) == b'z' * 20
+    assert writer.copied == 2
+
+
+def test_pool_frame_uses_headroom_without_copying():
+    pool = BufferPool(pool_size=1, buffer_size=32, headroom=FRAME_HEADROOM)
+    block = pool.acquire()
+    block[:] = bytes(range(32))
+    writer = FrameWriter(pool=pool)
+    frame = writer.frame(block, 1, 9, 1e9, 1)
+    assert frame is block.obj
+    assert writer.copied == 0
+    header, payload = decode_frame(frame)
+    assert bytes(payload) == bytes(range(32)) and header.block_index == 9
+
+
+def test_parts_leave_the_block_alone():
+    writer = FrameWriter()
+    block = b'payload'
+    header, data = writer.parts(block, 1, 2, 1e9, 1)
+    assert data is block
+    assert decode_header(header).payload_length == len(block)
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+import iq
+from definitions import ADC_FULL_SCALE, ADC_OFFSET
+from iq import IqDecoder, lookup_table
+
+
+def codes(n, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, n, dtype=np.uint8)
+
+
+def volts(c):
+    # Reference conversion the lookup table stands in for
+    return (c.astype(np.float64) - ADC_OFFSET) * ADC_FULL_SCALE / ADC_OFFSET
+
+
+def test_lookup_table_covers_every_code():
+    lut = lookup_table()
+    assert lut.dtype == np.float32 and len(lut) == 256
+    assert np.allclose(lut, volts(np.arange(256)), rtol=0, atol=1e-7)
+    assert lut[ADC_OFFSET] == 0
+    assert lookup_table() is lut and not lut.flags.writeable
+
+
+def test_iq_complex_matches_reference():
+    c = codes(2048)
+    ref = volts(c)
+    for block in (c, c.tobytes(), bytearray(c.tobytes()), memoryview(c.tobytes())):
+        x = IqDecoder().decode(block)
+        assert x.dtype == np.complex64 and x.shape == (1024,)
+        assert np.allclose(x.real, ref[0::2], atol=1e-7) and np.allclose(x.imag, ref[1::2], atol=1e-7)
+
+
+def test_iq_float32_pairs_match_reference():
+    c = codes(2048)
+    x = IqDecoder(dtype=np.float32).decode(c.tobytes())
+    assert x.dtype == np.float32 and x.shape == (1024, 2)
+    assert np.allclose(x, volts(c).reshape(-1, 2), atol=1e-7)
+
+
+def test_real_layout_matches_reference():
+    c = codes(1000)
+    decoder = IqDecoder('real', dtype=np.complex64)
+    assert decoder.dtype == np.float32
+    x = decoder.decode(c.tobytes())
+    assert x.shape == (1000,) and np.allclose(x, volts(c), atol=1e-7)
+    assert np.allclose(iq.decode(c, layout='real'), x)
+
+
+def test_list_of_blocks_decodes_back_to_back():
+    blocks = [codes(512, seed) for seed in range(3)]
+    decoder = IqDecoder()
+    assert decoder.n_samples(blocks) == 768
+    x = decoder.decode([memoryview(b.tobytes()) for b in blocks])
+    assert np.array_equal(x, decoder.decode(np.concatenate(blocks)))
+
+
+def test_trailing_odd_byte_is_ignored():
+    c = codes(101)
+    x = IqDecoder().decode(c.tobytes())
+    assert len(x) == 50
+    assert np.array_equal(x, IqDecoder().decode(c[:100]))
+    # ... in every block of a list, not just the last
+    y = IqDecoder().decode([c.tobytes(), c.tobytes()])
+    assert np.array_equal(y, np.concatenate([x, x]))
+
+
+def test_out_array_is_reused():
+    decoder = IqDecoder()
+    out = decoder.empty(1024)
+    c = codes(2048)
+    x = decoder.decode(c, out=out)
+    assert np.shares_memory(x, out) and len(x) == 1024
+    # A larger array is filled from the front and the used part returned
+    big = decoder.empty(4096)
+    y = decoder.decode(c, out=big)
+    assert len(y) == 1024 and np.shares_memory(y, big) and np.array_equal(y, x)
+    pairs = IqDecoder(dtype=np.float32)
+    out = pairs.empty(2048)
+    assert pairs.decode(c, out=out).shape == (1024, 2)
+
+
+def test_out_array_checks():
+    decoder = IqDecoder()
+    c = codes(2048)
+    with pytest.raises(ValueError, match='holds 1023 samples, 1024 needed'):
+        decoder.decode(c, out=decoder.empty(1023))
+    with pytest.raises(ValueError, match='contiguous complex64'):
+        decoder.decode(c, out=np.empty(1024, dtype=np.complex128))
+    with pytest.raises(ValueError, match='contiguous complex64'):
+        decoder.decode(c, out=decoder.empty(2048)[::2])
+    with pytest.raises(ValueError, match='contiguous float32'):
+        IqDecoder('real').decode(c, out=np.empty(2048, dtype=np.float64))
+
+
+def test_bad_parameters():
+    with pytest.raises(ValueError):
+        IqDecoder('qi')
+    with pytest.raises(ValueError):
+        IqDecoder(dtype=np.complex128)
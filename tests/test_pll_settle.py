@@ -0,0 +1,49 @@
+import time
+
+from pll_settle import SettleController
+
+
+def test_probe_stuck_at_locked_is_not_trusted():
+    settle = SettleController(lock_probe=lambda: True, max_settle=0.02)
+    for _ in range(3):
+        assert settle.wait('retune', 1e6) >= 0.02
+    assert not settle.probe_verified
+    assert settle.unverified_locks == 3
+
+
+def test_probe_that_reads_unlocked_after_a_retune_is_polled():
+    retuned = [0.0]
+
+    def probe():
+        return time.monotonic() - retuned[0] > 0.002
+
+    settle = SettleController(lock_probe=probe, max_settle=0.05)
+    for _ in range(3):
+        retuned[0] = time.monotonic()
+        assert settle.wait('retune', 1e6) < 0.02
+    assert settle.probe_verified
+    assert settle.timeouts == 0
+
+
+def test_without_probe_waits_max_settle():
+    settle = SettleController(max_settle=0.01)
+    assert settle.wait('retune', 1e6) >= 0.01
+    assert settle.wait('gain') < 0.01
+
+
+def test_probe_stuck_at_unlocked_is_not_trusted():
+    settle = SettleController(lock_probe=lambda: False, max_settle=0.01, max_lock_failures=2)
+    for _ in range(3):
+        assert settle.wait('retune', 1e6) >= 0.01
+    assert not settle.probe_verified
+    assert settle.timeouts == 2
+    assert not settle.lock_detect
+
+
+def test_verified_probe_is_trusted_when_it_reads_locked_at_once():
+    readings = iter([False, True])
+    settle = SettleController(lock_probe=lambda: next(readings, True), max_settle=0.05)
+    assert settle.wait('retune', 1e6) < 0.02
+    assert settle.probe_verified
+    assert settle.wait('retune', 1e6) < 0.02
+    assert settle.unverified_locks == 0
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from scipy import fft as sp_fft
+from scipy import signal
+
+from definitions import ADC_FULL_SCALE, ADC_OFFSET
+from psd import PsdEngine, get_window
+
+FS = 48e6
+NFFT = 256
+
+
+def capture(n, seed=0):
+    # Offset-binary ADC codes of a tone in noise
+    rng = np.random.default_rng(seed)
+    t = np.arange(n)
+    x = ADC_OFFSET + 40 * np.sin(2 * np.pi * 0.1 * t) + rng.normal(0, 8, n)
+    return np.clip(np.round(x), 0, 255).astype(np.uint8)
+
+
+def volts(codes):
+    return (codes.astype(np.float64) - ADC_OFFSET) * ADC_FULL_SCALE / ADC_OFFSET
+
+
+def welch(x, overlap=0.0, **kwargs):
+    return signal.welch(x, FS, window='hann', nperseg=NFFT, noverlap=int(round(NFFT * overlap)),
+                        scaling='density', detrend=False, **kwargs)
+
+
+@pytest.mark.parametrize('overlap', (0.0, 0.5, 0.75))
+def test_raw_capture_matches_scipy_welch(overlap):
+    codes = capture(NFFT * 40 + 17)
+    engine = PsdEngine(nfft=NFFT, window='hanning', overlap=overlap, sample_rate=FS, batch=7)
+    f, expected = welch(volts(codes), overlap)
+    assert np.allclose(engine.frequencies(), f)
+    # Raw bytes and uint8 arrays are the same capture
+    for block in (codes, codes.tobytes(), memoryview(codes.tobytes())):
+        assert np.allclose(engine.psd(block), expected, rtol=1e-4, atol=0)
+
+
+def test_complex_samples_match_scipy_welch():
+    rng = np.random.default_rng(1)
+    x = (rng.normal(size=NFFT * 20) + 1j * rng.normal(size=NFFT * 20)).astype(np.complex64)
+    engine = PsdEngine(nfft=NFFT, overlap=0.5, sample_rate=FS)
+    f, expected = welch(x, 0.5, return_onesided=False)
+    assert np.allclose(engine.frequencies(complex_input=True), sp_fft.fftshift(f))
+    assert np.allclose(engine.psd(x), sp_fft.fftshift(expected), rtol=1e-4, atol=0)
+
+
+def test_hold_modes_bound_the_mean():
+    codes = capture(NFFT * 30)
+    mean = PsdEngine(nfft=NFFT, sample_rate=FS).psd(codes)
+    high = PsdEngine(nfft=NFFT, sample_rate=FS, mode='max', batch=4).psd(codes)
+    low = PsdEngine(nfft=NFFT, sample_rate=FS, mode='min', batch=4).psd(codes)
+    assert np.all(low <= mean * (1 + 1e-6)) and np.all(mean <= high * (1 + 1e-6))
+    # Max-hold of one periodogram per segment, as scipy computes them
+    f, t, per_segment = signal.spectrogram(volts(codes), FS, window='hann', nperseg=NFFT, noverlap=0,
+                                           scaling='density', detrend=False)
+    assert np.allclose(high, per_segment.max(axis=1), rtol=1e-4, atol=0)
+
+
+def test_out_array_is_filled_and_returned():
+    codes = capture(NFFT * 4)
+    engine = PsdEngine(nfft=NFFT, sample_rate=FS)
+    out = np.empty(engine.n_bins)
+    assert engine.psd(codes, out=out) is out
+    assert np.array_equal(out, engine.psd(codes))
+    assert engine.stats()['blocks'] == 2 and engine.stats()['segments'] == 8
+
+
+def test_window_is_cached_and_read_only():
+    get_window.cache_clear()
+    w = get_window('hanning', NFFT)
+    assert get_window('hanning', NFFT) is w
+    assert get_window.cache_info().hits == 1
+    assert not w.flags.writeable and w.dtype == np.float32
+    assert np.allclose(w, signal.get_window('hann', NFFT))
+    # Engines of the same (window, nfft) share it; another nfft gets its own
+    assert PsdEngine(nfft=NFFT).window is w
+    assert PsdEngine(nfft=NFFT, mode='max').window is w
+    assert PsdEngine(nfft=NFFT * 2).window is not w
+    with pytest.raises(ValueError):
+        w[0] = 1
+
+
+def test_short_block_and_bad_parameters():
+    with pytest.raises(ValueError, match='shorter than nfft'):
+        PsdEngine(nfft=NFFT).psd(bytes(NFFT - 1))
+    with pytest.raises(ValueError):
+        PsdEngine(mode='median')
+    with pytest.raises(ValueError):
+        PsdEngine(overlap=1.0)
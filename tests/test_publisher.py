@@ -0,0 +1,197 @@
+import collections
+import threading
+import time
+
+import pytest
+
+from buffer_pool import BufferPool
+from publisher import MqttPublisher
+
+PublishInfo = collections.namedtuple('PublishInfo', 'rc mid')
+
+
+class FakeClient(object):
+    # paho Client stand-in: publish() queues the message; ack() plays the network loop's on_publish
+    def __init__(self, ack_inside_publish=False, rc=0):
+        self.ack_inside_publish = ack_inside_publish
+        self.rc = rc
+        self.on_publish = None
+        self.on_disconnect = None
+        self.loop_running = False
+        self.messages = []
+        self.pending = collections.deque()
+        self._mid = 0
+
+    def loop_start(self):
+        self.loop_running = True
+
+    def loop_stop(self):
+        self.loop_running = False
+
+    def publish(self, topic, payload, qos=0):
+        self._mid += 1
+        self.messages.append((topic, payload, qos))
+        if self.rc == 0:
+            if self.ack_inside_publish:
+                self.on_publish(self, None, self._mid)
+            else:
+                self.pending.append(self._mid)
+        return PublishInfo(self.rc, self._mid)
+
+    def ack(self, n=1):
+        for _ in range(n):
+            self.on_publish(self, None, self.pending.popleft())
+
+
+def publish_in_thread(publisher, payload, **kwargs):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(publisher.publish(payload, **kwargs)), daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_block_waits_for_paho_to_catch_up():
+    client = FakeClient()
+    publisher = MqttPublisher(client, 'raw', max_inflight_messages=2)
+    assert publisher.publish(b'a') and publisher.publish(b'b')
+    thread, result = publish_in_thread(publisher, b'c')
+    thread.join(0.05)
+    assert thread.is_alive() and publisher.inflight == 2
+    client.ack()
+    thread.join(2)
+    assert result == [True]
+    client.ack(2)
+    stats = publisher.stats()
+    assert stats['published'] == 3 and stats['dropped'] == 0
+    assert stats['max_inflight'] == 2 and stats['blocked_time'] > 0
+    assert stats['latency_p50'] is not None
+
+
+def test_block_timeout_drops_the_frame():
+    client = FakeClient()
+    released = []
+    publisher = MqttPublisher(client, 'raw', max_inflight_messages=1, block_timeout=0.02)
+    publisher.publish(b'a')
+    assert not publisher.publish(b'b', release=lambda: released.append('b'))
+    assert publisher.dropped == 1 and released == ['b']
+    assert len(client.messages) == 1
+
+
+def test_drop_newest_does_not_wait():
+    client = FakeClient()
+    publisher = MqttPublisher(client, 'raw', max_inflight_messages=2, backpressure='drop-newest')
+    publisher.publish(b'a')
+    publisher.publish(b'b')
+    start = time.monotonic()
+    assert not publisher.publish(b'c')
+    assert time.monotonic() - start < 0.05
+    assert publisher.dropped == 1 and publisher.blocked_time == 0
+    client.ack()
+    assert publisher.publish(b'd')
+    assert [m[1] for m in client.messages] == [b'a', b'b', b'd']
+
+
+def test_byte_cap():
+    client = FakeClient()
+    publisher = MqttPublisher(client, 'raw', max_inflight_bytes=100, backpressure='drop-newest')
+    # A lone message always fits, however large
+    assert publisher.publish(bytes(150))
+    client.ack()
+    assert publisher.publish(bytes(60))
+    assert not publisher.publish(bytes(60))
+    assert publisher.publish(bytes(40))
+    assert publisher.inflight_bytes == 100
+    client.ack(2)
+    assert publisher.inflight_bytes == 0 and publisher.published_bytes == 250
+
+
+def test_on_publish_before_publish_returns():
+    client = FakeClient(ack_inside_publish=True)
+    publisher = MqttPublisher(client, 'raw', max_inflight_messages=1)
+    for _ in range(3):
+        assert publisher.publish(b'frame')
+    assert publisher.inflight == 0 and publisher.inflight_bytes == 0
+    assert publisher.published == 3
+    assert not publisher._done_early
+    assert publisher.flush(timeout=0)
+
+
+def test_disconnect_counts_qos0_messages_as_lost(capsys):
+    client = FakeClient()
+    publisher = MqttPublisher(client, 'raw')
+    publisher.publish(b'a')
+    publisher.publish(b'b')
+    client.on_disconnect(client, None, 7)
+    assert publisher.lost == 2
+    assert publisher.inflight == 0 and publisher.inflight_bytes == 0
+    assert publisher.flush(timeout=0)
+    assert 'rc 7' in capsys.readouterr().out
+    assert publisher.published == 0
+
+
+def test_disconnect_keeps_qos1_messages_for_retransmission():
+    client = FakeClient()
+    publisher = MqttPublisher(client, 'raw', qos=1)
+    publisher.publish(b'a')
+    client.on_disconnect(client, None, 0)
+    assert publisher.lost == 0 and publisher.inflight == 1
+    client.ack()
+    assert publisher.published == 1
+
+
+def test_publish_error_frees_its_room():
+    client = FakeClient(rc=4)
+    publisher = MqttPublisher(client, 'raw', max_inflight_messages=1)
+    assert not publisher.publish(b'a')
+    assert publisher.errors == 1 and publisher.inflight_bytes == 0
+
+
+def test_release_returns_pooled_buffers_on_every_path():
+    pool = BufferPool(4, 64)
+    client = FakeClient()
+    publisher = MqttPublisher(client, 'raw', max_inflight_messages=1, backpressure='drop-newest')
+
+    def publish():
+        view = pool.acquire()
+        return publisher.publish(view, release=lambda: pool.release(view))
+
+    assert publish()                # sent
+    assert not publish()            # dropped
+    client.rc = 4
+    client.ack()
+    assert not publish()            # refused by paho
+    assert pool.available == len(pool)
+    # The payload paho got is a copy, not the recycled pool buffer
+    assert isinstance(client.messages[0][1], bytes)
+
+
+def test_qos1_bytearray_payload_is_copied():
+    client = FakeClient()
+    payload = bytearray(b'frame')
+    MqttPublisher(client, 'raw', qos=1).publish(payload)
+    payload[:] = b'xxxxx'
+    assert client.messages[0][1] == b'frame'
+
+
+def test_start_and_stop_run_the_network_loop():
+    client = FakeClient(ack_inside_publish=True)
+    with MqttPublisher(client, 'raw') as publisher:
+        assert client.loop_running
+        publisher.publish(b'a')
+    assert not client.loop_running
+
+
+def test_stop_gives_up_on_messages_never_acknowledged():
+    client = FakeClient()
+    publisher = MqttPublisher(client, 'raw')
+    publisher.start()
+    publisher.publish(b'a')
+    start = time.monotonic()
+    publisher.stop(timeout=0.05)
+    assert time.monotonic() - start >= 0.05
+    assert not client.loop_running and publisher.inflight == 1
+
+
+def test_unknown_backpressure_policy():
+    with pytest.raises(ValueError):
+        MqttPublisher(FakeClient(), 'raw', backpressure='drop-oldest')
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from receiver_lock import ReceiverLock
+
+
+def hold_in_thread(lock, release):
+    # Take the lock on another thread and keep it until release is set
+    taken = threading.Event()
+
+    def run():
+        lock.acquire()
+        taken.set()
+        release.wait()
+        lock.release()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    taken.wait(2)
+    return thread
+
+
+def handoff_order(policy, priorities):
+    # Queue one waiter per priority, in list order, behind a holder; return the order they got the lock in
+    lock = ReceiverLock(policy=policy)
+    lock.acquire()
+    order = []
+    threads = []
+
+    def waiter(name, priority):
+        lock.acquire(priority=priority)
+        order.append(name)
+        lock.release()
+
+    for name, priority in enumerate(priorities):
+        thread = threading.Thread(target=waiter, args=(name, priority), daemon=True)
+        thread.start()
+        threads.append(thread)
+        deadline = time.monotonic() + 2
+        while lock.stats()['waiters'] < name + 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+    lock.release()
+    for thread in threads:
+        thread.join(2)
+    return order
+
+
+def test_fifo_hands_over_in_arrival_order():
+    assert handoff_order('fifo', [0, 5, 1, 9]) == [0, 1, 2, 3]
+
+
+def test_priority_hands_over_highest_first_then_by_arrival():
+    assert handoff_order('priority', [0, 5, 1, 5]) == [1, 3, 2, 0]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ReceiverLock(policy='lifo')
+
+
+def test_acquire_times_out():
+    lock = ReceiverLock()
+    done = threading.Event()
+    holder = hold_in_thread(lock, done)
+    start = time.monotonic()
+    assert not lock.acquire(timeout=0.05)
+    assert time.monotonic() - start >= 0.05
+    assert not lock.acquire(blocking=False)
+    assert lock.timeouts == 2
+    done.set()
+    holder.join(2)
+    assert lock.acquire(timeout=0.05)
+    lock.release()
+
+
+def test_only_the_owner_can_release():
+    lock = ReceiverLock()
+    done = threading.Event()
+    holder = hold_in_thread(lock, done)
+    with pytest.raises(RuntimeError, match='released by thread'):
+        lock.release()
+    assert lock.locked() and lock.owner_ident == holder.ident
+    done.set()
+    holder.join(2)
+    assert not lock.locked()
+    with pytest.raises(RuntimeError, match='unlocked'):
+        lock.release()
+
+
+def test_not_reentrant():
+    lock = ReceiverLock()
+    with lock:
+        with pytest.raises(RuntimeError, match='reentrant'):
+            lock.acquire()
+
+
+def test_lock_of_an_exited_thread_is_reclaimed():
+    lock = ReceiverLock(stale_check_interval=0.01)
+    thread = threading.Thread(target=lock.acquire)
+    thread.start()
+    thread.join()
+    assert lock.locked()
+    assert lock.acquire(timeout=1)
+    assert lock.reclaimed == 1
+    lock.release()
+
+
+def test_live_holder_past_max_hold_is_reported_once_and_kept(capsys):
+    lock = ReceiverLock(max_hold=0.02, stale_check_interval=0.01)
+    done = threading.Event()
+    holder = hold_in_thread(lock, done)
+    time.sleep(0.03)
+    assert not lock.acquire(timeout=0.05)
+    assert not lock.acquire(timeout=0.05)
+    assert capsys.readouterr().out.count('for more than 0.02 seconds') == 1
+    assert lock.owner_ident == holder.ident and lock.reclaimed == 0
+    done.set()
+    holder.join(2)
@@ -0,0 +1,125 @@
+import contextlib
+
+import pytest
+
+from simulation import simulated
+
+
+@pytest.fixture(scope='module')
+def sensor():
+    sim, sensor = simulated('pool')
+    yield sensor
+    sensor.close()
+    sim.stop()
+
+
+def test_scan_longer_than_pool_does_not_exhaust_it(sensor):
+    segments = sensor.scan(100e6, 400e6, N_samples=2**16)
+    assert len(segments) > len(sensor.pool)
+    assert all(isinstance(y, bytes) for _, y in segments)
+    assert sensor.pool.available == len(sensor.pool)
+
+
+def test_plan_scan_takes_n_samples_like_scan(sensor):
+    by_samples = sensor.plan_scan(100e6, 200e6, N_samples=2**16)
+    by_rbw = sensor.plan_scan(100e6, 200e6, rbw=sensor.ibw_max / 2**16)
+    assert len(by_samples) == len(by_rbw) == 3
+    with pytest.raises(ValueError):
+        sensor.plan_scan(100e6, 200e6)
+
+
+def test_overlapping_ranges_share_captures(sensor):
+    low, high = sensor.scan([100e6, 120e6], [130e6, 200e6], N_samples=2**16)
+    shared = set(id(y) for _, y in low) & set(id(y) for _, y in high)
+    assert len(low) == len(shared) == 1 and len(high) == 3
+    assert sensor.pool.available == len(sensor.pool)
+
+
+def test_scan_spectrum_reuses_its_stitcher(sensor):
+    sensor._stitchers.clear()
+    f1, p1 = sensor.scan_spectrum(100e6, 200e6, N_samples=2**16)
+    stitcher = list(sensor._stitchers.values())
+    f2, p2 = sensor.scan_spectrum(100e6, 200e6, N_samples=2**16)
+    assert list(sensor._stitchers.values()) == stitcher
+    assert (f1 == f2).all() and p1 is not p2
+
+
+def test_scan_spectrum_reuses_its_stitcher_in_either_direction(sensor):
+    sensor._stitchers.clear()
+    # Without the MSP sweep scans start from the nearest end, so back to back sweeps alternate
+    sensor.hardware_sweep, hardware_sweep = False, sensor.hardware_sweep
+    try:
+        f1, p1 = sensor.scan_spectrum(100e6, 200e6, N_samples=2**16)
+        up = sensor.scan_plan
+        f2, p2 = sensor.scan_spectrum(100e6, 200e6, N_samples=2**16)
+        assert (sensor.scan_plan.centers == up.centers[::-1]).all()
+    finally:
+        sensor.hardware_sweep = hardware_sweep
+    assert len(sensor._stitchers) == 1
+    assert (f1 == f2).all()
+
+
+def test_scan_process_runs_in_order_and_records_pipeline_stats(sensor):
+    segments = sensor.scan(100e6, 400e6, N_samples=2**16, process=lambda f_lims, y: (f_lims, len(y)))
+    assert all(f_lims == y[0] and y[1] > 0 for f_lims, y in segments)
+    assert [f_lims for f_lims, _ in segments] == sorted(f_lims for f_lims, _ in segments)
+    assert sensor.pipeline_stats['processed'] == len(segments)
+    assert sensor.pool.available == len(sensor.pool)
+
+
+def test_scan_process_error_reaches_the_caller(sensor):
+    def process(f_lims, y):
+        raise RuntimeError('PSD failed')
+
+    with pytest.raises(RuntimeError, match='PSD failed'):
+        sensor.scan(100e6, 400e6, N_samples=2**16, process=process)
+    assert sensor.pool.available == len(sensor.pool)
+    assert not sensor.lock.locked()
+
+
+def test_scan_iter_break_releases_lock_and_pool(sensor):
+    for f_lims, y in sensor.scan_iter(100e6, 400e6, N_samples=2**16):
+        assert sensor.lock.locked()
+        sensor.release(y)
+        break
+    assert not sensor.lock.locked()
+    assert sensor.pool.available == len(sensor.pool)
+
+
+def test_scan_iter_named_generator_needs_closing(sensor):
+    with contextlib.closing(sensor.scan_iter(100e6, 400e6, N_samples=2**16)) as segments:
+        for f_lims, y in segments:
+            sensor.release(y)
+            break
+        # Still referenced, so still holding the receiver until closed
+        assert sensor.lock.locked()
+    assert not sensor.lock.locked()
+    assert sensor.pool.available == len(sensor.pool)
+
+
+def test_scan_iter_close_releases_lock_and_pool(sensor):
+    segments = sensor.scan_iter(100e6, 400e6, N_samples=2**16, reducer=lambda f_lims, y: len(y))
+    kept = [next(segments), next(segments)]
+    assert sensor.lock.locked()
+    segments.close()
+    assert not sensor.lock.locked()
+    assert sensor.pool.available == len(sensor.pool)
+    assert all(n > 0 for _, n in kept)
+
+
+def test_scan_iter_reducer_error_releases_lock_and_pool(sensor):
+    def reducer(f_lims, y):
+        raise RuntimeError('PSD failed')
+
+    with pytest.raises(RuntimeError, match='PSD failed'):
+        for _ in sensor.scan_iter(100e6, 400e6, N_samples=2**16, reducer=reducer):
+            pass
+    assert not sensor.lock.locked()
+    assert sensor.pool.available == len(sensor.pool)
+
+
+def test_scan_iter_runs_the_whole_plan(sensor):
+    segments = list(sensor.scan_iter(100e6, 400e6, N_samples=2**16, reducer=lambda f_lims, y: None))
+    assert len(segments) == len(sensor.scan_plan)
+    assert sensor.percentComplete == 1
+    assert not sensor.lock.locked()
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from scan_pipeline import ScanPipeline
+
+
+def test_results_come_back_in_segment_order():
+    released = []
+
+    def process(f_lims, y):
+        # Later segments finish faster
+        time.sleep(0.001 * (5 - y))
+        return y * 10
+
+    pipeline = ScanPipeline(process, release=released.append, depth=2)
+    # Submitted out of order, as a scan sharing captures between ranges may
+    for index in (2, 0, 4, 1, 3):
+        pipeline.submit(index, (index, index + 1), index)
+    results = pipeline.finish(5)
+    assert results == [((i, i + 1), i * 10) for i in range(5)]
+    assert sorted(released) == list(range(5))
+
+
+def test_processing_error_reaches_the_caller():
+    released = []
+    submitted = []
+
+    def process(f_lims, y):
+        if y == 1:
+            raise ZeroDivisionError('segment 1')
+        return y
+
+    pipeline = ScanPipeline(process, release=released.append, depth=1)
+    with pytest.raises(ZeroDivisionError, match='segment 1'):
+        # Raised by whichever of submit() or finish() comes after the failure
+        for index in range(6):
+            submitted.append(index)
+            pipeline.submit(index, None, index)
+        pipeline.finish(6)
+    pipeline.close()
+    # Segments after the failure are not processed, but every one submitted is released once
+    assert pipeline.processed <= 2
+    assert sorted(released) == submitted
+
+
+def test_error_after_last_submit_is_raised_by_finish():
+    def process(f_lims, y):
+        raise ValueError('bad segment')
+
+    pipeline = ScanPipeline(process)
+    pipeline.submit(0, None, 0)
+    with pytest.raises(ValueError, match='bad segment'):
+        pipeline.finish(1)
+
+
+def test_stats_account_for_stalls_and_processing():
+    gate = threading.Event()
+
+    def process(f_lims, y):
+        gate.wait(2)
+        time.sleep(0.01)
+        return y
+
+    pipeline = ScanPipeline(process, depth=1)
+    pipeline.submit(0, None, 0)     # taken by the worker, which waits at the gate
+    time.sleep(0.01)
+    pipeline.submit(1, None, 1)     # fills the queue
+    threading.Timer(0.05, gate.set).start()
+    pipeline.submit(2, None, 2)     # stalls until the worker moves on
+    pipeline.finish(3)
+    stats = pipeline.stats()
+    assert stats['processed'] == 3
+    assert stats['stall_time'] >= 0.03
+    # The capture only stalls while the worker is busy
+    assert stats['process_time'] >= stats['stall_time']
+
+
+def test_fast_worker_does_not_stall_the_capture():
+    pipeline = ScanPipeline(lambda f_lims, y: y, depth=4)
+    for index in range(4):
+        pipeline.submit(index, None, index)
+    pipeline.finish(4)
+    assert pipeline.stats()['stall_time'] < 0.01
+
+
+def test_depth_must_be_positive():
+    with pytest.raises(ValueError):
+        ScanPipeline(lambda f_lims, y: y, depth=0)
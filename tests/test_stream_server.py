@@ -0,0 +1,156 @@
+import contextlib
+import socket
+import time
+
+import pytest
+
+from buffer_pool import BufferPool
+from definitions import FRAME_HEADROOM
+from stream_server import HandshakeError, StreamClient, StreamServer, parse_address
+
+BLOCK = 64 * 1024
+
+
+class PoolSensor(object):
+    # Streams numbered blocks from a small buffer pool, like the pool backend
+    def __init__(self, pool_size=4):
+        self.pool = BufferPool(pool_size, BLOCK, timeout=2.0, headroom=FRAME_HEADROOM)
+        self.tunings = []
+
+    @contextlib.contextmanager
+    def stream(self, center_frequency, gain=1):
+        self.tunings.append((center_frequency, gain))
+
+        def blocks():
+            n = 0
+            while True:
+                view = self.pool.acquire()
+                view[:8] = n.to_bytes(8, 'little')
+                n += 1
+                time.sleep(0.0005)
+                yield view
+        yield blocks()
+
+    def release(self, data):
+        if isinstance(data, memoryview):
+            self.pool.release(data)
+
+
+def read_frames(client, n):
+    frames = []
+    for header, payload in client:
+        frames.append((header, int.from_bytes(payload[:8], 'little')))
+        if len(frames) == n:
+            break
+    return frames
+
+
+@pytest.fixture
+def address(tmp_path):
+    return str(tmp_path / 'stream.sock')
+
+
+def test_parse_address():
+    assert parse_address('127.0.0.1:5555') == ('127.0.0.1', 5555)
+    assert parse_address(':5555') == ('0.0.0.0', 5555)
+    assert parse_address('/tmp/rh.sock') == '/tmp/rh.sock'
+
+
+def test_handshake_picks_tuning_and_refuses_another(address):
+    sensor = PoolSensor()
+    with StreamServer(sensor, address) as server:
+        with pytest.raises(HandshakeError, match='frequency required'):
+            StreamClient(address)
+        with StreamClient(address, 1.6e9, 10) as first:
+            assert first.reply['ok'] and first.reply['frequency'] == 1.6e9
+            with pytest.raises(HandshakeError, match='streaming'):
+                StreamClient(address, 1.7e9, 10)
+            with StreamClient(address) as joined:
+                assert joined.reply['gain'] == 10
+                frames = read_frames(joined, 3)
+            assert all(h.center_frequency == 1.6e9 and h.payload_length == BLOCK for h, _ in frames)
+            seqs = [h.capture_seq for h, _ in frames]
+            assert seqs == sorted(seqs)
+        assert server.stats()['refused'] == 2
+    assert sensor.tunings[0] == (1.6e9, 10)
+
+
+def test_silent_connection_does_not_hold_up_other_clients(address):
+    with StreamServer(PoolSensor(), address) as server:
+        silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        silent.connect(address)
+        t0 = time.monotonic()
+        with StreamClient(address, 1e9, 1, timeout=2) as client:
+            assert client.reply['ok']
+            read_frames(client, 1)
+        assert time.monotonic() - t0 < 1.0
+        t0 = time.monotonic()
+    # stop() ends the handshake still waiting on the silent connection
+    while server.stats()['refused'] == 0 and time.monotonic() - t0 < 2.0:
+        time.sleep(0.01)
+    assert server.stats()['refused'] == 1
+    silent.close()
+
+
+def test_frames_carry_the_captured_blocks(address):
+    with StreamServer(PoolSensor(), address) as server:
+        with StreamClient(address, 1e9, 1) as client:
+            frames = read_frames(client, 20)
+    # drop-oldest may skip blocks, but whatever arrives is the block its header numbers
+    assert all(h.capture_seq == n for h, n in frames)
+
+
+def test_frames_carry_the_ring_sequence(address):
+    class RingSensor(PoolSensor):
+        # mmap-like: blocks come two per read, skipping one ring slot in between
+        @contextlib.contextmanager
+        def stream(self, center_frequency, gain=1):
+            def blocks():
+                seq = 0
+                while True:
+                    self.last_block_seqs = [seq, seq + 2]
+                    seq += 3
+                    for _ in range(2):
+                        view = self.pool.acquire()
+                        time.sleep(0.0005)
+                        yield view
+            yield blocks()
+
+    with StreamServer(RingSensor(pool_size=8), address, backlog_blocks=8, policy='drop-newest') as server:
+        with StreamClient(address, 1e9, 1) as client:
+            headers = [h for h, _ in read_frames(client, 40)]
+    # Ring sequence numbers of the blocks in capture order, however many the client got
+    ring = [seq for n in range(0, 1000, 3) for seq in (n, n + 2)]
+    assert [h.block_index for h in headers] == [ring[h.capture_seq] for h in headers]
+    assert len(set(h.block_index - h.capture_seq for h in headers)) > 1
+
+
+def test_slow_clients_do_not_stall_the_capture(address):
+    sensor = PoolSensor(pool_size=4)
+    with StreamServer(sensor, address, backlog_blocks=2, policy='drop-newest', sndbuf=BLOCK) as server:
+        fast = StreamClient(address, 1e9, 1)
+        # Connected but never reading: their socket buffers fill and their backlogs pin old blocks
+        slow = [StreamClient(address, rcvbuf=BLOCK) for _ in range(2)]
+        frames = read_frames(fast, 400)
+        stats = server.stats()
+        for client in slow + [fast]:
+            client.close()
+    assert len(frames) == 400
+    assert stats['errors'] == 0
+    assert stats['copied'] > 0
+    assert max(c['dropped'] for c in stats['clients']) > 0
+    assert sensor.pool.available == len(sensor.pool)
+
+
+def test_disconnect_policy_drops_the_slow_client(address):
+    with StreamServer(PoolSensor(pool_size=8), address, backlog_blocks=2, policy='disconnect',
+                      sndbuf=BLOCK) as server:
+        fast = StreamClient(address, 1e9, 1)
+        slow = StreamClient(address, rcvbuf=BLOCK)
+        read_frames(fast, 200)
+        deadline = time.monotonic() + 5
+        while len(server.clients) > 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(server.clients) == 1
+        fast.close()
+        slow.close()
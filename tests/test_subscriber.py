@@ -0,0 +1,79 @@
+import io
+import zlib
+
+from framing import CODEC_ZLIB, FrameHeader, FrameWriter
+from subscriber import Reassembler, Subscriber
+
+
+def header(seq, block_index=None):
+    return FrameHeader(1, 0, 0, seq, seq if block_index is None else block_index, 0, 0, 1e9, 1.0, 0, 0)
+
+
+def reassemble(seqs, reorder_window=4, block_indices=None):
+    delivered = []
+    r = Reassembler(lambda h, data: delivered.append(h.capture_seq), reorder_window)
+    for i, seq in enumerate(seqs):
+        r.add(header(seq, block_indices[i] if block_indices else None), b'')
+    r.flush()
+    return r, delivered
+
+
+def test_in_order_stream():
+    r, delivered = reassemble(range(10))
+    assert delivered == list(range(10))
+    assert (r.lost, r.reordered, r.late, r.sensor_gaps, r.restarts) == (0, 0, 0, 0, 0)
+
+
+def test_reordered_frames_are_put_back_in_order():
+    r, delivered = reassemble([0, 2, 1, 3, 5, 4])
+    assert delivered == list(range(6))
+    assert r.reordered == 2 and r.lost == 0
+
+
+def test_missing_frames_are_given_up_after_the_window():
+    r, delivered = reassemble([0, 1, 3, 4, 5, 6, 7, 2])
+    assert delivered == [0, 1, 3, 4, 5, 6, 7]
+    assert r.lost == 1 and r.late == 1
+
+
+def test_straggler_far_behind_is_not_a_restart():
+    r, delivered = reassemble([0, 1, 3, 4, 5, 6, 7, 2, 8, 9])
+    assert delivered == [0, 1, 3, 4, 5, 6, 7, 8, 9]
+    assert r.late == 1 and r.restarts == 0
+
+
+def test_duplicates_are_late():
+    r, delivered = reassemble([0, 1, 1, 2])
+    assert delivered == [0, 1, 2]
+    assert r.late == 1
+
+
+def test_sensor_gaps_count_only_blocks_lost_before_publishing():
+    # Frame 2 is lost in transport; block_index also jumps by 5 between frames 3 and 4
+    r, delivered = reassemble([0, 1, 3, 4], reorder_window=1, block_indices=[10, 11, 13, 19])
+    assert r.lost == 1
+    assert r.sensor_gaps == 5
+
+
+def test_sender_restart_starts_a_new_stream():
+    r, delivered = reassemble(list(range(100, 120)) + [1, 2, 4, 3])
+    assert delivered == list(range(100, 120)) + [1, 2, 3, 4]
+    assert r.restarts == 1 and r.late == 0 and r.lost == 0
+
+
+def test_subscriber_decodes_compressed_frames():
+    output = io.BytesIO()
+    samples = []
+    subscriber = Subscriber(callback=lambda h, data: samples.append(len(data)), output=output)
+    writer = FrameWriter()
+    blocks = [bytes([i]) * 100 for i in range(3)]
+    for seq in (0, 2, 1):
+        payload = zlib.compress(blocks[seq])
+        subscriber.handle(bytes(writer.frame(payload, seq, seq, 1e9, 1, codec=CODEC_ZLIB,
+                                             raw_length=len(blocks[seq]))))
+    subscriber.handle(b'garbage')
+    subscriber.flush()
+    assert output.getvalue() == b''.join(blocks)
+    stats = subscriber.stats()
+    assert (stats['delivered'], stats['errors'], stats['reordered']) == (3, 1, 1)
+    assert samples == [100, 100, 100]
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from simulation import SimulatedSPI, simulated
+
+
+@pytest.fixture(scope='module')
+def sim_sensor():
+    sim, sensor = simulated('pool')
+    yield sim, sensor
+    sensor.close()
+    sim.stop()
+
+
+@pytest.fixture
+def sweeping(sim_sensor):
+    sim, sensor = sim_sensor
+    sensor.hardware_sweep = True
+    sim.spi.commands.clear()
+    yield sim, sensor
+    sensor.hardware_sweep = False
+    sim.spi._multi = SimulatedSPI._multi.__get__(sim.spi)
+
+
+def centers(segments):
+    return [(low + high) / 2.0 for (low, high), _ in segments]
+
+
+def khz(frequencies):
+    # The MSP tunes in whole kHz
+    return [int(f // 1e3) for f in frequencies]
+
+
+def test_hardware_sweep_is_off_by_default(sim_sensor):
+    sim, sensor = sim_sensor
+    assert sensor.hardware_sweep is False
+    assert sensor.scan_order == 'nearest'
+
+
+def test_even_steps_are_tuned_with_multi_frames(sweeping):
+    sim, sensor = sweeping
+    plan = sensor.plan_scan(100e6, 200e6, N_samples=2**16)
+    segments = sensor.scan(100e6, 200e6, N_samples=2**16)
+    # Whole kHz steps, so the sweep may drift from the plan by up to 1 kHz per step
+    tuned = np.array(centers(segments))
+    assert np.allclose(tuned, sorted(plan.centers), rtol=0, atol=1e3 * len(plan))
+    assert len(set(np.diff(tuned))) == 1
+    assert SimulatedSPI.CTRL_MULTI in sim.spi.commands
+    assert SimulatedSPI.CTRL_SINGLE not in sim.spi.commands
+    # The last frame restarted the sweep at its final step
+    fc_start, fc_stop, step = sim.spi.sweep
+    assert fc_start * 1e3 == fc_stop * 1e3 == tuned[-1] == sim.radio.frequency
+    assert sensor.hardware_sweep
+
+
+def test_uneven_steps_are_retuned_one_by_one(sweeping):
+    sim, sensor = sweeping
+    frequencies = [100e6, 130e6, 135e6]
+    for f_c, data in sensor._collect_sensor_data_sweep(frequencies):
+        sensor.release(data)
+    assert SimulatedSPI.CTRL_MULTI not in sim.spi.commands
+    assert list(sim.spi.commands).count(SimulatedSPI.CTRL_SINGLE) == 3
+    assert sensor.hardware_sweep
+
+
+def test_msp_ignoring_multi_frames_falls_back_to_single_retunes(sweeping):
+    sim, sensor = sweeping
+    # Firmware without multi mode: the frame changes nothing
+    sim.spi._multi = lambda frame, rbuf, start: None
+    sensor.release(sensor.raw(300e6))
+    assert sensor.settle.probe_verified
+    segments = sensor.scan(100e6, 200e6, N_samples=2**16)
+    assert not sensor.hardware_sweep
+    assert SimulatedSPI.CTRL_SINGLE in sim.spi.commands
+    assert centers(segments) == sorted(sensor.plan_scan(100e6, 200e6, N_samples=2**16).centers)
+    assert khz([sim.radio.frequency])[0] in khz(centers(segments))
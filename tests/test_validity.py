@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from validity import VALIDITY_CHECKS, BlockValidator
+
+SIZE = 64 * 1024
+
+
+def clean():
+    # Offset-binary noise around mid-scale, as the ADC delivers it
+    rng = np.random.default_rng(0)
+    return np.clip(np.round(rng.normal(128, 4, SIZE)), 0, 255).astype(np.uint8).tobytes()
+
+
+def clipped():
+    # Overdriven front end: the samples sit at the rails
+    return (np.arange(SIZE) % 2 * 255).astype(np.uint8).tobytes()
+
+
+def stuck_at(value):
+    return bytes([value]) * SIZE
+
+
+def zero_but(offset):
+    block = bytearray(SIZE)
+    block[offset] = 1
+    return bytes(block)
+
+
+@pytest.mark.parametrize('mode', VALIDITY_CHECKS)
+def test_real_data_passes_every_mode(mode):
+    validator = BlockValidator(mode)
+    for block in (clean(), clipped(), stuck_at(0xFF), stuck_at(0x80)):
+        assert validator.check(block)
+        assert validator.check(memoryview(block))
+    assert validator.invalid == 0
+
+
+@pytest.mark.parametrize('mode', ('full', 'strided', 'edges'))
+def test_stuck_at_zero_fails(mode):
+    validator = BlockValidator(mode)
+    assert not validator.check(stuck_at(0))
+    assert not validator.check(b'')
+    assert validator.invalid == 2
+
+
+def test_none_accepts_anything():
+    validator = BlockValidator('none')
+    assert validator.check(stuck_at(0))
+    assert validator.invalid == 0
+
+
+def test_modes_differ_in_how_much_they_look_at():
+    # One non-zero byte in the middle of a block, off the stride
+    block = zero_but(SIZE // 2 + 1000)
+    assert BlockValidator('full').check(block)
+    assert not BlockValidator('strided', stride=4096).check(block)
+    assert not BlockValidator('edges').check(block)
+    # ... and on the stride or at an edge
+    assert BlockValidator('strided', stride=4096).check(zero_but(4096 * 3 + 7))
+    assert BlockValidator('edges').check(zero_but(SIZE - 1))
+    assert BlockValidator('edges').check(zero_but(0))
+
+
+def test_odd_length_blocks_are_checked_bytewise():
+    assert BlockValidator('full').check(bytes(SIZE) + b'\x01')
+    assert not BlockValidator('edges').check(b'\x00' + b'\x01' * 5 + b'\x00')
+
+
+def test_timing_stats():
+    validator = BlockValidator('full')
+    for block in (clean(), stuck_at(0), clean()):
+        validator.check(block)
+    stats = validator.stats()
+    assert stats['mode'] == 'full'
+    assert stats['calls'] == 3 and stats['invalid'] == 1
+    assert stats['total_time'] > 0 and validator.last_time > 0
+    assert stats['mean_time'] == pytest.approx(stats['total_time'] / 3)
+    assert BlockValidator().mean_time == 0.0
+
+
+def test_bad_parameters():
+    with pytest.raises(ValueError):
+        BlockValidator('sampled')
+    with pytest.raises(ValueError):
+        BlockValidator('strided', stride=4)
@@ -18,10 +18,12 @@ from pytz import timezone
 import math
 import psutil
 
-numBytesTotal = 12000
-numBytesPerWrite = 12
-mspWriteCtrl = 0x20
-mspReadCtrl = 0x40
+from cal_transport import CalibrationTransport, CAL_CAPACITY, CAL_READ_CTRL, CAL_WRITE_CTRL, FRAME_DATA
+
+numBytesTotal = CAL_CAPACITY
+numBytesPerWrite = FRAME_DATA
+mspWriteCtrl = CAL_WRITE_CTRL
+mspReadCtrl = CAL_READ_CTRL
 
 class bcolors:
     HEADER = '\033[95m'
@@ -435,12 +437,22 @@ def read_hardware_version():
             return None
 
 # ------------------------------------------------------------------
-def load_calibration_data():
-  if os.path.isfile(calFileCache):
-    calFileHandle = open(calFileCache,'r')
-    calibration_data = json.load(calFileHandle)
-    calFileHandle.close()
-    return calibration_data
+_calibration_data = {}
+
+def load_calibration_data(path=calFileCache):
+  # Parsed once per file version: reparsed only when the file's mtime or size changes
+  try:
+    st = os.stat(path)
+  except OSError:
+    return None
+  stamp = (st.st_mtime_ns, st.st_size)
+  cached = _calibration_data.get(path)
+  if cached is None or cached[0] != stamp:
+    with open(path,'r') as calFileHandle:
+      calibration_data = json.load(calFileHandle)
+    cached = _calibration_data[path] = (stamp, calibration_data)
+  # A copy, so a caller changing its table cannot corrupt later loads
+  return copy.deepcopy(cached[1])
 # ------------------------------------------------------------------
 def read_rh_hardware_version(node):
     '''
@@ -877,8 +889,8 @@ def validate():
         action_code = 255
       else:
         # Try to read calibration data from MSP, if exception happens then check for backups
-        return_code = mspToJson()
-        if return_code == 0:
+        result = mspToJson()
+        if isinstance(result, tuple) and result[0]:
           action_code = 0
           print("OK.")
         else:
@@ -931,11 +943,10 @@ def determineConfigAction(msp_version,lastCalData=lastCalibrationData,calFileNam
                 return 3
 
 
-def calTableJsonToMsp(jsonData=None, filename=lastCalibrationData, numBytesWriteTotal = numBytesTotal):
+def calTableJsonToMsp(jsonData=None, filename=lastCalibrationData, numBytesWriteTotal = numBytesTotal, spi=None, force=False):
     # Give priority to json data provided directly as an argument. If not available, read from file location at filename
     if jsonData is None:
         # Read calibration json data from file
-        #print("Loading calibration file " + filename)
         output = "Loaded from file " + filename
         with open(filename,'r') as fp:
             tableJson = json.load(fp)
@@ -943,119 +954,37 @@ def calTableJsonToMsp(jsonData=None, filename=lastCalibrationData, numBytesWrite
         tableJson = jsonData
         output = "JSON payload provided."
 
-    tableJsonBeforeEncode = json.dumps(tableJson)
-    # Encode json as bytes
-    tableJsonEncode = tableJsonBeforeEncode.encode('utf-8')
-    tableJsonEncodeBytes = bytearray(tableJsonEncode)
-    numDataBytes = len(tableJsonEncodeBytes)
-
-    # Load SPI module
-    #print("Loading SPI Module...\n")
+    # The table goes out as a CRC-checked container in batched SPI transfers,
+    # and is not rewritten when the MSP already holds the same table
     try:
-        spi = SPI(1,0)
-        spi.cshigh = True
-        spi.lsbfirst = False
-        spi.bpw = 8
-        spi.mode = 0b01
-        spi.threewire = False
-        spi.msh = int(125000)
-        #print("SPI Module loaded.\n")
-
-        # Compute number of times required to write to MSP
-        # MSP takes spi buffer 13 bytes at a time: 1 byte for control, 12 bytes for data
-        totalDataWritePasses = math.ceil(numDataBytes/numBytesPerWrite)
-        totalWritePasses = int(numBytesWriteTotal/numBytesPerWrite) 
-        #print("Preparing to write {} calibration information ...".format(numBytesTotal))
-        #print("Number of writes passes needed is {}. ".format(totalWritePasses))
-        
-        # Compute number of trailing bytes
-        extraBytes = numDataBytes%numBytesPerWrite
-        # Start SPI writing process
-        for i in range(totalWritePasses):
-            #print("Writing pass {} out of {}.".format(i+1,totalWritePasses))
-
-            # If last DATA buffer, fill in the rest of buffer with zeros
-            if i==totalDataWritePasses-1 and extraBytes!=0:
-                tbuf = [mspWriteCtrl] + [tableJsonEncodeBytes[i*numBytesPerWrite+j] for j in range(extraBytes)] + [0x00]*(numBytesPerWrite - extraBytes)
-
-            # If no more DATA, just write zeros
-            elif i>= totalDataWritePasses:
-                tbuf = [mspWriteCtrl] + [0x00]*numBytesPerWrite
-
-            # As long as there is DATA, write DATA to buffer in 12 bytes
-            else:
-                tbuf = [mspWriteCtrl] + [tableJsonEncodeBytes[i*numBytesPerWrite+j] for j in range(numBytesPerWrite)]
-            
-            # Preview Data
-            #print("Send data to MSP is: {}".format(tbuf))
-            spi.xfer2(tbuf)
-        print("OK, " + output)
+        transport = CalibrationTransport(spi, capacity=numBytesWriteTotal)
+        written = transport.write_table(tableJson, force=force)
+        print("OK, " + output + ("" if written else " Already on MSP, not rewritten."))
         return 0
     except Exception as e:
         print("ERROR: Failed writing calibration data to MSP: " + str(e))
         print("\t" + output)
         return -1
 
-def mspToJson(calTableStorePath=calFileCache, numBytesReadTotal = numBytesTotal):
-    #Load SPI Module
+def mspToJson(calTableStorePath=calFileCache, numBytesReadTotal = numBytesTotal, spi=None):
     try:
-        spi = SPI(1,0)
-        spi.cshigh = True
-        spi.lsbfirst = False
-        spi.bpw = 8
-        spi.mode = 0b01
-        spi.threewire = False
-        spi.msh = int(125000)
+        transport = CalibrationTransport(spi, capacity=numBytesReadTotal)
     except Exception as e:
         print("ERROR: Failed opening SPI: " + str(e))
         return 255
-    # Assuming total number of bytes is a multiple of number of bytes per write
-    totalReadPasses = int(numBytesReadTotal/numBytesPerWrite)
-    
-    # Initialize Data array
-    readBytes = []
-
-    #print("Preparing to read {} coefficients ...".format(numBytesReadTotal))
-    #print("Number of read passes needed is {}.".format(totalReadPasses))
-    for i in range(totalReadPasses):
-        #print("Reading pass {} out of {}.".format(i+1,totalReadPasses))
-
-        # Send read command: must be 13 bytes to retrieve 12 data bytes
-        tbuf = [mspReadCtrl] + [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
-        rbuf = spi.xfer2(tbuf)
-
-        # Preview read data
-        #if i < 10:
-            #print(rbuf)
 
-        # First read from MSP is blank, so ignore
-        if i==0:
-            continue
-
-        # append read data into Data array
-        readBytes = readBytes + rbuf[1:]
-    
-    # To extract only meaningful data, look for first zero index
-    endInd = 0
-    for i in range(len(readBytes)):
-        if readBytes[i]==0:
-            endInd = i
-            break
-
-    if endInd == 0:
-      output = "CALIBRATION DATA IS ALL ZEROS"
-      return {}, output
-
-    # Read until first zero index, and decode json
+    # Only the frames holding the table are read
     try:
-        readTableJson = json.loads(bytearray(readBytes[:endInd]).decode('utf-8'))
+        readTableJson = transport.read_table()
     except Exception as e:
-        output = "FAILED READING CALIBRATION DATA " + str(readBytes[:50]) + "\n"
-        #output += "few bytes before endInd \n" + str(readBytes[endInd-5:endInd+5]) + "\n"
-        #output += 'endInd: ' + str(endInd) + "\n"
+        output = "FAILED READING CALIBRATION DATA\n"
         output += 'Exception: ' + str(e) + "\n"
         return {},output
 
+    if readTableJson is None:
+      output = "CALIBRATION DATA IS ALL ZEROS"
+      return {}, output
+
     # Write Json to disk
     if calTableStorePath is not None:
         with open(calTableStorePath,'w') as fp:
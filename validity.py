@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+
+VALIDITY_CHECKS = ('full', 'strided', 'edges', 'none')
+
+
+class BlockValidator(object):
+    def __init__(self, mode='full', stride=4096):
+        """
+        Decides whether a captured ADC block holds real data. The beaglelogic
+        driver hands back an all-zero buffer when the PRU delivered nothing,
+        so a block is considered valid as soon as any byte is non-zero.
+
+        Modes:
+            full:      test every byte (vectorized over 64-bit words)
+            strided:   test one word every `stride` bytes
+            edges:     test only the first and last word of the block
+            none:      accept every block
+
+        All modes work on np.frombuffer views of the block, so nothing is
+        copied. Time spent in check() is accumulated in total_time."""
+
+        if mode not in VALIDITY_CHECKS:
+            raise ValueError('validity check must be one of %s.' % ", ".join(VALIDITY_CHECKS))
+        if stride < 8:
+            raise ValueError('stride must be at least 8 bytes.')
+        self.mode = mode
+        self.stride = int(stride)
+
+        self.calls = 0
+        self.invalid = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def check(self, block):
+        """Return True if block looks like valid ADC data."""
+        t0 = time.perf_counter()
+        valid = self._check(block)
+        self.last_time = time.perf_counter() - t0
+        self.total_time += self.last_time
+        self.calls += 1
+        if not valid:
+            self.invalid += 1
+        return valid
+
+    def stats(self):
+        return {'mode': self.mode,
+                'calls': self.calls,
+                'invalid': self.invalid,
+                'total_time': self.total_time,
+                'mean_time': self.mean_time}
+
+    def _check(self, block):
+        if self.mode == 'none':
+            return True
+        words = _words(block)
+        if words.size == 0:
+            return False
+        if self.mode == 'full':
+            return bool(words.any())
+        if self.mode == 'strided':
+            return bool(words[::max(1, self.stride // words.itemsize)].any())
+        return bool(words[0] or words[-1])
+
+
+def _words(block):
+    # View the block as 64-bit words when its length allows, bytes otherwise
+    n = len(block) if not isinstance(block, memoryview) else block.nbytes
+    dtype = np.uint64 if n % 8 == 0 else np.uint8
+    return np.frombuffer(block, dtype=dtype)